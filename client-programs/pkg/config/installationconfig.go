@@ -261,6 +261,31 @@ type LookupServiceConfig struct {
 	IngressPrefix string `yaml:"ingressPrefix,omitempty"`
 }
 
+type SessionManagerProvisioningConfig struct {
+	Concurrency int `yaml:"concurrency,omitempty"`
+}
+
+type SessionManagerKubernetesConfig struct {
+	Concurrency int `yaml:"concurrency,omitempty"`
+}
+
+type SessionManagerSSHKeysConfig struct {
+	Type     string `yaml:"type,omitempty"`
+	PoolSize *int   `yaml:"poolSize,omitempty"`
+}
+
+type SessionManagerRegistryCredentialsConfig struct {
+	BcryptRounds int  `yaml:"bcryptRounds,omitempty"`
+	PoolSize     *int `yaml:"poolSize,omitempty"`
+}
+
+type SessionManagerConfig struct {
+	Provisioning        SessionManagerProvisioningConfig        `yaml:"provisioning,omitempty"`
+	Kubernetes          SessionManagerKubernetesConfig          `yaml:"kubernetes,omitempty"`
+	SSHKeys             SessionManagerSSHKeysConfig             `yaml:"sshKeys,omitempty"`
+	RegistryCredentials SessionManagerRegistryCredentialsConfig `yaml:"registryCredentials,omitempty"`
+}
+
 type ClusterEssentialsConfig struct {
 	ClusterInfrastructure ClusterInfrastructureConfig `yaml:"clusterInfrastructure,omitempty"`
 	ClusterPackages       ClusterPackagesConfig       `yaml:"clusterPackages,omitempty"`
@@ -285,6 +310,7 @@ type TrainingPlatformConfig struct {
 	WebsiteStyling    WebsiteStylingConfig    `yaml:"websiteStyling,omitempty"`
 	ImagePuller       ImagePullerConfig       `yaml:"imagePuller,omitempty"`
 	LookupService     LookupServiceConfig     `yaml:"lookupService,omitempty"`
+	SessionManager    SessionManagerConfig    `yaml:"sessionManager,omitempty"`
 }
 
 type InstallationConfig struct {
@@ -310,6 +336,7 @@ type InstallationConfig struct {
 	WebsiteStyling        WebsiteStylingConfig        `yaml:"websiteStyling,omitempty"`
 	ImagePuller           ImagePullerConfig           `yaml:"imagePuller,omitempty"`
 	LookupService         LookupServiceConfig         `yaml:"lookupService,omitempty"`
+	SessionManager        SessionManagerConfig        `yaml:"sessionManager,omitempty"`
 }
 
 type EducatesDomainStruct struct {
@@ -0,0 +1,423 @@
+"""Load test of the lookup service REST API against a synthetic fleet of
+clusters, training portals, workshop environments and workshop sessions.
+
+The fleet is loaded into the cluster database by passing synthetic events
+through the same event processing code used for events from remote clusters.
+The training portals are stood in for by a local HTTP server implementing the
+OAuth token endpoint and the endpoints for requesting and terminating workshop
+sessions. Requests are then made against the application created for the
+aiohttp server, with throughput and latency percentiles reported for each
+scenario.
+
+Run from the lookup-service directory using:
+
+    python -m benchmarks.loadtest --clusters 5 --portals 4 --environments 10
+
+Use --help to see all options.
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from service.caches.clients import ClientConfig
+from service.caches.clusters import ClusterConfig
+from service.caches.databases import client_database, cluster_database, tenant_database
+from service.caches.tenants import TenantConfig
+from service.handlers.clusters import ClusterEventProcessor
+from service.main import create_aiohttp_app
+from service.service import ServiceState
+
+
+class StubPortals:
+    """Local HTTP server standing in for the training portals. All portals are
+    served by the one server, with the name of the portal as a path prefix."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.counter = itertools.count(1)
+        self.calls = {"token": 0, "request": 0, "terminate": 0}
+
+        app = web.Application()
+
+        app.router.add_post("/{portal}/oauth2/token/", self.token)
+        app.router.add_get(
+            "/{portal}/workshops/environment/{environment}/request/", self.request
+        )
+        app.router.add_get(
+            "/{portal}/workshops/session/{session}/terminate/", self.terminate
+        )
+
+        self.server = TestServer(app)
+
+    def url(self, portal: str) -> str:
+        """Return the URL for the portal."""
+
+        return str(self.server.make_url(f"/{portal}"))
+
+    async def token(self, _request: web.Request) -> web.Response:
+        """Return an access token."""
+
+        self.calls["token"] += 1
+
+        return web.json_response(
+            {
+                "access_token": f"token-{next(self.counter)}",
+                "token_type": "Bearer",
+                "expires_in": 36000,
+            }
+        )
+
+    async def request(self, request: web.Request) -> web.Response:
+        """Allocate a workshop session after the configured delay."""
+
+        self.calls["request"] += 1
+
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        environment = request.match_info["environment"]
+        session = f"{environment}-x{next(self.counter)}"
+
+        return web.json_response(
+            {
+                "name": session,
+                "url": f"/workshops/session/{session}/activate/",
+            }
+        )
+
+    async def terminate(self, _request: web.Request) -> web.Response:
+        """Terminate a workshop session."""
+
+        self.calls["terminate"] += 1
+
+        return web.json_response({})
+
+
+def portal_event(name: str, url: str) -> Dict[str, Any]:
+    """Return an event for a training portal."""
+
+    return {
+        "type": None,
+        "object": {
+            "metadata": {"name": name, "uid": f"{name}-uid", "generation": 1},
+            "spec": {"portal": {"labels": [], "sessions": {"maximum": 0}}},
+            "status": {
+                "educates": {
+                    "url": url,
+                    "phase": "Running",
+                    "clients": {"robot": {"id": "robot", "secret": "secret"}},
+                    "credentials": {
+                        "robot": {"username": "robot", "password": "password"}
+                    },
+                }
+            },
+        },
+    }
+
+
+def environment_event(
+    portal: str, name: str, workshop: str, capacity: int
+) -> Dict[str, Any]:
+    """Return an event for a workshop environment."""
+
+    return {
+        "type": None,
+        "object": {
+            "metadata": {
+                "name": name,
+                "uid": f"{name}-uid",
+                "labels": {
+                    "training.educates.dev/portal.name": portal,
+                    "training.educates.dev/portal.uid": f"{portal}-uid",
+                },
+            },
+            "spec": {"workshop": {"name": workshop}},
+            "status": {
+                "educates": {
+                    "phase": "Running",
+                    "capacity": capacity,
+                    "reserved": 0,
+                    "workshop": {
+                        "generation": 1,
+                        "spec": {
+                            "title": f"Workshop {workshop}",
+                            "description": f"Description of workshop {workshop}.",
+                            "labels": [],
+                        },
+                    },
+                }
+            },
+        },
+    }
+
+
+def session_event(
+    portal: str, environment: str, name: str, workshop: str, user: str
+) -> Dict[str, Any]:
+    """Return an event for a workshop session, allocated if there is a user."""
+
+    return {
+        "type": None,
+        "object": {
+            "metadata": {
+                "name": name,
+                "generation": 1,
+                "labels": {
+                    "training.educates.dev/portal.name": portal,
+                    "training.educates.dev/portal.uid": f"{portal}-uid",
+                    "training.educates.dev/environment.name": environment,
+                    "training.educates.dev/environment.uid": f"{environment}-uid",
+                },
+            },
+            "spec": {"workshop": {"name": workshop}},
+            "status": {
+                "educates": {
+                    "phase": "Allocated" if user else "Available",
+                    "user": user,
+                }
+            },
+        },
+    }
+
+
+async def populate_fleet(
+    service_state: ServiceState, stub_portals: StubPortals, args: argparse.Namespace
+) -> None:
+    """Populate the cluster database with the synthetic fleet."""
+
+    users = itertools.count()
+
+    capacity = args.sessions + args.requests
+
+    for c in range(args.clusters):
+        cluster_config = ClusterConfig(
+            name=f"cluster-{c}", uid=f"cluster-{c}-uid", labels=[], kubeconfig={}
+        )
+
+        service_state.cluster_database.add_cluster(cluster_config)
+
+        event_processor = ClusterEventProcessor(cluster_config, service_state)
+
+        for p in range(args.portals):
+            portal = f"portal-{c}-{p}"
+
+            await event_processor.trainingportals_event(
+                portal_event(portal, stub_portals.url(portal))
+            )
+
+            for e in range(args.environments):
+                environment = f"{portal}-w{e}"
+                workshop = f"workshop-{e % args.workshops}"
+
+                await event_processor.workshopenvironments_event(
+                    environment_event(portal, environment, workshop, capacity)
+                )
+
+                for s in range(args.sessions):
+                    user = f"user-{next(users)}" if s % 2 else ""
+
+                    await event_processor.workshopsessions_event(
+                        session_event(
+                            portal, environment, f"{environment}-s{s}", workshop, user
+                        )
+                    )
+
+        event_processor.publish_snapshot()
+
+
+async def measure(
+    name: str,
+    count: int,
+    concurrency: int,
+    request: Callable[[int], Awaitable[int]],
+) -> None:
+    """Make the requests with the given concurrency and report throughput and
+    latency percentiles."""
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    latencies: List[float] = []
+    failures = 0
+
+    async def timed(index: int) -> None:
+        nonlocal failures
+
+        async with semaphore:
+            start_time = time.perf_counter()
+
+            status = await request(index)
+
+            latencies.append(time.perf_counter() - start_time)
+
+            if status >= 400:
+                failures += 1
+
+    start_time = time.perf_counter()
+
+    await asyncio.gather(*(timed(index) for index in range(count)))
+
+    elapsed = time.perf_counter() - start_time
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+
+    print(
+        f"{name:<40} {count / elapsed:>9.1f} req/s"
+        f"  p50 {percentiles[49] * 1000:>8.2f} ms"
+        f"  p99 {percentiles[98] * 1000:>8.2f} ms"
+        f"  failures {failures}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Run the load test."""
+
+    # The module level databases are used as these are what tenants consult
+    # when determining which portals they have access to.
+
+    service_state = ServiceState(
+        client_database=client_database,
+        tenant_database=tenant_database,
+        cluster_database=cluster_database,
+    )
+
+    stub_portals = StubPortals(args.portal_delay / 1000.0)
+
+    await stub_portals.server.start_server()
+
+    service_state.client_database.update_client(
+        ClientConfig(
+            name="loadtest",
+            uid="loadtest-uid",
+            issue=1,
+            password="password",
+            user="",
+            tenants=["*"],
+            roles=["admin", "tenant"],
+        )
+    )
+
+    service_state.tenant_database.update_tenant(
+        TenantConfig(name="loadtest", clusters={}, portals={})
+    )
+
+    start_time = time.perf_counter()
+
+    await populate_fleet(service_state, stub_portals, args)
+
+    environments = args.clusters * args.portals * args.environments
+
+    print(
+        f"Populated {args.clusters} clusters, {args.clusters * args.portals} portals,"
+        f" {environments} environments and {environments * args.sessions} sessions"
+        f" in {time.perf_counter() - start_time:.2f} s."
+    )
+
+    client = TestClient(TestServer(create_aiohttp_app(service_state)))
+
+    await client.start_server()
+
+    try:
+        response = await client.post(
+            "/login", json={"username": "loadtest", "password": "password"}
+        )
+
+        token = (await response.json())["access_token"]
+
+        headers = {"Authorization": f"Bearer {token}"}
+
+        async def get(url: str) -> int:
+            async with client.get(url, headers=headers) as response:
+                await response.read()
+                return response.status
+
+        # Workshop environments are only created for as many workshops as
+        # there are workshop environments per portal, so requests are only
+        # made for those workshops.
+
+        workshops = min(args.workshops, args.environments)
+
+        async def allocate(index: int) -> int:
+            async with client.post(
+                "/api/v1/workshops",
+                headers=headers,
+                json={
+                    "tenantName": "loadtest",
+                    "workshopName": f"workshop-{index % workshops}",
+                    "clientUserId": f"loadtest-{index}",
+                },
+            ) as response:
+                await response.read()
+                return response.status
+
+        cluster = "cluster-0"
+        portal = "portal-0-0"
+
+        scenarios = [
+            (
+                "GET /api/v1/workshops",
+                lambda _: get("/api/v1/workshops?tenant=loadtest"),
+            ),
+            ("POST /api/v1/workshops", allocate),
+            ("GET /api/v1/clusters", lambda _: get("/api/v1/clusters")),
+            ("GET /api/v1/portals", lambda _: get("/api/v1/portals")),
+            (
+                "GET /api/v1/tenants/{tenant}/portals",
+                lambda _: get("/api/v1/tenants/loadtest/portals"),
+            ),
+            (
+                "GET .../portals/{portal}/environments",
+                lambda _: get(
+                    f"/api/v1/clusters/{cluster}/portals/{portal}/environments"
+                ),
+            ),
+        ]
+
+        for name, request in scenarios:
+            if args.scenario and not any(item in name for item in args.scenario):
+                continue
+
+            await measure(name, args.requests, args.concurrency, request)
+
+    finally:
+        await client.close()
+        await stub_portals.server.close()
+
+    print(f"Portal calls: {stub_portals.calls}")
+
+
+def main() -> None:
+    """Parse the command line arguments and run the load test."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--portals", type=int, default=4, help="per cluster")
+    parser.add_argument("--environments", type=int, default=10, help="per portal")
+    parser.add_argument("--sessions", type=int, default=10, help="per environment")
+    parser.add_argument("--workshops", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument(
+        "--portal-delay", type=float, default=0.0, help="milliseconds per request"
+    )
+    parser.add_argument(
+        "--scenario", action="append", help="only run scenarios matching this text"
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""Benchmark of the memory used to hold the state of workshop environments and
+workshop sessions of a synthetic fleet of clusters.
+
+Events are decoded from JSON before being passed to the event processor, as
+when received from the Kubernetes API server, so that strings repeated across
+resources are separate objects unless deduplicated when cached. The memory
+allocated while processing the events for workshop environments and workshop
+sessions is traced, and reported as bytes per workshop environment and bytes
+per workshop session.
+
+This is measured both for the records as they were originally, being plain
+dataclasses holding attributes in an instance __dict__ with strings not
+interned, and for the slotted records with interned strings now used.
+
+Run from the lookup-service directory using:
+
+    python -m benchmarks.memory --clusters 2 --portals 5 --environments 20
+"""
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import tracemalloc
+from typing import Any, Dict, Iterator, Tuple
+
+import service.caches.environments
+import service.caches.portals
+import service.caches.sessions
+import service.handlers.clusters
+from service.caches.clusters import ClusterConfig
+from service.caches.databases import ClientDatabase, ClusterDatabase, TenantDatabase
+from service.handlers.clusters import ClusterEventProcessor
+from service.service import ServiceState
+
+from .loadtest import environment_event, portal_event, session_event
+
+
+def decoded(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of the event as would be decoded from the JSON of a
+    watch stream."""
+
+    return json.loads(json.dumps(event))
+
+
+def unslotted(cls: type) -> type:
+    """Return a copy of a slotted dataclass which holds attributes in an
+    instance __dict__ instead, as the records originally did."""
+
+    excluded = set(cls.__slots__) | {"__slots__", "__weakref__"}
+
+    namespace = {key: value for key, value in vars(cls).items() if key not in excluded}
+
+    return type(cls.__name__, cls.__bases__, namespace)
+
+
+@contextlib.contextmanager
+def original_records() -> Iterator[None]:
+    """Create records for training portals, workshop environments and workshop
+    sessions as they originally were, without slots and without interning any
+    strings, while the context is active."""
+
+    modules = [
+        service.caches.environments,
+        service.caches.portals,
+        service.caches.sessions,
+        service.handlers.clusters,
+    ]
+
+    replacements = {
+        "intern_string": lambda value: value,
+        "intern_labels": lambda labels: labels,
+    }
+
+    for name in ("TrainingPortal", "WorkshopEnvironment", "WorkshopSession"):
+        replacements[name] = unslotted(getattr(service.handlers.clusters, name))
+
+    with contextlib.ExitStack() as stack:
+        for module in modules:
+            for name, value in replacements.items():
+                if hasattr(module, name):
+                    stack.enter_context(_replaced(module, name, value))
+
+        yield
+
+
+@contextlib.contextmanager
+def _replaced(obj: Any, name: str, value: Any) -> Iterator[None]:
+    """Replace the attribute of the object while the context is active."""
+
+    original = getattr(obj, name)
+
+    setattr(obj, name, value)
+
+    try:
+        yield
+
+    finally:
+        setattr(obj, name, original)
+
+
+def traced_allocations() -> int:
+    """Return the size of memory currently allocated and traced."""
+
+    gc.collect()
+
+    return tracemalloc.get_traced_memory()[0]
+
+
+async def measure(args: argparse.Namespace) -> Tuple[int, float, int, float]:
+    """Build the fleet, returning the number of workshop environments and the
+    bytes used by each, and the number of workshop sessions and the bytes used
+    by each."""
+
+    service_state = ServiceState(
+        client_database=ClientDatabase(),
+        tenant_database=TenantDatabase(),
+        cluster_database=ClusterDatabase(),
+    )
+
+    processors = []
+
+    for c in range(args.clusters):
+        cluster_config = ClusterConfig(
+            name=f"cluster-{c}", uid=f"cluster-{c}-uid", labels=[], kubeconfig={}
+        )
+
+        service_state.cluster_database.add_cluster(cluster_config)
+
+        event_processor = ClusterEventProcessor(cluster_config, service_state)
+
+        for p in range(args.portals):
+            portal = f"portal-{c}-{p}"
+
+            await event_processor.trainingportals_event(
+                decoded(portal_event(portal, f"https://{portal}.example.com"))
+            )
+
+        processors.append((c, event_processor))
+
+    tracemalloc.start()
+
+    baseline = traced_allocations()
+
+    environments = 0
+
+    for c, event_processor in processors:
+        for p in range(args.portals):
+            portal = f"portal-{c}-{p}"
+
+            for e in range(args.environments):
+                event = environment_event(
+                    portal, f"{portal}-w{e}", f"workshop-{e % args.workshops}", 10
+                )
+
+                event["object"]["status"]["educates"]["workshop"]["spec"]["labels"] = [
+                    {"name": "track", "value": f"track-{e % 3}"},
+                    {"name": "level", "value": "beginner"},
+                ]
+
+                await event_processor.workshopenvironments_event(decoded(event))
+
+                environments += 1
+
+    after_environments = traced_allocations()
+
+    sessions = 0
+
+    for c, event_processor in processors:
+        for p in range(args.portals):
+            portal = f"portal-{c}-{p}"
+
+            for e in range(args.environments):
+                environment = f"{portal}-w{e}"
+                workshop = f"workshop-{e % args.workshops}"
+
+                for s in range(args.sessions):
+                    user = f"user-{sessions}" if s % 2 else ""
+
+                    await event_processor.workshopsessions_event(
+                        decoded(
+                            session_event(
+                                portal,
+                                environment,
+                                f"{environment}-s{s}",
+                                workshop,
+                                user,
+                            )
+                        )
+                    )
+
+                    sessions += 1
+
+    after_sessions = traced_allocations()
+
+    tracemalloc.stop()
+
+    return (
+        environments,
+        (after_environments - baseline) / environments,
+        sessions,
+        (after_sessions - after_environments) / sessions,
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Run the benchmark."""
+
+    # The original records are measured first, as strings interned when
+    # measuring the slotted records could otherwise be shared with them.
+
+    with original_records():
+        before = await measure(args)
+
+    gc.collect()
+
+    after = await measure(args)
+
+    print(f"{'before':>42}{'after':>12}  (bytes each)")
+    print(
+        f"Workshop environments: {before[0]:>7}"
+        f"  {before[1]:>10.1f}  {after[1]:>10.1f}"
+    )
+    print(
+        f"Workshop sessions:     {before[2]:>7}"
+        f"  {before[3]:>10.1f}  {after[3]:>10.1f}"
+    )
+
+
+def main() -> None:
+    """Parse the command line arguments and run the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument("--clusters", type=int, default=2)
+    parser.add_argument("--portals", type=int, default=5, help="per cluster")
+    parser.add_argument("--environments", type=int, default=20, help="per portal")
+    parser.add_argument("--sessions", type=int, default=50, help="per environment")
+    parser.add_argument("--workshops", type=int, default=10)
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Micro-benchmark comparing matching of resource selectors and client tenant
+patterns using the compiled selectors, against the original approach of
+calling fnmatch for each pattern and using dotted path lookups on a resource
+object constructed for each match.
+
+Run from the lookup-service directory using:
+
+    python -m benchmarks.selectors
+"""
+
+import argparse
+import fnmatch
+import timeit
+
+from service.caches.clients import ClientConfig
+from service.helpers.objects import xgetattr
+from service.helpers.selectors import ResourceSelector
+
+SELECTOR = {
+    "nameSelector": {
+        "matchNames": ["portal-a-*", "portal-b-*", "portal-c-*", "portal-d-*"],
+    },
+    "labelSelector": {
+        "matchLabels": {"region": "us-east", "tier": "gold"},
+        "matchExpressions": [
+            {"key": "environment", "operator": "In", "values": ["prod", "staging"]},
+            {"key": "deprecated", "operator": "DoesNotExist"},
+        ],
+    },
+}
+
+TENANTS = ["tenant-a-*", "tenant-b-*", "tenant-c-*", "tenant-d-*"]
+
+NAME = "portal-d-0042"
+
+LABELS = [
+    {"name": "region", "value": "us-east"},
+    {"name": "tier", "value": "gold"},
+    {"name": "environment", "value": "prod"},
+]
+
+
+def fnmatch_match_resource(selector, resource):
+    """Match a resource the way the selectors did before being compiled."""
+
+    name = xgetattr(resource, "metadata.name")
+
+    if selector["nameSelector"]["matchNames"]:
+        for pattern in selector["nameSelector"]["matchNames"]:
+            if fnmatch.fnmatch(name, pattern):
+                break
+        else:
+            return False
+
+    labels = xgetattr(resource, "metadata.labels", {})
+
+    match_labels = xgetattr(selector, "labelSelector.matchLabels", {})
+
+    if not all(labels.get(key) == value for key, value in match_labels.items()):
+        return False
+
+    for expr in xgetattr(selector, "labelSelector.matchExpressions", []):
+        value = labels.get(expr["key"])
+
+        if expr["operator"] == "In" and value not in expr["values"]:
+            return False
+        if expr["operator"] == "NotIn" and value in expr["values"]:
+            return False
+        if expr["operator"] == "Exists" and value is None:
+            return False
+        if expr["operator"] == "DoesNotExist" and value is not None:
+            return False
+
+    return True
+
+
+def fnmatch_allowed_access_to_tenant(tenants, tenant):
+    """Match a tenant the way the client configuration did before."""
+
+    for pattern in tenants:
+        if fnmatch.fnmatch(tenant, pattern):
+            return True
+
+    return False
+
+
+def main() -> None:
+    """Run the benchmark and report the time per match."""
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    selector = ResourceSelector(SELECTOR)
+
+    client = ClientConfig(
+        name="client",
+        uid="uid",
+        issue=1,
+        password="password",
+        user="",
+        tenants=TENANTS,
+        roles=["tenant"],
+    )
+
+    def original_selector():
+        resource = {
+            "metadata": {
+                "name": NAME,
+                "labels": {item["name"]: item["value"] for item in LABELS},
+            }
+        }
+        return fnmatch_match_resource(SELECTOR, resource)
+
+    def compiled_selector():
+        labels = {item["name"]: item["value"] for item in LABELS}
+        return selector.match(NAME, labels)
+
+    assert original_selector() == compiled_selector()
+
+    def original_tenant():
+        return fnmatch_allowed_access_to_tenant(TENANTS, "tenant-d-0042")
+
+    def compiled_tenant():
+        return client.allowed_access_to_tenant("tenant-d-0042")
+
+    assert original_tenant() == compiled_tenant()
+
+    for label, original, compiled in (
+        ("ResourceSelector", original_selector, compiled_selector),
+        ("ClientConfig tenants", original_tenant, compiled_tenant),
+    ):
+        original_time = timeit.timeit(original, number=args.iterations)
+        compiled_time = timeit.timeit(compiled, number=args.iterations)
+
+        print(
+            f"{label}: original {original_time / args.iterations * 1e6:.2f}us, "
+            f"compiled {compiled_time / args.iterations * 1e6:.2f}us, "
+            f"speedup {original_time / compiled_time:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
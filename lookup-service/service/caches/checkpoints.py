@@ -0,0 +1,207 @@
+"""Checkpoints of the state of clusters, saved to local disk so that after a
+restart the service can use the restored state as provisional state, until
+the live state of each cluster has been received again."""
+
+import gzip
+import json
+import logging
+import os
+from dataclasses import replace
+from typing import Any, Dict, List
+
+from .clusters import ClusterConfig
+from .databases import ClusterDatabase
+from .environments import WorkshopEnvironment
+from .portals import PortalCredentials, TrainingPortal
+from .sessions import WorkshopSession
+from .snapshots import ClusterSnapshot
+
+logger = logging.getLogger("educates")
+
+
+# Version of the format of checkpoints. Checkpoints saved with a different
+# version are ignored.
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_cluster(snapshot: ClusterSnapshot) -> Dict[str, Any]:
+    """Return the state of a cluster to be saved in a checkpoint. Credentials
+    for accessing the cluster and portals are not saved. Workshop sessions are
+    saved as lists of values rather than dictionaries as there can be many of
+    them."""
+
+    cluster = snapshot.cluster
+
+    return {
+        "name": cluster.name,
+        "uid": cluster.uid,
+        "labels": cluster.labels,
+        "portals": [
+            {
+                "name": portal.name,
+                "uid": portal.uid,
+                "generation": portal.generation,
+                "labels": portal.labels,
+                "url": portal.url,
+                "phase": portal.phase,
+                "capacity": portal.capacity,
+                "environments": [
+                    {
+                        "name": environment.name,
+                        "uid": environment.uid,
+                        "generation": environment.generation,
+                        "workshop": environment.workshop,
+                        "title": environment.title,
+                        "description": environment.description,
+                        "labels": environment.labels,
+                        "capacity": environment.capacity,
+                        "reserved": environment.reserved,
+                        "phase": environment.phase,
+                        "sessions": [
+                            [
+                                session.name,
+                                session.generation,
+                                session.phase,
+                                session.user,
+                            ]
+                            for session in snapshot.sessions.get(
+                                (portal.name, environment.name), ()
+                            )
+                        ],
+                    }
+                    for environment in snapshot.environments.get(portal.name, ())
+                ],
+            }
+            for portal in snapshot.portals
+        ],
+    }
+
+
+def restore_cluster(data: Dict[str, Any]) -> ClusterSnapshot:
+    """Restore the state of a cluster saved in a checkpoint, returning a stale
+    snapshot of the cluster. The objects for the cluster are not added to the
+    cluster database or indexed, so won't be used for allocating workshop
+    sessions."""
+
+    cluster = ClusterConfig(
+        name=data["name"], uid=data["uid"], labels=data["labels"], kubeconfig={}
+    )
+
+    for portal_data in data["portals"]:
+        portal = TrainingPortal(
+            cluster=cluster,
+            name=portal_data["name"],
+            uid=portal_data["uid"],
+            generation=portal_data["generation"],
+            labels=portal_data["labels"],
+            url=portal_data["url"],
+            credentials=PortalCredentials(
+                client_id="", client_secret="", username="", password=""
+            ),
+            phase=portal_data["phase"],
+            capacity=portal_data["capacity"],
+            allocated=0,
+        )
+
+        for environment_data in portal_data["environments"]:
+            environment = WorkshopEnvironment(
+                portal=portal,
+                name=environment_data["name"],
+                uid=environment_data["uid"],
+                generation=environment_data["generation"],
+                workshop=environment_data["workshop"],
+                title=environment_data["title"],
+                description=environment_data["description"],
+                labels=environment_data["labels"],
+                capacity=environment_data["capacity"],
+                reserved=environment_data["reserved"],
+                allocated=0,
+                available=0,
+                phase=environment_data["phase"],
+            )
+
+            portal.add_environment(environment)
+
+            for name, generation, phase, user in environment_data["sessions"]:
+                environment.add_session(
+                    WorkshopSession(
+                        environment=environment,
+                        name=name,
+                        generation=generation,
+                        phase=phase,
+                        user=user,
+                    )
+                )
+
+        cluster.add_portal(portal)
+
+    return replace(ClusterSnapshot.capture(cluster), stale=True)
+
+
+def save_checkpoint(cluster_database: ClusterDatabase, path: str) -> None:
+    """Save a checkpoint of the state of all clusters as compressed JSON. The
+    checkpoint is written to a temporary file which then replaces any prior
+    checkpoint, so a partially written checkpoint is never left in place."""
+
+    snapshot = cluster_database.snapshot
+
+    clusters: List[Dict[str, Any]] = [
+        checkpoint_cluster(cluster_snapshot)
+        for cluster_snapshot in snapshot.clusters.values()
+    ]
+
+    data = json.dumps(
+        {"version": CHECKPOINT_VERSION, "clusters": clusters}, separators=(",", ":")
+    )
+
+    temporary_path = f"{path}.tmp"
+
+    with gzip.open(temporary_path, "wb") as f:
+        f.write(data.encode("utf-8"))
+
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(cluster_database: ClusterDatabase, path: str) -> int:
+    """Load a checkpoint of the state of all clusters, publishing the state of
+    each cluster as provisional state. Returns the number of clusters restored.
+    A checkpoint which is missing, unreadable or of a different version is
+    ignored."""
+
+    try:
+        with gzip.open(path, "rb") as f:
+            data = json.loads(f.read())
+
+    except FileNotFoundError:
+        return 0
+
+    except (OSError, ValueError):
+        logger.exception("Unable to read checkpoint %s, ignoring it.", path)
+
+        return 0
+
+    if data.get("version") != CHECKPOINT_VERSION:
+        logger.warning("Ignoring checkpoint %s with different version.", path)
+
+        return 0
+
+    count = 0
+
+    for cluster_data in data.get("clusters", []):
+        try:
+            snapshot = restore_cluster(cluster_data)
+
+        except (KeyError, TypeError, ValueError):
+            logger.exception(
+                "Unable to restore cluster %s from checkpoint.",
+                cluster_data.get("name"),
+            )
+
+            continue
+
+        cluster_database.publish_provisional_snapshot(snapshot)
+
+        count += 1
+
+    return count
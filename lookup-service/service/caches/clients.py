@@ -1,8 +1,10 @@
 """Configuration for clients of the service."""
 
-import fnmatch
-from dataclasses import dataclass
-from typing import List, Set
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Pattern, Set, Union
+
+from ..helpers.selectors import compile_glob_patterns
 
 
 @dataclass
@@ -16,6 +18,10 @@ class ClientConfig:
     user: str
     tenants: List[str]
     roles: List[str]
+    tenants_pattern: Union[Pattern, None] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.tenants_pattern = compile_glob_patterns(self.tenants)
 
     @property
     def identity(self) -> str:
@@ -51,10 +57,31 @@ class ClientConfig:
         return matched_roles
 
     def allowed_access_to_tenant(self, tenant: str) -> bool:
-        """Check if the client has access to the tenant."""
+        """Check if the client has access to the tenant. The glob patterns for
+        tenants are compiled into a single regular expression when the client
+        configuration is loaded."""
+
+        if self.tenants_pattern is None:
+            return False
+
+        return self.tenants_pattern.match(tenant) is not None
+
+
+@dataclass
+class VerifiedToken:
+    """Decoded claims of a JWT token presented by a client which have been
+    verified, along with the client the token was issued to and the issue of
+    the client's tokens it belonged to."""
+
+    claims: Dict[str, Any]
+    client: ClientConfig
+    issue: int
+
+    def is_valid(self) -> bool:
+        """Check the token has not expired and tokens issued to the client have
+        not since been revoked."""
 
-        for pattern in self.tenants:
-            if fnmatch.fnmatch(tenant, pattern):
-                return True
+        if self.client.issue != self.issue:
+            return False
 
-        return False
+        return time.time() < self.claims.get("exp", 0)
@@ -1,11 +1,24 @@
 """Database classes for storing state of everything."""
 
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Tuple
+
+from wrapt import synchronized
+
+from ..config import JWT_TOKEN_CACHE_SIZE
+from .clients import VerifiedToken
+from .snapshots import ClusterSnapshot, FleetSnapshot
 
 if TYPE_CHECKING:
     from .clients import ClientConfig
     from .clusters import ClusterConfig
+    from .environments import WorkshopEnvironment
+    from .portals import TrainingPortal
+    from .sessions import WorkshopSession
     from .tenants import TenantConfig
 
 
@@ -13,24 +26,35 @@ if TYPE_CHECKING:
 class ClientDatabase:
     """Database for storing client configurations. Clients are stored in a
     dictionary with the client's name as the key and the client configuration
-    object as the value."""
+    object as the value. A bounded cache of verified JWT tokens presented by
+    clients is also kept, keyed by a digest of the token, so tokens which are
+    presented repeatedly don't need to be decoded and verified each time."""
 
     clients: Dict[str, "ClientConfig"]
+    verified_tokens: "OrderedDict[bytes, VerifiedToken]"
 
     def __init__(self) -> None:
         self.clients = {}
+        self.verified_tokens = OrderedDict()
+        self._tokens_lock = threading.Lock()
 
     def update_client(self, client: "ClientConfig") -> None:
         """Update the client in the database. If the client does not exist in
-        the database, it will be added."""
+        the database, it will be added. Any cached tokens for a prior instance
+        of the client are discarded."""
 
         self.clients[client.name] = client
 
+        self.discard_verified_tokens(client.name)
+
     def remove_client(self, name: str) -> None:
-        """Remove a client from the database."""
+        """Remove a client from the database, discarding any cached tokens for
+        the client."""
 
         self.clients.pop(name, None)
 
+        self.discard_verified_tokens(name)
+
     def get_clients(self) -> List["ClientConfig"]:
         """Retrieve a list of clients from the database."""
 
@@ -53,6 +77,56 @@ class ClientDatabase:
         if client.check_password(password):
             return client
 
+    def get_verified_token(self, token: str) -> VerifiedToken | None:
+        """Retrieve the cached verified token. The cached token is discarded
+        if it has expired, tokens issued to the client have since been revoked,
+        or the client has since been removed or replaced."""
+
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+
+        with self._tokens_lock:
+            verified_token = self.verified_tokens.get(key)
+
+            if verified_token is None:
+                return None
+
+            client = verified_token.client
+
+            if self.clients.get(client.name) is client and verified_token.is_valid():
+                self.verified_tokens.move_to_end(key)
+
+                return verified_token
+
+            del self.verified_tokens[key]
+
+        return None
+
+    def add_verified_token(
+        self, token: str, claims: Dict[str, Any], client: "ClientConfig"
+    ) -> None:
+        """Cache the claims of a token which has been verified as having been
+        issued to the client, discarding the least recently used tokens if the
+        cache is full."""
+
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+
+        verified_token = VerifiedToken(claims=claims, client=client, issue=client.issue)
+
+        with self._tokens_lock:
+            self.verified_tokens[key] = verified_token
+            self.verified_tokens.move_to_end(key)
+
+            while len(self.verified_tokens) > JWT_TOKEN_CACHE_SIZE:
+                self.verified_tokens.popitem(last=False)
+
+    def discard_verified_tokens(self, name: str) -> None:
+        """Discard any cached tokens for the named client."""
+
+        with self._tokens_lock:
+            for key, verified_token in list(self.verified_tokens.items()):
+                if verified_token.client.name == name:
+                    del self.verified_tokens[key]
+
 
 @dataclass
 class TenantDatabase:
@@ -91,22 +165,186 @@ class TenantDatabase:
 class ClusterDatabase:
     """Database for storing cluster configurations. Clusters are stored in a
     dictionary with the cluster's name as the key and the cluster configuration
-    object as the value."""
+    object as the value. An index is also kept of workshop environments across
+    all clusters, keyed by the name of the workshop, so that candidate workshop
+    environments for a workshop can be found without visiting every portal.
+    Similarly, an index is kept of workshop sessions allocated to users, keyed
+    by the user and the name of the workshop, so that an existing workshop
+    session for a user can be found without visiting every session.
+
+    The dictionaries of clusters, portals, workshop environments and workshop
+    sessions are updated in place by the operator threads. An immutable
+    snapshot of the state of all clusters is also published for use by the
+    HTTP API request handlers, with the snapshot for a cluster being replaced
+    after each batch of events for that cluster has been processed. Listeners
+    can be registered to be notified each time a new snapshot is published.
+
+    On startup, stale snapshots of clusters restored from a checkpoint can be
+    published as provisional state. The stale snapshot for a cluster is kept
+    in place of live state until the cluster is marked as synced, being when
+    the initial state of the cluster has been received, or the provisional
+    state has expired."""
 
     clusters: Dict[str, "ClusterConfig"]
+    workshop_environments: Dict[str, Dict[Tuple[str, str, str], "WorkshopEnvironment"]]
+    user_sessions: Dict[
+        Tuple[str, str], Dict[Tuple[str, str, str, str], "WorkshopSession"]
+    ]
+    snapshot: FleetSnapshot
 
     def __init__(self) -> None:
         self.clusters = {}
-
+        self.workshop_environments = {}
+        self.user_sessions = {}
+        self.snapshot = FleetSnapshot.empty()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_listeners = []
+        self._provisional_clusters = {}
+
+    @synchronized
     def add_cluster(self, cluster: "ClusterConfig") -> None:
         """Add the cluster to the database."""
 
         self.clusters[cluster.name] = cluster
 
+        # The cluster is not yet visible to the operator threads, so it is safe
+        # to capture the snapshot for it without locking it.
+
+        self.publish_cluster_snapshot(ClusterSnapshot.capture(cluster))
+
+    @synchronized
     def remove_cluster(self, name: str) -> None:
-        """Remove a cluster from the database."""
+        """Remove a cluster from the database. Any workshop environments of
+        portals hosted on the cluster are also removed from the index, and
+        the HTTP client sessions for accessing the portals closed."""
+
+        cluster = self.clusters.pop(name, None)
+
+        with self._snapshot_lock:
+            provisional = self._provisional_clusters.pop(name, None)
+
+            if cluster or provisional is not None:
+                self.snapshot = self.snapshot.without_cluster(name)
+
+        if cluster or provisional is not None:
+            self.notify_snapshot_listeners()
+
+        if cluster:
+            for portal in cluster.get_portals():
+                self.unindex_portal(portal)
+                portal.close_client_session()
+
+    def publish_cluster(self, cluster: "ClusterConfig") -> None:
+        """Capture and publish a snapshot of the current state of a cluster.
+        This must not be called with the cluster database locked."""
+
+        with synchronized(cluster):
+            snapshot = ClusterSnapshot.capture(cluster)
+
+        self.publish_cluster_snapshot(snapshot)
+
+    def publish_cluster_snapshot(self, snapshot: ClusterSnapshot) -> None:
+        """Publish a snapshot of a cluster, replacing any prior snapshot for
+        the cluster. The snapshot is discarded if the cluster has since been
+        removed, or a snapshot captured later has already been published. It
+        is also discarded if a stale snapshot for the cluster is still being
+        used as provisional state."""
+
+        with self._snapshot_lock:
+            if self.clusters.get(snapshot.cluster.name) is not snapshot.cluster:
+                return
+
+            if snapshot.cluster.name in self._provisional_clusters:
+                return
+
+            previous = self.snapshot.clusters.get(snapshot.cluster.name)
+
+            if previous and previous.cluster is snapshot.cluster:
+                if previous.sequence > snapshot.sequence:
+                    return
+
+            self.snapshot = self.snapshot.with_cluster(snapshot)
+
+        self.notify_snapshot_listeners()
+
+    def publish_provisional_snapshot(self, snapshot: ClusterSnapshot) -> None:
+        """Publish a stale snapshot of a cluster restored from a checkpoint, to
+        be used until the cluster is marked as synced. The snapshot is ignored
+        if live state for the cluster has already been published."""
+
+        with self._snapshot_lock:
+            if snapshot.cluster.name in self.snapshot.clusters:
+                return
+
+            self._provisional_clusters[snapshot.cluster.name] = time.monotonic()
+
+            self.snapshot = self.snapshot.with_cluster(snapshot)
+
+        self.notify_snapshot_listeners()
 
-        self.clusters.pop(name, None)
+    def mark_cluster_synced(self, name: str) -> None:
+        """Mark the cluster as having been synced, replacing any stale snapshot
+        of the cluster being used as provisional state with the live state.
+        This must not be called with the cluster database locked."""
+
+        with self._snapshot_lock:
+            if self._provisional_clusters.pop(name, None) is None:
+                return
+
+            cluster = self.clusters.get(name)
+
+            if not cluster:
+                self.snapshot = self.snapshot.without_cluster(name)
+
+        # The stale snapshot is replaced by a snapshot of the live state rather
+        # than being removed first, so the cluster doesn't briefly disappear.
+
+        if cluster:
+            self.publish_cluster(cluster)
+
+        else:
+            self.notify_snapshot_listeners()
+
+    def expire_provisional_clusters(self, timeout: float) -> None:
+        """Discard stale snapshots of clusters being used as provisional state
+        for longer than the timeout. This ensures that state restored for
+        clusters which have since been removed, or for which no events are
+        ever received as they have no resources, doesn't linger."""
+
+        now = time.monotonic()
+
+        with self._snapshot_lock:
+            expired = [
+                name
+                for name, published in self._provisional_clusters.items()
+                if now - published >= timeout
+            ]
+
+        for name in expired:
+            self.mark_cluster_synced(name)
+
+    def add_snapshot_listener(self, listener: Callable[[], None]) -> None:
+        """Register a listener to be called each time a new snapshot is
+        published. Listeners are called from whichever thread published the
+        snapshot, so must not block and must not acquire any locks held while
+        snapshots are published."""
+
+        with self._snapshot_lock:
+            self._snapshot_listeners = self._snapshot_listeners + [listener]
+
+    def remove_snapshot_listener(self, listener: Callable[[], None]) -> None:
+        """Unregister a listener previously registered for snapshots."""
+
+        with self._snapshot_lock:
+            self._snapshot_listeners = [
+                item for item in self._snapshot_listeners if item is not listener
+            ]
+
+    def notify_snapshot_listeners(self) -> None:
+        """Call each of the listeners registered for snapshots."""
+
+        for listener in self._snapshot_listeners:
+            listener()
 
     def get_clusters(self) -> List["ClusterConfig"]:
         """Retrieve a list of clusters from the database."""
@@ -118,6 +356,115 @@ class ClusterDatabase:
 
         return self.clusters.get(name)
 
+    @synchronized
+    def index_environment(self, environment: "WorkshopEnvironment") -> None:
+        """Add a workshop environment to the index of workshop environments
+        for the workshop it provides."""
+
+        key = (
+            environment.portal.cluster.name,
+            environment.portal.name,
+            environment.name,
+        )
+
+        environments = self.workshop_environments.setdefault(environment.workshop, {})
+
+        environments[key] = environment
+
+    @synchronized
+    def unindex_environment(self, environment: "WorkshopEnvironment") -> None:
+        """Remove a workshop environment from the index of workshop
+        environments for the workshop it provides. Any workshop sessions of
+        the workshop environment are also removed from the index."""
+
+        for session in environment.get_sessions():
+            self.unindex_session(session)
+
+        key = (
+            environment.portal.cluster.name,
+            environment.portal.name,
+            environment.name,
+        )
+
+        environments = self.workshop_environments.get(environment.workshop)
+
+        if environments is not None:
+            environments.pop(key, None)
+
+            if not environments:
+                self.workshop_environments.pop(environment.workshop, None)
+
+    @synchronized
+    def unindex_portal(self, portal: "TrainingPortal") -> None:
+        """Remove all workshop environments of a portal from the index."""
+
+        for environment in portal.get_environments():
+            self.unindex_environment(environment)
+
+    @synchronized
+    def get_environments_for_workshop(
+        self, workshop_name: str
+    ) -> List["WorkshopEnvironment"]:
+        """Retrieve a list of all workshop environments across all clusters
+        which provide the named workshop."""
+
+        return list(self.workshop_environments.get(workshop_name, {}).values())
+
+    @synchronized
+    def index_session(self, session: "WorkshopSession") -> None:
+        """Add a workshop session to the index of workshop sessions allocated
+        to users. Workshop sessions which are not yet allocated to a user are
+        not added to the index."""
+
+        if not session.user:
+            return
+
+        key = (
+            session.environment.portal.cluster.name,
+            session.environment.portal.name,
+            session.environment.name,
+            session.name,
+        )
+
+        user_key = (session.user, session.environment.workshop)
+
+        self.user_sessions.setdefault(user_key, {})[key] = session
+
+    @synchronized
+    def unindex_session(self, session: "WorkshopSession") -> None:
+        """Remove a workshop session from the index of workshop sessions
+        allocated to users. This must be called before the user recorded
+        against the workshop session is changed."""
+
+        if not session.user:
+            return
+
+        key = (
+            session.environment.portal.cluster.name,
+            session.environment.portal.name,
+            session.environment.name,
+            session.name,
+        )
+
+        user_key = (session.user, session.environment.workshop)
+
+        sessions = self.user_sessions.get(user_key)
+
+        if sessions is not None:
+            sessions.pop(key, None)
+
+            if not sessions:
+                self.user_sessions.pop(user_key, None)
+
+    @synchronized
+    def get_sessions_for_user(
+        self, user_id: str, workshop_name: str
+    ) -> List["WorkshopSession"]:
+        """Retrieve a list of workshop sessions across all clusters which are
+        allocated to the user for the named workshop."""
+
+        return list(self.user_sessions.get((user_id, workshop_name), {}).values())
+
 
 # Create the database instances.
 
@@ -1,11 +1,14 @@
 """Configuration for workshop environments."""
 
+import itertools
 import logging
+import threading
+import time
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Dict, List
 
-from aiohttp import ClientSession
-from wrapt import synchronized
+from ..config import ALLOCATION_RESERVATION_TIMEOUT
+from ..helpers.objects import intern_labels, intern_string
 
 if TYPE_CHECKING:
     from .portals import TrainingPortal
@@ -14,10 +17,22 @@ if TYPE_CHECKING:
 logger = logging.getLogger("educates")
 
 
-@dataclass
+# Lock guarding reservations of capacity in workshop environments. Reservations
+# are made from the HTTP server thread and settled from the operator threads. A
+# single lock is used, separate from the locks on cluster configurations, with
+# no other lock being acquired while it is held.
+
+_reservations_lock = threading.Lock()
+
+_reservation_ids = itertools.count(1)
+
+
+@dataclass(slots=True)
 class WorkshopEnvironment:
     """Snapshot of workshop environment state. This includes a database of
-    the workshop sessions created from the workshop environment."""
+    the workshop sessions created from the workshop environment. Strings which
+    are shared with other workshop environments for the same workshop, such
+    as the workshop name, title, description and labels, are interned."""
 
     portal: "TrainingPortal"
     name: str
@@ -33,6 +48,7 @@ class WorkshopEnvironment:
     available: int
     phase: str
     sessions: Dict[str, "WorkshopSession"]
+    reservations: Dict[str, float]
 
     def __init__(
         self,
@@ -54,16 +70,17 @@ class WorkshopEnvironment:
         self.name = name
         self.uid = uid
         self.generation = generation
-        self.workshop = workshop
-        self.title = title
-        self.description = description
-        self.labels = labels
+        self.workshop = intern_string(workshop)
+        self.title = intern_string(title)
+        self.description = intern_string(description)
+        self.labels = intern_labels(labels)
         self.capacity = capacity
         self.reserved = reserved
         self.allocated = allocated
         self.available = available
-        self.phase = phase
+        self.phase = intern_string(phase)
         self.sessions = {}
+        self.reservations = {}
 
     def get_sessions(self) -> Dict[str, "WorkshopSession"]:
         """Returns all workshop sessions."""
@@ -80,14 +97,114 @@ class WorkshopEnvironment:
 
         self.sessions[session.name] = session
 
+        self.adjust_capacity(session.phase, 1)
+
+        if session.phase == "Allocated":
+            self.settle_reservation(session.name)
+
     def remove_session(self, session_name: str) -> None:
         """Remove a session from the environment."""
 
-        self.sessions.pop(session_name, None)
+        session = self.sessions.pop(session_name, None)
+
+        if session:
+            self.adjust_capacity(session.phase, -1)
+
+    def update_session_phase(self, session: "WorkshopSession", phase: str) -> None:
+        """Update the phase of a session of the environment, adjusting the
+        capacity of the environment for the phase transition."""
+
+        if session.phase == phase:
+            return
+
+        self.adjust_capacity(session.phase, -1)
+
+        session.phase = intern_string(phase)
+
+        self.adjust_capacity(session.phase, 1)
+
+        if session.phase == "Allocated":
+            self.settle_reservation(session.name)
+
+    def adjust_capacity(self, phase: str, count: int) -> None:
+        """Adjust the count of allocated or available sessions for the
+        environment, and the count of allocated sessions for the portal, for
+        a change in the number of sessions in the specified phase."""
+
+        if phase == "Allocated":
+            self.allocated += count
+            self.portal.allocated += count
+
+        elif phase == "Available":
+            self.available += count
+
+    @property
+    def pending_allocations(self) -> int:
+        """Return the number of workshop sessions which have been requested or
+        allocated, but which have not yet been seen by the operator and so are
+        not included in the count of allocated sessions. Expired reservations
+        are discarded."""
+
+        now = time.monotonic()
+
+        with _reservations_lock:
+            for key, expires_at in list(self.reservations.items()):
+                if expires_at <= now:
+                    del self.reservations[key]
+
+            return len(self.reservations)
+
+    def reserve_capacity(self) -> str:
+        """Reserve capacity for a workshop session which is about to be
+        requested, returning the key for the reservation. This ensures that
+        concurrent requests take into account that this capacity is in use
+        before the allocated workshop session is seen by the operator."""
+
+        key = f"#{next(_reservation_ids)}"
+
+        with _reservations_lock:
+            self.reservations[key] = time.monotonic() + ALLOCATION_RESERVATION_TIMEOUT
 
-    @synchronized
-    def recalculate_capacity(self) -> None:
-        """Recalculate the available capacity of the environment."""
+        return key
+
+    def confirm_reservation(self, key: str, session_name: str) -> None:
+        """Confirm the reservation after a workshop session was allocated. The
+        reservation is held against the name of the workshop session until the
+        operator sees it as allocated, unless it has already been seen."""
+
+        with _reservations_lock:
+            expires_at = self.reservations.pop(key, None)
+
+            if expires_at is None:
+                return
+
+            session = self.sessions.get(session_name)
+
+            if session and session.phase == "Allocated":
+                return
+
+            self.reservations[session_name] = expires_at
+
+    def release_reservation(self, key: str) -> None:
+        """Release the reservation after a request for a workshop session
+        failed."""
+
+        with _reservations_lock:
+            self.reservations.pop(key, None)
+
+    def settle_reservation(self, session_name: str) -> None:
+        """Release any reservation held against the workshop session, as it has
+        been seen as allocated and is included in the count of allocated
+        sessions."""
+
+        with _reservations_lock:
+            self.reservations.pop(session_name, None)
+
+    def recalculate_capacity(self) -> bool:
+        """Recalculate the available capacity of the environment from the
+        sessions of the environment. Returns whether the counts of allocated
+        and available sessions differed from what was recalculated. Must be
+        called with the cluster configuration locked."""
 
         allocated = 0
         available = 0
@@ -98,17 +215,26 @@ class WorkshopEnvironment:
             elif session.phase == "Available":
                 available += 1
 
-        self.allocated = allocated
-        self.available = available
+        if self.allocated == allocated and self.available == available:
+            return False
 
-        logger.info(
+        logger.warning(
             "Recalculated capacity for environment %s of portal %s in cluster %s: %s",
             self.name,
             self.portal.name,
             self.portal.cluster.name,
-            {"allocated": allocated, "available": available},
+            {
+                "allocated": allocated,
+                "available": available,
+                "previous": {"allocated": self.allocated, "available": self.available},
+            },
         )
 
+        self.allocated = allocated
+        self.available = available
+
+        return True
+
     async def request_workshop_session(
         self, user_id: str, parameters: List[Dict[str, str]], index_url: str
     ) -> Dict[str, str] | None:
@@ -116,14 +242,24 @@ class WorkshopEnvironment:
 
         portal = self.portal
 
-        async with ClientSession() as http_client:
-            async with portal.client_session(http_client) as portal_client:
-                if not portal_client.connected:
-                    return
-
-                return await portal_client.request_workshop_session(
-                    environment_name=self.name,
-                    user_id=user_id,
-                    parameters=parameters,
-                    index_url=index_url,
-                )
+        async with portal.client_session() as portal_client:
+            if not portal_client.connected:
+                return
+
+            return await portal_client.request_workshop_session(
+                environment_name=self.name,
+                user_id=user_id,
+                parameters=parameters,
+                index_url=index_url,
+            )
+
+    async def terminate_workshop_session(self, session_name: str) -> bool:
+        """Terminate a workshop session which had been allocated to a user."""
+
+        portal = self.portal
+
+        async with portal.client_session() as portal_client:
+            if not portal_client.connected:
+                return False
+
+            return await portal_client.terminate_workshop_session(session_name)
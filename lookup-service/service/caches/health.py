@@ -0,0 +1,200 @@
+"""Health of training portals, tracked from the outcome of HTTP requests made
+to each portal."""
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Union
+
+from ..config import (
+    PORTAL_CIRCUIT_FAILURE_THRESHOLD,
+    PORTAL_CIRCUIT_RESET_TIMEOUT,
+)
+from ..helpers.metrics import PORTAL_CIRCUIT_OPENED
+
+logger = logging.getLogger("educates")
+
+
+# Weight given to the outcome of the most recent request when updating the
+# moving averages of the latency and error rate of requests to a portal. A
+# higher value means the health of a portal reacts faster to changes, but is
+# more affected by the odd slow or failed request.
+
+PORTAL_HEALTH_EWMA_ALPHA = 0.2
+
+# Latency in seconds of requests to a portal at which the latency component of
+# the health score of the portal drops to one half. Requests for workshop
+# sessions normally complete within a second or two, so this is set so that
+# only a portal which is markedly slow is penalised.
+
+PORTAL_HEALTH_LATENCY_SCALE = 5.0
+
+# Time in seconds over which the moving averages of the latency and error rate
+# of requests to a portal decay by half when no requests are made. Once ranked
+# below other portals a portal may not receive further requests, so without
+# this it would never recover its health.
+
+PORTAL_HEALTH_HALF_LIFE = 60.0
+
+# States of the circuit breaker for a portal. When closed, requests are made to
+# the portal as normal. When open, because of consecutive failed requests, no
+# requests are made to the portal until the reset timeout has passed. After
+# that the circuit is half open, with a single probe request allowed through,
+# and the circuit is closed if that succeeds or opened again if it fails.
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+@dataclass
+class PortalHealth:
+    """Rolling health of a training portal, being the exponentially weighted
+    moving averages of the latency and error rate of requests made to the
+    portal, decaying over time when no requests are made, along with the state
+    of a circuit breaker which stops requests being made to a portal which is
+    consistently failing. This is only updated and consulted from the event
+    loop of the HTTP server, so no locking is required."""
+
+    cluster_name: str
+    portal_name: str
+    latency: float
+    error_rate: float
+    failures: int
+    state: str
+    updated_at: float
+    opened_at: Union[float, None]
+    probed_at: Union[float, None]
+
+    def __init__(self, cluster_name: str, portal_name: str) -> None:
+        self.cluster_name = cluster_name
+        self.portal_name = portal_name
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.failures = 0
+        self.state = CIRCUIT_CLOSED
+        self.updated_at = time.monotonic()
+        self.opened_at = None
+        self.probed_at = None
+
+    def decay(self) -> float:
+        """Return the factor by which the moving averages have decayed since
+        they were last updated."""
+
+        return 0.5 ** ((time.monotonic() - self.updated_at) / PORTAL_HEALTH_HALF_LIFE)
+
+    def update(self, duration: float, error: float) -> None:
+        """Update the moving averages with the outcome of a request."""
+
+        decay = self.decay()
+
+        self.latency *= decay
+        self.error_rate *= decay
+
+        self.latency += PORTAL_HEALTH_EWMA_ALPHA * (duration - self.latency)
+        self.error_rate += PORTAL_HEALTH_EWMA_ALPHA * (error - self.error_rate)
+
+        self.updated_at = time.monotonic()
+
+    def record_success(self, duration: float) -> None:
+        """Record a request to the portal which succeeded, closing the circuit
+        if this was the probe request made while the circuit was half open."""
+
+        self.update(duration, 0.0)
+
+        self.failures = 0
+        self.probed_at = None
+
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(
+                "Closing circuit for portal %s of cluster %s.",
+                self.portal_name,
+                self.cluster_name,
+            )
+
+            self.state = CIRCUIT_CLOSED
+            self.opened_at = None
+
+    def record_failure(self, duration: float) -> None:
+        """Record a request to the portal which failed, opening the circuit if
+        this was the probe request made while the circuit was half open, or
+        there have now been too many consecutive failures."""
+
+        self.update(duration, 1.0)
+
+        self.failures += 1
+        self.probed_at = None
+
+        if self.state == CIRCUIT_HALF_OPEN or (
+            self.state == CIRCUIT_CLOSED
+            and self.failures >= PORTAL_CIRCUIT_FAILURE_THRESHOLD
+        ):
+            logger.warning(
+                "Opening circuit for portal %s of cluster %s after %d consecutive failures.",  # pylint: disable=line-too-long
+                self.portal_name,
+                self.cluster_name,
+                self.failures,
+            )
+
+            PORTAL_CIRCUIT_OPENED.labels(self.cluster_name, self.portal_name).inc()
+
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def available(self) -> bool:
+        """Check whether a request could currently be made to the portal. This
+        doesn't change the state of the circuit, so can be used when ranking
+        portals without claiming the probe request of a half open circuit."""
+
+        if self.state == CIRCUIT_CLOSED:
+            return True
+
+        # A probe request which has not completed within the reset timeout,
+        # because it was cancelled before its outcome could be recorded, is
+        # treated as lost and another probe request allowed.
+
+        now = time.monotonic()
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            return (
+                self.probed_at is None
+                or now - self.probed_at >= PORTAL_CIRCUIT_RESET_TIMEOUT
+            )
+
+        return now - self.opened_at >= PORTAL_CIRCUIT_RESET_TIMEOUT
+
+    def allow_request(self) -> bool:
+        """Check whether a request can be made to the portal. If the circuit
+        is open and the reset timeout has passed, the circuit becomes half
+        open and the caller is allowed to make the single probe request. The
+        outcome of that request must then be recorded to release the probe."""
+
+        if not self.available:
+            return False
+
+        if self.state == CIRCUIT_OPEN:
+            logger.info(
+                "Probing portal %s of cluster %s with circuit half open.",
+                self.portal_name,
+                self.cluster_name,
+            )
+
+            self.state = CIRCUIT_HALF_OPEN
+
+        if self.state == CIRCUIT_HALF_OPEN:
+            self.probed_at = time.monotonic()
+
+        return True
+
+    @property
+    def score(self) -> float:
+        """Return a score between 0 and 1 for the health of the portal, where
+        1 is a portal with no recent errors and negligible latency. Each of the
+        error rate and the latency reduce the score."""
+
+        decay = self.decay()
+
+        return (1.0 - self.error_rate * decay) / (
+            1.0 + self.latency * decay / PORTAL_HEALTH_LATENCY_SCALE
+        )
@@ -1,16 +1,20 @@
 """Configuration database for training portals."""
 
+import asyncio
 import logging
+import time
 from dataclasses import dataclass
-from typing import TYPE_CHECKING, Dict, List, Tuple, Union
+from typing import TYPE_CHECKING, Dict, List, Union
 
-from aiohttp import BasicAuth, ClientSession, ClientConnectorError
+from aiohttp import BasicAuth, ClientSession, ClientConnectorError, TraceConfig
 
+from ..helpers.metrics import PORTAL_REQUEST_DURATION
+from ..helpers.objects import intern_labels, intern_string
 from .clusters import ClusterConfig
+from .health import PortalHealth
 
 if TYPE_CHECKING:
     from .environments import WorkshopEnvironment
-    from .sessions import WorkshopSession
 
 
 logger = logging.getLogger("educates")
@@ -26,7 +30,7 @@ class PortalCredentials:
     password: str
 
 
-@dataclass
+@dataclass(slots=True)
 class TrainingPortal:
     """Snapshot of training portal state. This includes a database of the
     workshop environments managed by the training portal."""
@@ -42,6 +46,8 @@ class TrainingPortal:
     capacity: int
     allocated: int
     environments: Dict[str, "WorkshopEnvironment"]
+    portal_client: Union["TrainingPortalClientSession", None]
+    health: PortalHealth
 
     def __init__(
         self,
@@ -60,13 +66,15 @@ class TrainingPortal:
         self.name = name
         self.uid = uid
         self.generation = generation
-        self.labels = labels
+        self.labels = intern_labels(labels)
         self.url = url
         self.credentials = credentials
-        self.phase = phase
+        self.phase = intern_string(phase)
         self.capacity = capacity
         self.allocated = allocated
         self.environments = {}
+        self.portal_client = None
+        self.health = PortalHealth(cluster.name, name)
 
     def get_environments(self) -> List["WorkshopEnvironment"]:
         """Returns all workshop environments."""
@@ -92,10 +100,26 @@ class TrainingPortal:
 
         self.environments[environment.name] = environment
 
+        self.allocated += environment.allocated
+
     def remove_environment(self, environment_name: str) -> None:
         """Remove a workshop environment from the portal."""
 
-        self.environments.pop(environment_name, None)
+        environment = self.environments.pop(environment_name, None)
+
+        if environment:
+            self.allocated -= environment.allocated
+
+    @property
+    def pending_allocations(self) -> int:
+        """Return the number of workshop sessions across all workshop
+        environments of the portal which have been requested or allocated, but
+        which have not yet been seen by the operator."""
+
+        return sum(
+            environment.pending_allocations
+            for environment in list(self.environments.values())
+        )
 
     def hosts_workshop(self, workshop_name: str) -> bool:
         """Check if the portal hosts a workshop."""
@@ -106,116 +130,309 @@ class TrainingPortal:
 
         return False
 
-    def recalculate_capacity(self) -> None:
-        """Recalculate the capacity of the portal."""
+    def recalculate_capacity(self) -> bool:
+        """Recalculate the capacity of the portal from the sessions of each
+        workshop environment. The counts of allocated and available sessions
+        are normally adjusted as sessions change, so this is only used as a
+        consistency check. Returns whether any of the counts were wrong."""
 
-        for environment in self.environments.values():
-            environment.recalculate_capacity()
+        changed = False
 
-        self.allocated = sum(
-            environment.allocated for environment in self.environments.values()
-        )
+        for environment in list(self.environments.values()):
+            if environment.recalculate_capacity():
+                changed = True
 
-        logger.info(
-            "Recalculated capacity for portal %s in cluster %s: %s",
-            self.name,
-            self.cluster.name,
-            {"allocated": self.allocated, "capacity": self.capacity},
+        allocated = sum(
+            environment.allocated for environment in list(self.environments.values())
         )
 
-    def find_existing_workshop_session_for_user(
-        self, user_id: str, workshop_name: str
-    ) -> Union["WorkshopSession", None]:
-        """Find an existing workshop session for a user."""
+        if self.allocated != allocated:
+            changed = True
+
+            logger.warning(
+                "Recalculated capacity for portal %s in cluster %s: %s",
+                self.name,
+                self.cluster.name,
+                {
+                    "allocated": allocated,
+                    "capacity": self.capacity,
+                    "previous": {"allocated": self.allocated},
+                },
+            )
 
-        for environment in self.environments.values():
-            for session in environment.get_sessions():
-                if (
-                    session.user == user_id
-                    and session.environment.workshop == workshop_name
-                ):
-                    return session
+            self.allocated = allocated
+
+        return changed
+
+    def client_session(self) -> "TrainingPortalClientSession":
+        """Return the HTTP client session for accessing the remote training
+        portal. The client session is created on first use and then shared
+        across requests so that connections to the portal and the access token
+        obtained when logging in to the portal can be reused."""
+
+        if self.portal_client is None:
+            self.portal_client = TrainingPortalClientSession(self)
+
+        return self.portal_client
+
+    def update_credentials(self, url: str, credentials: PortalCredentials) -> None:
+        """Update the URL and credentials for accessing the portal. If these
+        have changed, any cached access token is discarded so that the client
+        session will login to the portal again on next use."""
+
+        if self.url == url and self.credentials == credentials:
+            return
+
+        self.url = url
+        self.credentials = credentials
+
+        if self.portal_client is not None:
+            self.portal_client.discard_access_token()
+
+    def close_client_session(self) -> None:
+        """Close the HTTP client session for accessing the remote training
+        portal. This can be called from any thread."""
+
+        if self.portal_client is not None:
+            self.portal_client.close()
+            self.portal_client = None
+
+
+# Number of seconds before the expiry of an access token at which the access
+# token will be refreshed. This ensures a request doesn't fail because the
+# access token expired while the request was in flight.
+
+ACCESS_TOKEN_EXPIRY_MARGIN = 60
+
+
+def portal_trace_config(portal: TrainingPortal) -> TraceConfig:
+    """Return a trace configuration for recording the time taken for HTTP
+    requests made to the portal, and whether they succeeded, in the health of
+    the portal. The operation being performed is passed as the trace request
+    context of each request."""
+
+    async def on_request_start(_session, context, _params) -> None:
+        context.start_time = time.monotonic()
+
+    def observe(context, status: str, failed: bool) -> None:
+        operation = (context.trace_request_ctx or {}).get("operation", "unknown")
+
+        duration = time.monotonic() - context.start_time
+
+        PORTAL_REQUEST_DURATION.labels(
+            portal.cluster.name, portal.name, operation, status
+        ).observe(duration)
+
+        if failed:
+            portal.health.record_failure(duration)
+        else:
+            portal.health.record_success(duration)
 
-        return None
+    async def on_request_end(_session, context, params) -> None:
+        operation = (context.trace_request_ctx or {}).get("operation")
+        status = params.response.status
 
-    def client_session(self, session: ClientSession) -> "TrainingPortalClientSession":
-        """Create a HTTP client session for accessing the remote training
-        portal."""
+        # Any error response from the portal counts as a failure. A rejected
+        # login, or a request for a workshop session which didn't succeed,
+        # also counts as a failure. A request rejected because the access
+        # token expired is retried after logging in again, so doesn't count.
 
-        return TrainingPortalClientSession(self, session)
+        if status >= 500:
+            failed = True
+        elif operation == "login":
+            failed = status != 200
+        elif operation in ("request", "reacquire"):
+            failed = status not in (200, 401)
+        else:
+            failed = False
+
+        observe(context, str(status), failed)
+
+    async def on_request_exception(_session, context, _params) -> None:
+        observe(context, "error", True)
+
+    trace_config = TraceConfig()
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+
+    return trace_config
 
 
 @dataclass
 class TrainingPortalClientSession:
-    """HTTP client session for accessing the remote training portal."""
+    """HTTP client session for accessing the remote training portal. A single
+    instance of this is kept for each portal, holding a pool of connections to
+    the portal and the access token obtained when logging in to the portal. The
+    access token is refreshed by logging in again when it expires, or when it
+    is rejected by the portal."""
 
     portal: TrainingPortal
-    session: ClientSession
+    session: ClientSession | None
     access_token: str | None
+    expires_at: float | None
 
-    def __init__(self, portal: TrainingPortal, session: ClientSession) -> None:
+    def __init__(self, portal: TrainingPortal) -> None:
         self.portal = portal
-        self.session = session
+        self.session = None
         self.access_token = None
+        self.expires_at = None
+        self._event_loop = None
+        self._login_lock = None
 
     async def __aenter__(self) -> "TrainingPortalClientSession":
-        """Login to the portal service."""
+        """Login to the portal service if don't hold a valid access token."""
 
         await self.login()
 
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback) -> None:
-        """Logout from the portal service."""
-
-        await self.logout()
+        """Nothing to do on exit as the access token and connections to the
+        portal are retained for use by subsequent requests."""
 
     @property
     def connected(self):
-        """Check if the client session is connected."""
+        """Check if the client session holds an access token which has not
+        expired."""
+
+        if not self.access_token:
+            return False
+
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            return False
+
+        return True
+
+    def http_session(self) -> ClientSession:
+        """Return the pool of HTTP connections to the portal, creating it if
+        this is the first use. Must be called from within the event loop the
+        pool is to be used from."""
+
+        if self.session is None or self.session.closed:
+            self._event_loop = asyncio.get_running_loop()
+            self._login_lock = asyncio.Lock()
+            self.session = ClientSession(
+                trace_configs=[portal_trace_config(self.portal)]
+            )
+
+        return self.session
+
+    def discard_access_token(self, access_token: str | None = None) -> None:
+        """Discard the cached access token. If an access token is supplied the
+        cached access token is only discarded if it is the same, so a request
+        which was rejected with an old access token doesn't cause a newer access
+        token obtained by a concurrent request to be discarded."""
 
-        return bool(self.access_token)
+        if access_token is None or access_token == self.access_token:
+            self.access_token = None
+            self.expires_at = None
 
-    async def login(self) -> bool:
-        """Login to the portal service ."""
+    def close(self) -> None:
+        """Close the pool of HTTP connections to the portal. This can be called
+        from any thread, with the pool being closed from the event loop it was
+        created in."""
+
+        session = self.session
+        event_loop = self._event_loop
+
+        self.session = None
+
+        self.discard_access_token()
+
+        if session is None or session.closed or event_loop is None:
+            return
+
+        if event_loop.is_closed():
+            return
 
         try:
-            async with self.session.post(
-                f"{self.portal.url}/oauth2/token/",
-                data={
-                    "grant_type": "password",
-                    "username": self.portal.credentials.username,
-                    "password": self.portal.credentials.password,
-                },
-                auth=BasicAuth(
-                    self.portal.credentials.client_id,
-                    self.portal.credentials.client_secret,
-                ),
-            ) as response:
-                if response.status != 200:
-                    logger.error(
-                        "Failed to login to portal %s of cluster %s.",
-                        self.portal.name,
-                        self.portal.cluster.name,
-                    )
+            if asyncio.get_running_loop() is event_loop:
+                event_loop.create_task(session.close())
+                return
 
-                    return False
+        except RuntimeError:
+            pass
 
-                data = await response.json()
+        asyncio.run_coroutine_threadsafe(session.close(), event_loop)
 
-                self.access_token = data.get("access_token")
+    async def login(self, probe_claimed: bool = False) -> bool:
+        """Login to the portal service if we do not already hold a valid
+        access token. Where the caller was already allowed to make a request
+        by the circuit for the portal, and so may hold the probe request of a
+        half open circuit, the circuit isn't checked again."""
 
-                return True
+        session = self.http_session()
 
-        except ClientConnectorError as exc:
-            logger.error(
-                "Failed to connect to portal %s of cluster %s when attempting to login: %s",
-                self.portal.name,
-                self.portal.cluster.name,
-                exc,
-            )
+        if self.connected:
+            return True
 
-            return False
+        # Ensure only one request at a time attempts to login to the portal
+        # when the access token needs to be refreshed, with other requests
+        # waiting and then using the new access token.
+
+        async with self._login_lock:
+            if self.connected:
+                return True
+
+            if not probe_claimed and not self.portal.health.allow_request():
+                logger.warning(
+                    "Not logging in to portal %s of cluster %s as circuit is open.",
+                    self.portal.name,
+                    self.portal.cluster.name,
+                )
+
+                return False
+
+            try:
+                async with session.post(
+                    f"{self.portal.url}/oauth2/token/",
+                    data={
+                        "grant_type": "password",
+                        "username": self.portal.credentials.username,
+                        "password": self.portal.credentials.password,
+                    },
+                    auth=BasicAuth(
+                        self.portal.credentials.client_id,
+                        self.portal.credentials.client_secret,
+                    ),
+                    trace_request_ctx={"operation": "login"},
+                ) as response:
+                    if response.status != 200:
+                        logger.error(
+                            "Failed to login to portal %s of cluster %s.",
+                            self.portal.name,
+                            self.portal.cluster.name,
+                        )
+
+                        return False
+
+                    data = await response.json()
+
+                    expires_in = data.get("expires_in")
+
+                    self.access_token = data.get("access_token")
+
+                    if expires_in:
+                        self.expires_at = time.monotonic() + max(
+                            0, int(expires_in) - ACCESS_TOKEN_EXPIRY_MARGIN
+                        )
+
+                    else:
+                        self.expires_at = None
+
+                    return bool(self.access_token)
+
+            except ClientConnectorError as exc:
+                logger.error(
+                    "Failed to connect to portal %s of cluster %s when attempting to login: %s",
+                    self.portal.name,
+                    self.portal.cluster.name,
+                    exc,
+                )
+
+                return False
 
     async def logout(self) -> None:
         """Logout from the portal service."""
@@ -223,14 +440,19 @@ class TrainingPortalClientSession:
         if not self.connected:
             return
 
+        access_token = self.access_token
+
+        self.discard_access_token()
+
         try:
-            async with self.session.post(
+            async with self.http_session().post(
                 f"{self.portal.url}/oauth2/revoke-token/",
                 data={
                     "client_id": self.portal.credentials.client_id,
                     "client_secret": self.portal.credentials.client_secret,
-                    "token": self.access_token,
+                    "token": access_token,
                 },
+                trace_request_ctx={"operation": "logout"},
             ) as response:
                 if response.status != 200:
                     logger.error(
@@ -252,60 +474,76 @@ class TrainingPortalClientSession:
     ) -> Dict[str, str] | None:
         """Reacquire a workshop session for a user."""
 
-        if not self.connected:
-            return
-
         if not session_name:
             return
 
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-
-        try:
-            async with self.session.get(
-                f"{self.portal.url}/workshops/environment/{environment_name}/request/",
-                headers=headers,
-                params={
-                    "index_url": index_url,
-                    "user": user_id,
-                    "session": session_name,
-                },
-            ) as response:
-                if response.status != 200:
-                    logger.error(
-                        "Failed to reacquire session %s from portal %s of cluster %s for user %s.",
-                        session_name,
-                        self.portal.name,
-                        self.portal.cluster.name,
-                        user_id,
-                    )
-                    logger.error("Failed response status: %s", response.status)
-                    logger.error("Failed response text: %s", await response.text())
+        # If the access token is rejected by the portal, because it was revoked
+        # or expired early, discard it, login again and retry the request once.
+
+        for _ in range(2):
+            if not await self.login():
+                return
+
+            access_token = self.access_token
+
+            headers = {"Authorization": f"Bearer {access_token}"}
+
+            try:
+                async with self.http_session().get(
+                    f"{self.portal.url}/workshops/environment/{environment_name}/request/",
+                    headers=headers,
+                    params={
+                        "index_url": index_url,
+                        "user": user_id,
+                        "session": session_name,
+                    },
+                    trace_request_ctx={"operation": "reacquire"},
+                ) as response:
+                    if response.status == 401:
+                        self.discard_access_token(access_token)
+
+                        continue
+
+                    if response.status != 200:
+                        logger.error(
+                            "Failed to reacquire session %s from portal %s of cluster %s for user %s.",  # pylint: disable=line-too-long
+                            session_name,
+                            self.portal.name,
+                            self.portal.cluster.name,
+                            user_id,
+                        )
+                        logger.error("Failed response status: %s", response.status)
+                        logger.error("Failed response text: %s", await response.text())
+
+                        return
+
+                    data = await response.json()
+
+                    url = data.get("url")
+
+                    if url:
+                        return {
+                            "clusterName": self.portal.cluster.name,
+                            "portalName": self.portal.name,
+                            "environmentName": environment_name,
+                            "sessionName": session_name,
+                            "clientUserId": user_id,
+                            "sessionActivationUrl": f"{self.portal.url}{url}",
+                        }
 
                     return
 
-                data = await response.json()
-
-                url = data.get("url")
+            except ClientConnectorError as exc:
+                logger.error(
+                    "Failed to connect to portal %s of cluster %s when attempting to reacquire session %s for user %s: %s",  # pylint: disable=line-too-long
+                    self.portal.name,
+                    self.portal.cluster.name,
+                    session_name,
+                    user_id,
+                    exc,
+                )
 
-                if url:
-                    return {
-                        "clusterName": self.portal.cluster.name,
-                        "portalName": self.portal.name,
-                        "environmentName": environment_name,
-                        "sessionName": session_name,
-                        "clientUserId": user_id,
-                        "sessionActivationUrl": f"{self.portal.url}{url}",
-                    }
-
-        except ClientConnectorError as exc:
-            logger.error(
-                "Failed to connect to portal %s of cluster %s when attempting to reacquire session %s for user %s: %s",  # pylint: disable=line-too-long
-                self.portal.name,
-                self.portal.cluster.name,
-                session_name,
-                user_id,
-                exc,
-            )
+                return
 
     async def request_workshop_session(
         self,
@@ -314,55 +552,131 @@ class TrainingPortalClientSession:
         parameters: List[Dict[str, str]],
         index_url: str,
     ) -> Dict[str, str] | None:
-        """Request a workshop session for a user."""
+        """Request a workshop session for a user. No request is made if the
+        circuit for the portal is open because of prior failed requests."""
+
+        if not self.portal.health.allow_request():
+            logger.warning(
+                "Not requesting session from portal %s of cluster %s for user %s as circuit is open.",  # pylint: disable=line-too-long
+                self.portal.name,
+                self.portal.cluster.name,
+                user_id,
+            )
 
-        if not self.connected:
             return
 
-        headers = {"Authorization": f"Bearer {self.access_token}"}
-
-        try:
-            async with self.session.get(
-                f"{self.portal.url}/workshops/environment/{environment_name}/request/",
-                headers=headers,
-                params={
-                    "user": user_id,
-                    "index_url": index_url,
-                },
-                json={"parameters": parameters},
-            ) as response:
-                if response.status != 200:
-                    logger.error(
-                        "Failed to request session from portal %s of cluster %s for user %s.",
-                        self.portal.name,
-                        self.portal.cluster.name,
-                        user_id,
-                    )
-                    logger.error("Failed response status: %s", response.status)
-                    logger.error("Failed response text: %s", await response.text())
+        # If the access token is rejected by the portal, because it was revoked
+        # or expired early, discard it, login again and retry the request once.
+
+        for _ in range(2):
+            if not await self.login(probe_claimed=True):
+                return
+
+            access_token = self.access_token
+
+            headers = {"Authorization": f"Bearer {access_token}"}
+
+            try:
+                async with self.http_session().get(
+                    f"{self.portal.url}/workshops/environment/{environment_name}/request/",
+                    headers=headers,
+                    params={
+                        "user": user_id,
+                        "index_url": index_url,
+                    },
+                    json={"parameters": parameters},
+                    trace_request_ctx={"operation": "request"},
+                ) as response:
+                    if response.status == 401:
+                        self.discard_access_token(access_token)
+
+                        continue
+
+                    if response.status != 200:
+                        logger.error(
+                            "Failed to request session from portal %s of cluster %s for user %s.",
+                            self.portal.name,
+                            self.portal.cluster.name,
+                            user_id,
+                        )
+                        logger.error("Failed response status: %s", response.status)
+                        logger.error("Failed response text: %s", await response.text())
+
+                        return
+
+                    data = await response.json()
+
+                    url = data.get("url")
+                    session_name = data.get("name")
+
+                    if url:
+                        return {
+                            "clusterName": self.portal.cluster.name,
+                            "portalName": self.portal.name,
+                            "environmentName": environment_name,
+                            "sessionName": session_name,
+                            "clientUserId": user_id,
+                            "sessionActivationUrl": f"{self.portal.url}{url}",
+                        }
 
                     return
 
-                data = await response.json()
+            except ClientConnectorError as exc:
+                logger.error(
+                    "Failed to connect to portal %s of cluster %s when attempting to request session for user %s: %s",  # pylint: disable=line-too-long
+                    self.portal.name,
+                    self.portal.cluster.name,
+                    user_id,
+                    exc,
+                )
 
-                url = data.get("url")
-                session_name = data.get("name")
+                return
 
-                if url:
-                    return {
-                        "clusterName": self.portal.cluster.name,
-                        "portalName": self.portal.name,
-                        "environmentName": environment_name,
-                        "sessionName": session_name,
-                        "clientUserId": user_id,
-                        "sessionActivationUrl": f"{self.portal.url}{url}",
-                    }
+    async def terminate_workshop_session(self, session_name: str) -> bool:
+        """Terminate a workshop session which had been allocated to a user."""
 
-        except ClientConnectorError as exc:
-            logger.error(
-                "Failed to connect to portal %s of cluster %s when attempting to request session for user %s: %s",  # pylint: disable=line-too-long
-                self.portal.name,
-                self.portal.cluster.name,
-                user_id,
-                exc,
-            )
+        for _ in range(2):
+            if not await self.login():
+                return False
+
+            access_token = self.access_token
+
+            headers = {"Authorization": f"Bearer {access_token}"}
+
+            try:
+                async with self.http_session().get(
+                    f"{self.portal.url}/workshops/session/{session_name}/terminate/",
+                    headers=headers,
+                    trace_request_ctx={"operation": "terminate"},
+                ) as response:
+                    if response.status == 401:
+                        self.discard_access_token(access_token)
+
+                        continue
+
+                    if response.status != 200:
+                        logger.error(
+                            "Failed to terminate session %s from portal %s of cluster %s.",
+                            session_name,
+                            self.portal.name,
+                            self.portal.cluster.name,
+                        )
+                        logger.error("Failed response status: %s", response.status)
+                        logger.error("Failed response text: %s", await response.text())
+
+                        return False
+
+                    return True
+
+            except ClientConnectorError as exc:
+                logger.error(
+                    "Failed to connect to portal %s of cluster %s when attempting to terminate session %s: %s",  # pylint: disable=line-too-long
+                    self.portal.name,
+                    self.portal.cluster.name,
+                    session_name,
+                    exc,
+                )
+
+                return False
+
+        return False
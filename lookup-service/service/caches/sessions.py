@@ -3,15 +3,17 @@
 from dataclasses import dataclass
 from typing import TYPE_CHECKING, Dict
 
-from aiohttp import ClientSession
+from ..helpers.objects import intern_string
 
 if TYPE_CHECKING:
     from .environments import WorkshopEnvironment
 
 
-@dataclass
+@dataclass(slots=True)
 class WorkshopSession:
-    """Snapshot of workshop session state."""
+    """Snapshot of workshop session state. Slots are used as there can be tens
+    of thousands of workshop sessions across all clusters, with the phase
+    interned as it is shared by many workshop sessions."""
 
     environment: "WorkshopEnvironment"
     name: str
@@ -19,19 +21,32 @@ class WorkshopSession:
     phase: str
     user: str
 
+    def __init__(
+        self,
+        environment: "WorkshopEnvironment",
+        name: str,
+        generation: int,
+        phase: str,
+        user: str,
+    ) -> None:
+        self.environment = environment
+        self.name = name
+        self.generation = generation
+        self.phase = intern_string(phase)
+        self.user = user
+
     async def reacquire_workshop_session(self, index_url: str) -> Dict[str, str] | None:
         """Reacquire a workshop session for a user."""
 
         portal = self.environment.portal
 
-        async with ClientSession() as http_client:
-            async with portal.client_session(http_client) as portal_client:
-                if not portal_client.connected:
-                    return
-
-                return await portal_client.reacquire_workshop_session(
-                    self.user,
-                    environment_name=self.environment.name,
-                    session_name=self.name,
-                    index_url=index_url,
-                )
+        async with portal.client_session() as portal_client:
+            if not portal_client.connected:
+                return
+
+            return await portal_client.reacquire_workshop_session(
+                self.user,
+                environment_name=self.environment.name,
+                session_name=self.name,
+                index_url=index_url,
+            )
@@ -0,0 +1,313 @@
+"""Immutable snapshots of the state of clusters, portals, workshop environments
+and workshop sessions, for use by the HTTP API request handlers."""
+
+import itertools
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Mapping, Tuple, Union
+
+if TYPE_CHECKING:
+    from .clusters import ClusterConfig
+    from .environments import WorkshopEnvironment
+    from .portals import TrainingPortal
+    from .sessions import WorkshopSession
+
+
+# Sequence number assigned to each cluster snapshot when captured. This is used
+# to ensure that a snapshot captured earlier doesn't replace one captured later
+# when snapshots for the same cluster are published from different threads.
+
+_snapshot_sequence = itertools.count(1)
+
+# Version number assigned to the workshop catalog of a portal whenever the
+# workshops it provides change. Versions are unique across all portals, so a
+# combination of versions for a set of portals changes if any catalog changes.
+
+_catalog_version = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """Details of a workshop provided by a running workshop environment, as
+    presented in the workshop catalog."""
+
+    name: str
+    title: str
+    description: str
+    labels: Tuple[Any, ...]
+
+
+@dataclass(frozen=True)
+class ClusterSnapshot:
+    """Immutable snapshot of the portals, workshop environments and workshop
+    sessions of a cluster. The collections are immutable, but the objects held
+    in them are the live objects, so attributes such as capacity counts will
+    reflect their current values. A snapshot is marked as stale where it was
+    restored from a checkpoint of the state of the cluster saved prior to the
+    service being restarted, and has yet to be replaced by live state."""
+
+    sequence: int
+    cluster: "ClusterConfig"
+    access_key: Tuple[Any, ...]
+    portals: Tuple["TrainingPortal", ...]
+    portals_by_name: Mapping[str, "TrainingPortal"]
+    environments: Mapping[str, Tuple["WorkshopEnvironment", ...]]
+    environments_by_name: Mapping[Tuple[str, str], "WorkshopEnvironment"]
+    sessions: Mapping[Tuple[str, str], Tuple["WorkshopSession", ...]]
+    catalogs: Mapping[str, Tuple[CatalogEntry, ...]]
+    catalog_versions: Mapping[str, int]
+    stale: bool = False
+
+    @staticmethod
+    def capture(cluster: "ClusterConfig") -> "ClusterSnapshot":
+        """Capture a snapshot of the cluster. Must be called with the cluster
+        configuration locked, or before the cluster is visible to other
+        threads."""
+
+        sequence = next(_snapshot_sequence)
+
+        portals = tuple(cluster.portals.values())
+
+        environments = {}
+        environments_by_name = {}
+        sessions = {}
+        catalogs = {}
+
+        for portal in portals:
+            portal_environments = tuple(portal.environments.values())
+
+            environments[portal.name] = portal_environments
+
+            for environment in portal_environments:
+                environments_by_name[(portal.name, environment.name)] = environment
+                sessions[(portal.name, environment.name)] = tuple(
+                    environment.sessions.values()
+                )
+
+            # Capture the details of the workshops provided by running workshop
+            # environments at this point, as the attributes of the live objects
+            # can be changed after the snapshot is captured.
+
+            catalogs[portal.name] = tuple(
+                CatalogEntry(
+                    name=environment.workshop,
+                    title=environment.title,
+                    description=environment.description,
+                    labels=tuple(environment.labels),
+                )
+                for environment in portal_environments
+                if environment.phase == "Running"
+            )
+
+        # The access key captures the labels of the cluster and the identity,
+        # names and labels of its portals, being what is used to determine
+        # which portals a tenant has access to. A change in the access key of
+        # any cluster results in the generation of the fleet snapshot being
+        # incremented.
+
+        access_key = (
+            tuple((item["name"], item["value"]) for item in cluster.labels),
+            tuple(
+                (
+                    id(portal),
+                    portal.name,
+                    tuple((item["name"], item["value"]) for item in portal.labels),
+                )
+                for portal in portals
+            ),
+        )
+
+        return ClusterSnapshot(
+            sequence=sequence,
+            cluster=cluster,
+            access_key=access_key,
+            portals=portals,
+            portals_by_name=MappingProxyType(
+                {portal.name: portal for portal in portals}
+            ),
+            environments=MappingProxyType(environments),
+            environments_by_name=MappingProxyType(environments_by_name),
+            sessions=MappingProxyType(sessions),
+            catalogs=MappingProxyType(catalogs),
+            catalog_versions=MappingProxyType({}),
+        )
+
+    def with_catalog_versions(
+        self, previous: Union["ClusterSnapshot", None]
+    ) -> "ClusterSnapshot":
+        """Return a copy of the snapshot with versions assigned to the workshop
+        catalog of each portal. The version from the previous snapshot of the
+        cluster is retained where the catalog of the portal is unchanged."""
+
+        catalog_versions = {}
+
+        for name, catalog in self.catalogs.items():
+            if (
+                previous is not None
+                and name in previous.catalog_versions
+                and previous.portals_by_name.get(name) is self.portals_by_name[name]
+                and previous.catalogs.get(name) == catalog
+            ):
+                catalog_versions[name] = previous.catalog_versions[name]
+            else:
+                catalog_versions[name] = next(_catalog_version)
+
+        return replace(self, catalog_versions=MappingProxyType(catalog_versions))
+
+
+@dataclass(frozen=True)
+class FleetSnapshot:
+    """Immutable snapshot of the state of all clusters. A new snapshot is
+    published by replacing the snapshot held by the cluster database, so a
+    request handler which holds a reference to a snapshot sees a consistent
+    view without needing to copy or lock anything. The generation is only
+    incremented when clusters are added or removed, or the names or labels of
+    clusters or portals change, and so can be used to determine when state
+    derived from these, such as the portals accessible by a tenant, is out of
+    date."""
+
+    generation: int
+    clusters: Mapping[str, ClusterSnapshot]
+    cluster_list: Tuple["ClusterConfig", ...]
+
+    @staticmethod
+    def empty() -> "FleetSnapshot":
+        """Return an empty snapshot."""
+
+        return FleetSnapshot(
+            generation=0, clusters=MappingProxyType({}), cluster_list=()
+        )
+
+    def with_cluster(self, snapshot: ClusterSnapshot) -> "FleetSnapshot":
+        """Return a new snapshot with the snapshot of a cluster added or
+        replaced."""
+
+        clusters = dict(self.clusters)
+
+        previous = clusters.get(snapshot.cluster.name)
+
+        snapshot = snapshot.with_catalog_versions(previous)
+
+        clusters[snapshot.cluster.name] = snapshot
+
+        generation = self.generation
+
+        if previous is None or previous.access_key != snapshot.access_key:
+            generation += 1
+
+        return FleetSnapshot(
+            generation=generation,
+            clusters=MappingProxyType(clusters),
+            cluster_list=tuple(item.cluster for item in clusters.values()),
+        )
+
+    def without_cluster(self, name: str) -> "FleetSnapshot":
+        """Return a new snapshot with the snapshot of a cluster removed."""
+
+        clusters = dict(self.clusters)
+
+        if clusters.pop(name, None) is None:
+            return self
+
+        return FleetSnapshot(
+            generation=self.generation + 1,
+            clusters=MappingProxyType(clusters),
+            cluster_list=tuple(item.cluster for item in clusters.values()),
+        )
+
+    def get_clusters(self) -> Tuple["ClusterConfig", ...]:
+        """Retrieve the clusters."""
+
+        return self.cluster_list
+
+    def get_cluster(self, name: str) -> Union["ClusterConfig", None]:
+        """Retrieve a cluster by name."""
+
+        snapshot = self.clusters.get(name)
+
+        return snapshot and snapshot.cluster
+
+    def get_portals(self, cluster: "ClusterConfig") -> Tuple["TrainingPortal", ...]:
+        """Retrieve the portals of a cluster."""
+
+        snapshot = self.clusters.get(cluster.name)
+
+        return snapshot.portals if snapshot else ()
+
+    def get_all_portals(self) -> Tuple["TrainingPortal", ...]:
+        """Retrieve the portals of all clusters."""
+
+        return tuple(
+            itertools.chain.from_iterable(
+                snapshot.portals for snapshot in self.clusters.values()
+            )
+        )
+
+    def get_portal(
+        self, cluster: "ClusterConfig", name: str
+    ) -> Union["TrainingPortal", None]:
+        """Retrieve a portal of a cluster by name."""
+
+        snapshot = self.clusters.get(cluster.name)
+
+        return snapshot.portals_by_name.get(name) if snapshot else None
+
+    def get_environments(
+        self, portal: "TrainingPortal"
+    ) -> Tuple["WorkshopEnvironment", ...]:
+        """Retrieve the workshop environments of a portal."""
+
+        snapshot = self.clusters.get(portal.cluster.name)
+
+        return snapshot.environments.get(portal.name, ()) if snapshot else ()
+
+    def get_running_environments(
+        self, portal: "TrainingPortal"
+    ) -> Tuple["WorkshopEnvironment", ...]:
+        """Retrieve the running workshop environments of a portal."""
+
+        return tuple(
+            environment
+            for environment in self.get_environments(portal)
+            if environment.phase == "Running"
+        )
+
+    def get_environment(
+        self, portal: "TrainingPortal", name: str
+    ) -> Union["WorkshopEnvironment", None]:
+        """Retrieve a workshop environment of a portal by name."""
+
+        snapshot = self.clusters.get(portal.cluster.name)
+
+        if not snapshot:
+            return None
+
+        return snapshot.environments_by_name.get((portal.name, name))
+
+    def get_catalog(self, portal: "TrainingPortal") -> Tuple[CatalogEntry, ...]:
+        """Retrieve the workshops provided by the running workshop environments
+        of a portal."""
+
+        snapshot = self.clusters.get(portal.cluster.name)
+
+        return snapshot.catalogs.get(portal.name, ()) if snapshot else ()
+
+    def get_catalog_version(self, portal: "TrainingPortal") -> int:
+        """Retrieve the version of the workshop catalog of a portal. Returns 0
+        if the portal is not part of the snapshot."""
+
+        snapshot = self.clusters.get(portal.cluster.name)
+
+        return snapshot.catalog_versions.get(portal.name, 0) if snapshot else 0
+
+    def get_sessions(
+        self, environment: "WorkshopEnvironment"
+    ) -> Tuple["WorkshopSession", ...]:
+        """Retrieve the workshop sessions of a workshop environment."""
+
+        snapshot = self.clusters.get(environment.portal.cluster.name)
+
+        if not snapshot:
+            return ()
+
+        return snapshot.sessions.get((environment.portal.name, environment.name), ())
@@ -1,7 +1,7 @@
 """Configuration database for training plaform tenants."""
 
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import Any, Dict, FrozenSet, Tuple
 
 from ..helpers.selectors import ResourceSelector
 from .clusters import ClusterConfig
@@ -22,40 +22,53 @@ class TenantConfig:
         self.clusters = ResourceSelector(clusters)
         self.portals = ResourceSelector(portals)
 
+        # Cache of the portals accessible by the tenant, along with the
+        # generation of the snapshot of clusters the cache was calculated from.
+
+        self._accessible_generation = None
+        self._accessible_portals = ()
+        self._accessible_portal_names = frozenset()
+
     def allowed_access_to_cluster(self, cluster: ClusterConfig) -> bool:
         """Check if the tenant has access to the cluster."""
 
-        # Fake up a resource metadata object for the cluster.
-
-        resource = {
-            "metadata": {
-                "name": cluster.name,
-                "uid": cluster.uid,
-                "labels": {
-                    item["name"]: item["value"] for item in list(cluster.labels)
-                },
-            },
-        }
+        labels = {item["name"]: item["value"] for item in list(cluster.labels)}
 
-        return self.clusters.match_resource(resource)
+        return self.clusters.match(cluster.name, labels)
 
     def allowed_access_to_portal(self, portal: TrainingPortal) -> bool:
         """Check if the tenant has access to the portal."""
 
-        # Fake up a resource metadata object for the portal.
+        labels = {item["name"]: item["value"] for item in list(portal.labels)}
+
+        return self.portals.match(portal.name, labels)
+
+    def portals_which_are_accessible(self) -> Tuple[TrainingPortal, ...]:
+        """Retrieve a list of training portals accessible by a tenant. The
+        result is cached and only recalculated when the generation of the
+        snapshot of clusters changes, indicating clusters or portals were added
+        or removed, or their labels changed."""
+
+        self._update_accessible_portals()
+
+        return self._accessible_portals
+
+    def portal_is_accessible(self, portal: TrainingPortal) -> bool:
+        """Check if the portal is one of the training portals accessible by
+        the tenant, using the cached result of evaluating the tenant's rules."""
+
+        self._update_accessible_portals()
+
+        return (portal.cluster.name, portal.name) in self._accessible_portal_names
 
-        resource = {
-            "metadata": {
-                "name": portal.name,
-                "uid": portal.uid,
-                "labels": {item["name"]: item["value"] for item in list(portal.labels)},
-            },
-        }
+    def _update_accessible_portals(self) -> None:
+        """Recalculate the set of training portals accessible by the tenant if
+        the snapshot of clusters has changed since it was last calculated."""
 
-        return self.portals.match_resource(resource)
+        snapshot = cluster_database.snapshot
 
-    def portals_which_are_accessible(self) -> List[TrainingPortal]:
-        """Retrieve a list of training portals accessible by a tenant."""
+        if self._accessible_generation == snapshot.generation:
+            return
 
         # Get the list of clusters and portals that match the tenant's rules.
         # To do this we iterate over all the portals and for each portal we then
@@ -65,10 +78,14 @@ class TenantConfig:
 
         accessible_portals = []
 
-        for cluster in cluster_database.get_clusters():
+        for cluster in snapshot.get_clusters():
             if self.allowed_access_to_cluster(cluster):
-                for portal in cluster.get_portals():
+                for portal in snapshot.get_portals(cluster):
                     if self.allowed_access_to_portal(portal):
                         accessible_portals.append(portal)
 
-        return accessible_portals
+        self._accessible_portals = tuple(accessible_portals)
+        self._accessible_portal_names = frozenset(
+            (portal.cluster.name, portal.name) for portal in accessible_portals
+        )
+        self._accessible_generation = snapshot.generation
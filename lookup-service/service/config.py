@@ -1,8 +1,73 @@
 """Configuration for the lookup service."""
 
 import functools
+import os
 import random
 
+# Delay in seconds after which, if a request for a workshop session against the
+# best candidate workshop environment has not completed, a hedged request is
+# also sent to the next best workshop environment. A value of 0 disables hedged
+# requests, with workshop environments only tried one after the other.
+
+ALLOCATION_HEDGE_DELAY = float(os.getenv("ALLOCATION_HEDGE_DELAY", "5.0"))
+
+# Maximum number of concurrent requests for workshop sessions made against any
+# one training portal when allocating workshop sessions for a batch of users.
+
+ALLOCATION_BATCH_CONCURRENCY = int(os.getenv("ALLOCATION_BATCH_CONCURRENCY", "10"))
+
+# Time in seconds for which capacity reserved in a workshop environment when a
+# workshop session is requested is held, if the allocated workshop session is
+# not seen by the operator in that time. The reservation is otherwise released
+# when the request fails or the allocated workshop session is seen.
+
+ALLOCATION_RESERVATION_TIMEOUT = float(
+    os.getenv("ALLOCATION_RESERVATION_TIMEOUT", "30.0")
+)
+
+# Path of the file to which the state of all clusters is periodically saved,
+# and from which it is restored on startup as provisional state, until the live
+# state of each cluster has been received. If empty, no checkpoints are saved.
+# The state restored for a cluster is discarded if it hasn't been replaced by
+# live state within the stale timeout.
+
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "")
+
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "60.0"))
+
+CHECKPOINT_STALE_TIMEOUT = float(os.getenv("CHECKPOINT_STALE_TIMEOUT", "600.0"))
+
+# How resources on remote clusters are watched. With "operator" a separate kopf
+# operator instance is run in its own thread for each cluster. With "multiplexed"
+# watch streams for all clusters are run on a single event loop in a shared
+# thread, with tasks being started and cancelled as clusters come and go.
+
+CLUSTER_WATCH_MODE = os.getenv("CLUSTER_WATCH_MODE", "operator")
+
+# Maximum number of verified JWT tokens presented by clients which are cached,
+# so the token doesn't need to be decoded and verified again, and the client
+# looked up again, each time the same token is presented.
+
+JWT_TOKEN_CACHE_SIZE = int(os.getenv("JWT_TOKEN_CACHE_SIZE", "4096"))
+
+# Maximum number of records returned in a single page when listings of clusters,
+# portals, workshop environments, workshop sessions, users or tenants returned
+# by the HTTP API are paginated. This is also the page size used when a cursor
+# is supplied without a limit.
+
+LISTING_MAXIMUM_LIMIT = int(os.getenv("LISTING_MAXIMUM_LIMIT", "1000"))
+
+# Number of consecutive failed requests to a training portal after which the
+# circuit for the portal is opened, with no further requests for workshop
+# sessions made to the portal, and the time in seconds after which a single
+# probe request is allowed through to check whether the portal has recovered.
+
+PORTAL_CIRCUIT_FAILURE_THRESHOLD = int(
+    os.getenv("PORTAL_CIRCUIT_FAILURE_THRESHOLD", "5")
+)
+
+PORTAL_CIRCUIT_RESET_TIMEOUT = float(os.getenv("PORTAL_CIRCUIT_RESET_TIMEOUT", "30.0"))
+
 
 @functools.lru_cache(maxsize=1)
 def jwt_token_secret() -> str:
@@ -3,7 +3,8 @@
 import asyncio
 import base64
 import logging
-from typing import Any, Dict
+import time
+from typing import Any, Callable, Dict
 
 import kopf
 import yaml
@@ -13,13 +14,23 @@ from ..caches.clusters import ClusterConfig
 from ..caches.environments import WorkshopEnvironment
 from ..caches.portals import PortalCredentials, TrainingPortal
 from ..caches.sessions import WorkshopSession
+from ..config import CLUSTER_WATCH_MODE
 from ..helpers.kubeconfig import (
+    create_connection_info_from_kubeconfig,
     create_kubeconfig_from_access_token_secret,
     extract_context_from_kubeconfig,
     verify_kubeconfig_format,
 )
-from ..helpers.objects import xgetattr
+from ..helpers.metrics import CLUSTER_EVENT_DURATION, CLUSTER_SNAPSHOT_LAG
+from ..helpers.objects import intern_labels, intern_string, xgetattr
 from ..helpers.operator import GenericOperator
+from ..helpers.watchers import (
+    WATCH_RETRY_DELAY,
+    WatchMultiplexer,
+    WatchUnauthorized,
+    create_client_session,
+    watch_resources,
+)
 from ..service import ServiceState
 
 logger = logging.getLogger("educates")
@@ -167,6 +178,14 @@ def clusterconfigs_update(
             cluster_config.labels = xgetattr(spec, "labels", [])
             cluster_config.kubeconfig = kubeconfig
 
+    # Publish a new snapshot of the cluster in case the labels changed. This
+    # must be done after releasing the lock on the cluster database.
+
+    cluster_config = cluster_database.get_cluster(name)
+
+    if cluster_config:
+        cluster_database.publish_cluster(cluster_config)
+
 
 @kopf.on.delete("clusterconfigs.lookup.educates.dev")
 def clusterconfigs_delete(name: str, meta: kopf.Meta, memo: ServiceState, **_):
@@ -181,253 +200,650 @@ def clusterconfigs_delete(name: str, meta: kopf.Meta, memo: ServiceState, **_):
     cluster_database.remove_cluster(name)
 
 
-class ClusterOperator(GenericOperator):
-    """Operator for interacting with training platform on separate cluster."""
+# Interval in seconds between consistency checks of the counts of allocated and
+# available sessions, which are otherwise adjusted as each event is processed.
 
-    def __init__(self, cluster_name: str, service_state: ServiceState) -> None:
-        """Initializes the operator."""
+CAPACITY_CHECK_INTERVAL = 60.0
 
-        super().__init__(cluster_name, service_state=service_state)
+# Delay in seconds after processing an event before a new snapshot of the state
+# of the cluster is published. Any further events processed within this time
+# are included in the same snapshot.
 
-    def register_handlers(self) -> None:
-        """Register the handlers for the training platform operator."""
+SNAPSHOT_PUBLISH_DELAY = 0.1
 
-        @kopf.on.event(
-            "trainingportals.training.educates.dev",
-            registry=self.operator_registry,
+# Time in seconds with no events being received for a cluster, after events
+# have started to be received, before the initial state of the cluster is
+# deemed to have been received, when the point at which the initial listing
+# of resources completes can't otherwise be determined.
+
+CLUSTER_SYNC_QUIET_PERIOD = 5.0
+
+
+class ClusterEventProcessor:
+    """Processes events for training portals, workshop environments and workshop
+    sessions of a remote cluster, updating the cached state of the cluster. This
+    is independent of how the events are received, whether by a kopf operator
+    instance dedicated to the cluster or by watch streams for all clusters
+    multiplexed on a single event loop.
+
+    Where state for the cluster was restored from a checkpoint, it is replaced
+    by live state once the cluster is marked as synced. If the initial listing
+    of resources is known to have completed this is done explicitly, otherwise
+    it is done after a quiet period during which no events are received."""
+
+    def __init__(
+        self,
+        cluster_config: ClusterConfig,
+        service_state: ServiceState,
+        *,
+        sync_after_quiet_period: bool = False,
+    ):
+        """Initializes the event processor."""
+
+        self.cluster_config = cluster_config
+        self.service_state = service_state
+
+        self._capacity_checked = time.monotonic()
+        self._snapshot_handle = None
+        self._snapshot_scheduled = None
+
+        self._synced = False
+        self._sync_after_quiet_period = sync_after_quiet_period
+        self._sync_handle = None
+        self._last_event = None
+
+    @property
+    def cluster_name(self) -> str:
+        """Return the name of the cluster events are processed for."""
+
+        return self.cluster_config.name
+
+    def check_capacity(self) -> None:
+        """Periodically recalculate the capacity of all portals of the cluster
+        from their sessions, to guard against the counts of allocated and
+        available sessions, which are adjusted as events are processed, having
+        drifted. Must be called with the cluster configuration locked."""
+
+        now = time.monotonic()
+
+        if now - self._capacity_checked < CAPACITY_CHECK_INTERVAL:
+            return
+
+        self._capacity_checked = now
+
+        for portal in self.cluster_config.get_portals():
+            portal.recalculate_capacity()
+
+    def schedule_snapshot(self) -> None:
+        """Schedule publishing of a new snapshot of the state of the cluster,
+        if not already scheduled. Must be called from the event loop events
+        are being processed in."""
+
+        if self._snapshot_handle is None:
+            self._snapshot_scheduled = time.monotonic()
+            self._snapshot_handle = asyncio.get_running_loop().call_later(
+                SNAPSHOT_PUBLISH_DELAY, self.publish_snapshot
+            )
+
+        if self._sync_after_quiet_period and not self._synced:
+            self._last_event = time.monotonic()
+
+            if self._sync_handle is None:
+                self._sync_handle = asyncio.get_running_loop().call_later(
+                    CLUSTER_SYNC_QUIET_PERIOD, self.check_synced
+                )
+
+    def publish_snapshot(self) -> None:
+        """Publish a new snapshot of the state of the cluster."""
+
+        self._snapshot_handle = None
+
+        self.service_state.cluster_database.publish_cluster(self.cluster_config)
+
+        CLUSTER_SNAPSHOT_LAG.labels(self.cluster_name).observe(
+            time.monotonic() - self._snapshot_scheduled
         )
-        async def trainingportals_event(event: kopf.RawEvent, **_):
-            """Handles events for training portals."""
 
-            body = xgetattr(event, "object", {})
-            metadata = xgetattr(body, "metadata", {})
-            spec = xgetattr(body, "spec", {})
-            status = xgetattr(body, "status", {})
+    def check_synced(self) -> None:
+        """Mark the cluster as synced if no events have been received during
+        the quiet period, otherwise check again at the end of the period."""
+
+        remaining = CLUSTER_SYNC_QUIET_PERIOD - (time.monotonic() - self._last_event)
+
+        if remaining > 0:
+            self._sync_handle = asyncio.get_running_loop().call_later(
+                remaining, self.check_synced
+            )
+
+        else:
+            self._sync_handle = None
+
+            self.mark_synced()
+
+    def mark_synced(self) -> None:
+        """Mark the cluster as synced, replacing any state restored for the
+        cluster from a checkpoint with the live state."""
 
-            portal_name = xgetattr(metadata, "name")
-            portal_uid = xgetattr(metadata, "uid")
+        if self._synced:
+            return
 
-            with synchronized(self.cluster_config):
-                if xgetattr(event, "type") == "DELETED":
+        self._synced = True
+
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+
+        logger.info("Initial state of cluster %s received.", self.cluster_name)
+
+        self.service_state.cluster_database.mark_cluster_synced(self.cluster_name)
+
+    def record_event_duration(self, resource: str, start_time: float) -> None:
+        """Record the time taken to process an event for a resource."""
+
+        CLUSTER_EVENT_DURATION.labels(self.cluster_name, resource).observe(
+            time.monotonic() - start_time
+        )
+
+    async def trainingportals_event(self, event: kopf.RawEvent) -> None:
+        """Handles events for training portals."""
+
+        start_time = time.monotonic()
+
+        body = xgetattr(event, "object", {})
+        metadata = xgetattr(body, "metadata", {})
+        spec = xgetattr(body, "spec", {})
+        status = xgetattr(body, "status", {})
+
+        portal_name = xgetattr(metadata, "name")
+        portal_uid = xgetattr(metadata, "uid")
+
+        cluster_database = self.service_state.cluster_database
+
+        with synchronized(self.cluster_config):
+            if xgetattr(event, "type") == "DELETED":
+                logger.info(
+                    "Discard training portal %s with uid %s of cluster %s",
+                    portal_name,
+                    portal_uid,
+                    self.cluster_name,
+                )
+
+                portal_state = self.cluster_config.get_portal(portal_name)
+
+                if portal_state:
+                    self.cluster_config.remove_portal(portal_name)
+                    cluster_database.unindex_portal(portal_state)
+
+                    portal_state.close_client_session()
+
+                    # Mark as stopped in case any workshop environments
+                    # which reference it still haven't been cleaned up.
+
+                    portal_state.phase = "Stopped"
+
+            else:
+                credentials = PortalCredentials(
+                    client_id=xgetattr(status, "educates.clients.robot.id"),
+                    client_secret=xgetattr(status, "educates.clients.robot.secret"),
+                    username=xgetattr(status, "educates.credentials.robot.username"),
+                    password=xgetattr(status, "educates.credentials.robot.password"),
+                )
+
+                portal_state = self.cluster_config.get_portal(portal_name)
+
+                if not portal_state:
                     logger.info(
-                        "Discard training portal %s with uid %s of cluster %s",
+                        "Registering training portal %s with uid %s of cluster %s",
                         portal_name,
                         portal_uid,
                         self.cluster_name,
                     )
 
+                    self.cluster_config.add_portal(
+                        TrainingPortal(
+                            cluster=self.cluster_config,
+                            name=portal_name,
+                            uid=portal_uid,
+                            generation=xgetattr(metadata, "generation"),
+                            labels=xgetattr(spec, "portal.labels", []),
+                            url=xgetattr(status, "educates.url"),
+                            phase=xgetattr(status, "educates.phase"),
+                            credentials=credentials,
+                            capacity=xgetattr(spec, "portal.sessions.maximum", 0),
+                            allocated=0,
+                        )
+                    )
+
                     portal_state = self.cluster_config.get_portal(portal_name)
 
-                    if portal_state:
-                        self.cluster_config.remove_portal(portal_name)
+                else:
+                    logger.info(
+                        "Updating training portal %s with uid %s of cluster %s",
+                        portal_name,
+                        portal_uid,
+                        self.cluster_name,
+                    )
 
-                        # Mark as stopped in case any workshop environments
-                        # which reference it still haven't been cleaned up.
+                    portal_state.uid = portal_uid
+                    portal_state.generation = xgetattr(metadata, "generation")
+                    portal_state.labels = intern_labels(
+                        xgetattr(spec, "portal.labels", [])
+                    )
+                    portal_state.phase = intern_string(
+                        xgetattr(status, "educates.phase")
+                    )
+
+                    portal_state.update_credentials(
+                        url=xgetattr(status, "educates.url"),
+                        credentials=credentials,
+                    )
 
-                        portal_state.phase = "Stopped"
+                    portal_state.capacity = xgetattr(spec, "portal.sessions.maximum", 0)
 
-                else:
-                    credentials = PortalCredentials(
-                        client_id=xgetattr(status, "educates.clients.robot.id"),
-                        client_secret=xgetattr(status, "educates.clients.robot.secret"),
-                        username=xgetattr(status, "educates.credentials.robot.username"),
-                        password=xgetattr(status, "educates.credentials.robot.password"),
+            self.check_capacity()
+
+        self.schedule_snapshot()
+
+        self.record_event_duration("trainingportals", start_time)
+
+    async def workshopenvironments_event(self, event: kopf.RawEvent) -> None:
+        """Handles events for workshop environments."""
+
+        start_time = time.monotonic()
+
+        body = xgetattr(event, "object", {})
+        metadata = xgetattr(body, "metadata", {})
+        spec = xgetattr(body, "spec", {})
+        status = xgetattr(body, "status", {})
+
+        portal_name = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/portal.name"
+        )
+        portal_uid = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/portal.uid"
+        )
+
+        environment_name = xgetattr(metadata, "name")
+        environment_uid = xgetattr(metadata, "uid")
+
+        workshop_name = xgetattr(spec, "workshop.name")
+
+        workshop_generation = xgetattr(status, "educates.workshop.generation", 0)
+        workshop_spec = xgetattr(status, "educates.workshop.spec", {})
+
+        cluster_database = self.service_state.cluster_database
+
+        with synchronized(self.cluster_config):
+            portal = self.cluster_config.get_portal(portal_name)
+
+            if xgetattr(event, "type") == "DELETED":
+                if portal:
+                    logger.info(
+                        "Discard workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                        environment_name,
+                        workshop_name,
+                        portal_name,
+                        self.cluster_name,
                     )
 
-                    portal_state = self.cluster_config.get_portal(portal_name)
+                    environment_state = portal.get_environment(environment_name)
 
-                    if not portal_state:
+                    if environment_state:
+                        cluster_database.unindex_environment(environment_state)
+
+                    portal.remove_environment(environment_name)
+
+                    if portal.phase == "Unknown" and not portal.get_environments():
                         logger.info(
-                            "Registering training portal %s with uid %s of cluster %s",
+                            "Discard unknown training portal %s with uid %s of cluster %s",
                             portal_name,
                             portal_uid,
                             self.cluster_name,
                         )
 
-                        self.cluster_config.add_portal(
-                            TrainingPortal(
-                                cluster=self.cluster_config,
-                                name=portal_name,
-                                uid=portal_uid,
-                                generation=xgetattr(metadata, "generation"),
-                                labels=xgetattr(spec, "portal.labels", []),
-                                url=xgetattr(status, "educates.url"),
-                                phase=xgetattr(status, "educates.phase"),
-                                credentials=credentials,
-                                capacity=xgetattr(spec, "portal.sessions.maximum", 0),
-                                allocated=0,
-                            )
-                        )
+                        self.cluster_config.remove_portal(portal_name)
 
-                        portal_state = self.cluster_config.get_portal(portal_name)
+                else:
+                    logger.info(
+                        "Discard workshop environment %s for workshop %s from portal %s of cluster %s as portal not found",  # pylint: disable=line-too-long
+                        environment_name,
+                        workshop_name,
+                        portal_name,
+                        self.cluster_name,
+                    )
 
-                    else:
-                        logger.info(
-                            "Updating training portal %s with uid %s of cluster %s",
-                            portal_name,
-                            portal_uid,
-                            self.cluster_name,
-                        )
+            else:
+                if not portal:
+                    logger.info(
+                        "Registering unknown training portal %s with uid %s of cluster %s",
+                        portal_name,
+                        portal_uid,
+                        self.cluster_name,
+                    )
 
-                        portal_state.uid = portal_uid
-                        portal_state.generation = xgetattr(metadata, "generation")
-                        portal_state.labels = xgetattr(spec, "portal.labels", [])
-                        portal_state.url = xgetattr(status, "educates.url")
-                        portal_state.phase = xgetattr(status, "educates.phase")
-                        portal_state.credentials = credentials
-                        portal_state.capacity = xgetattr(
-                            spec, "portal.sessions.maximum", 0
-                        )
+                    portal = TrainingPortal(
+                        cluster=self.cluster_config,
+                        name=portal_name,
+                        uid=portal_uid,
+                        generation=0,
+                        labels=[],
+                        url="",
+                        phase="Unknown",
+                        credentials=PortalCredentials(
+                            client_id="",
+                            client_secret="",
+                            username="",
+                            password="",
+                        ),
+                        capacity=0,
+                        allocated=0,
+                    )
 
-                    portal_state.recalculate_capacity()
+                    self.cluster_config.add_portal(portal)
 
-        @kopf.on.event(
-            "workshopenvironments.training.educates.dev",
-            labels={"training.educates.dev/portal.name": kopf.PRESENT},
-            registry=self.operator_registry,
+                environment_state = portal.get_environment(environment_name)
+
+                if not environment_state:
+                    logger.info(
+                        "Registering workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                        environment_name,
+                        workshop_name,
+                        portal_name,
+                        self.cluster_name,
+                    )
+
+                    environment_state = WorkshopEnvironment(
+                        portal=portal,
+                        name=environment_name,
+                        uid=environment_uid,
+                        generation=workshop_generation,
+                        workshop=workshop_name,
+                        title=xgetattr(workshop_spec, "title"),
+                        description=xgetattr(workshop_spec, "description"),
+                        labels=xgetattr(workshop_spec, "labels", []),
+                        capacity=xgetattr(status, "educates.capacity", 0),
+                        reserved=xgetattr(status, "educates.reserved", 0),
+                        allocated=0,
+                        available=0,
+                        phase=xgetattr(status, "educates.phase"),
+                    )
+
+                    portal.add_environment(environment_state)
+                    cluster_database.index_environment(environment_state)
+
+                else:
+                    logger.info(
+                        "Updating workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                        environment_name,
+                        workshop_name,
+                        portal_name,
+                        self.cluster_name,
+                    )
+
+                    environment_state.generation = workshop_generation
+                    environment_state.title = intern_string(
+                        xgetattr(workshop_spec, "title")
+                    )
+                    environment_state.description = intern_string(
+                        xgetattr(workshop_spec, "description")
+                    )
+                    environment_state.labels = intern_labels(
+                        xgetattr(workshop_spec, "labels", [])
+                    )
+
+                    environment_state.phase = intern_string(
+                        xgetattr(status, "educates.phase")
+                    )
+
+                    environment_state.capacity = xgetattr(
+                        status, "educates.capacity", 0
+                    )
+                    environment_state.reserved = xgetattr(
+                        status, "educates.reserved", 0
+                    )
+
+            self.check_capacity()
+
+        self.schedule_snapshot()
+
+        self.record_event_duration("workshopenvironments", start_time)
+
+    async def workshopsessions_event(self, event: kopf.RawEvent) -> None:
+        """Handles events for workshop sessions."""
+
+        start_time = time.monotonic()
+
+        body = xgetattr(event, "object", {})
+        metadata = xgetattr(body, "metadata", {})
+        spec = xgetattr(body, "spec", {})
+        status = xgetattr(body, "status", {})
+
+        portal_name = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/portal.name"
+        )
+        portal_uid = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/portal.uid"
         )
-        async def workshopenvironments_event(event: kopf.RawEvent, **_):
-            """Handles events for workshop environments."""
 
-            body = xgetattr(event, "object", {})
-            metadata = xgetattr(body, "metadata", {})
-            spec = xgetattr(body, "spec", {})
-            status = xgetattr(body, "status", {})
+        environment_name = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/environment.name"
+        )
+        environment_uid = xgetattr(metadata, "labels", {}).get(
+            "training.educates.dev/environment.uid"
+        )
 
-            portal_name = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/portal.name"
-            )
-            portal_uid = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/portal.uid"
-            )
+        workshop_name = xgetattr(spec, "workshop.name")
 
-            environment_name = xgetattr(metadata, "name")
-            environment_uid = xgetattr(metadata, "uid")
+        session_name = xgetattr(metadata, "name")
 
-            workshop_name = xgetattr(spec, "workshop.name")
+        cluster_database = self.service_state.cluster_database
 
-            workshop_generation = xgetattr(status, "educates.workshop.generation", 0)
-            workshop_spec = xgetattr(status, "educates.workshop.spec", {})
+        with synchronized(self.cluster_config):
+            portal = self.cluster_config.get_portal(portal_name)
 
-            with synchronized(self.cluster_config):
-                portal = self.cluster_config.get_portal(portal_name)
+            if xgetattr(event, "type") == "DELETED":
+                if portal:
+                    environment = portal.get_environment(environment_name)
 
-                if xgetattr(event, "type") == "DELETED":
-                    if portal:
+                    if environment:
                         logger.info(
-                            "Discard workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                            "Discard workshop session %s for environment %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                            session_name,
                             environment_name,
-                            workshop_name,
                             portal_name,
                             self.cluster_name,
                         )
 
-                        portal.remove_environment(environment_name)
-                        portal.recalculate_capacity()
+                        session_state = environment.get_session(session_name)
 
-                        if portal.phase == "Unknown" and not portal.get_environments():
+                        if session_state:
+                            cluster_database.unindex_session(session_state)
+
+                        environment.remove_session(session_name)
+
+                        if environment.phase == "Unknown" and not environment.get_sessions():
                             logger.info(
-                                "Discard unknown training portal %s with uid %s of cluster %s",
+                                "Discard unknown workshop environment %s from portal %s of cluster %s",  # pylint: disable=line-too-long
+                                environment_name,
                                 portal_name,
-                                portal_uid,
                                 self.cluster_name,
                             )
 
-                            self.cluster_config.remove_portal(portal_name)
+                            cluster_database.unindex_environment(environment)
+                            portal.remove_environment(environment_name)
+
+                            if portal.phase == "Unknown" and not portal.get_environments():
+                                logger.info(
+                                    "Discard unknown training portal %s with uid %s of cluster %s",
+                                    portal_name,
+                                    portal_uid,
+                                    self.cluster_name,
+                                )
+
+                                self.cluster_config.remove_portal(portal_name)
 
                     else:
                         logger.info(
-                            "Discard workshop environment %s for workshop %s from portal %s of cluster %s as portal not found",  # pylint: disable=line-too-long
+                            "Discard workshop session %s for environment %s from portal %s of cluster %s as environment not found",  # pylint: disable=line-too-long
+                            session_name,
                             environment_name,
-                            workshop_name,
                             portal_name,
                             self.cluster_name,
                         )
 
                 else:
-                    if not portal:
-                        logger.info(
-                            "Registering unknown training portal %s with uid %s of cluster %s",
-                            portal_name,
-                            portal_uid,
-                            self.cluster_name,
-                        )
+                    logger.info(
+                        "Discard workshop session %s for environment %s from portal %s of cluster %s as portal not found",  # pylint: disable=line-too-long
+                        session_name,
+                        environment_name,
+                        portal_name,
+                        self.cluster_name,
+                    )
 
-                        portal = TrainingPortal(
-                            cluster=self.cluster_config,
-                            name=portal_name,
-                            uid=portal_uid,
-                            generation=0,
-                            labels=[],
-                            url="",
-                            phase="Unknown",
-                            credentials=PortalCredentials(
-                                client_id="",
-                                client_secret="",
-                                username="",
-                                password="",
-                            ),
-                            capacity=0,
-                            allocated=0,
-                        )
+            else:
+                if not portal:
+                    logger.info(
+                        "Registering unknown training portal %s with uid %s of cluster %s",
+                        portal_name,
+                        portal_uid,
+                        self.cluster_name,
+                    )
 
-                        self.cluster_config.add_portal(portal)
+                    portal = TrainingPortal(
+                        cluster=self.cluster_config,
+                        name=portal_name,
+                        uid=portal_uid,
+                        generation=0,
+                        labels=[],
+                        url="",
+                        phase="Unknown",
+                        credentials=PortalCredentials(
+                            client_id="",
+                            client_secret="",
+                            username="",
+                            password="",
+                        ),
+                        capacity=0,
+                        allocated=0,
+                    )
 
-                    environment_state = portal.get_environment(environment_name)
+                    self.cluster_config.add_portal(portal)
 
-                    if not environment_state:
-                        logger.info(
-                            "Registering workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
-                            environment_name,
-                            workshop_name,
-                            portal_name,
-                            self.cluster_name,
-                        )
+                environment = portal.get_environment(environment_name)
 
-                        portal.add_environment(
-                            WorkshopEnvironment(
-                                portal=portal,
-                                name=environment_name,
-                                uid=environment_uid,
-                                generation=workshop_generation,
-                                workshop=workshop_name,
-                                title=xgetattr(workshop_spec, "title"),
-                                description=xgetattr(workshop_spec, "description"),
-                                labels=xgetattr(workshop_spec, "labels", []),
-                                capacity=xgetattr(status, "educates.capacity", 0),
-                                reserved=xgetattr(status, "educates.reserved", 0),
-                                allocated=0,
-                                available=0,
-                                phase=xgetattr(status, "educates.phase"),
-                            )
-                        )
+                if not environment:
+                    logger.info(
+                        "Registering unknown workshop environment %s from portal %s of cluster %s",
+                        environment_name,
+                        portal_name,
+                        self.cluster_name,
+                    )
 
-                    else:
-                        logger.info(
-                            "Updating workshop environment %s for workshop %s from portal %s of cluster %s",  # pylint: disable=line-too-long
-                            environment_name,
-                            workshop_name,
-                            portal_name,
-                            self.cluster_name,
-                        )
+                    environment = WorkshopEnvironment(
+                        portal=portal,
+                        name=environment_name,
+                        uid=environment_uid,
+                        generation=0,
+                        workshop=workshop_name,
+                        title="",
+                        description="",
+                        labels=[],
+                        capacity=0,
+                        reserved=0,
+                        allocated=0,
+                        available=0,
+                        phase="Unknown",
+                    )
 
-                        environment_state.generation = workshop_generation
-                        environment_state.title = xgetattr(workshop_spec, "title")
-                        environment_state.description = xgetattr(
-                            workshop_spec, "description"
-                        )
-                        environment_state.labels = xgetattr(workshop_spec, "labels", [])
+                    portal.add_environment(environment)
+                    cluster_database.index_environment(environment)
 
-                        environment_state.phase = xgetattr(status, "educates.phase")
+                session_state = environment.get_session(session_name)
 
-                        environment_state.capacity = xgetattr(
-                            status, "educates.capacity", 0
-                        )
-                        environment_state.reserved = xgetattr(
-                            status, "educates.reserved", 0
-                        )
+                if not session_state:
+                    logger.info(
+                        "Registering workshop session %s for environment %s from portal %s of cluster %s, where user is %r",  # pylint: disable=line-too-long
+                        session_name,
+                        environment_name,
+                        portal_name,
+                        self.cluster_name,
+                        xgetattr(status, "educates.user"),
+                    )
+
+                    session_state = WorkshopSession(
+                        environment=environment,
+                        name=session_name,
+                        generation=xgetattr(metadata, "generation"),
+                        phase=xgetattr(status, "educates.phase"),
+                        user=xgetattr(status, "educates.user"),
+                    )
 
-                    portal.recalculate_capacity()
+                    environment.add_session(session_state)
+                    cluster_database.index_session(session_state)
+
+                else:
+                    logger.info(
+                        "Updating workshop session %s for environment %s from portal %s of cluster %s, where user is %r",  # pylint: disable=line-too-long
+                        session_name,
+                        environment_name,
+                        portal_name,
+                        self.cluster_name,
+                        xgetattr(status, "educates.user"),
+                    )
+
+                    cluster_database.unindex_session(session_state)
+
+                    session_state.generation = xgetattr(metadata, "generation")
+                    session_state.user = xgetattr(status, "educates.user")
+
+                    environment.update_session_phase(
+                        session_state, xgetattr(status, "educates.phase")
+                    )
+
+                    cluster_database.index_session(session_state)
+
+            self.check_capacity()
+
+        self.schedule_snapshot()
+
+        self.record_event_duration("workshopsessions", start_time)
+
+
+class ClusterOperator(GenericOperator):
+    """Operator for interacting with training platform on separate cluster."""
+
+    def __init__(self, cluster_name: str, service_state: ServiceState) -> None:
+        """Initializes the operator."""
+
+        super().__init__(cluster_name, service_state=service_state)
+
+        self.event_processor = ClusterEventProcessor(
+            self.cluster_config, service_state, sync_after_quiet_period=True
+        )
+
+    def register_handlers(self) -> None:
+        """Register the handlers for the training platform operator."""
+
+        event_processor = self.event_processor
+
+        @kopf.on.event(
+            "trainingportals.training.educates.dev",
+            registry=self.operator_registry,
+        )
+        async def trainingportals_event(event: kopf.RawEvent, **_):
+            """Handles events for training portals."""
+
+            await event_processor.trainingportals_event(event)
+
+        @kopf.on.event(
+            "workshopenvironments.training.educates.dev",
+            labels={"training.educates.dev/portal.name": kopf.PRESENT},
+            registry=self.operator_registry,
+        )
+        async def workshopenvironments_event(event: kopf.RawEvent, **_):
+            """Handles events for workshop environments."""
+
+            await event_processor.workshopenvironments_event(event)
 
         @kopf.on.event(
             "workshopsessions.training.educates.dev",
@@ -440,186 +856,185 @@ class ClusterOperator(GenericOperator):
         async def workshopsessions_event(event: kopf.RawEvent, **_):
             """Handles events for workshop sessions."""
 
-            body = xgetattr(event, "object", {})
-            metadata = xgetattr(body, "metadata", {})
-            spec = xgetattr(body, "spec", {})
-            status = xgetattr(body, "status", {})
+            await event_processor.workshopsessions_event(event)
 
-            portal_name = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/portal.name"
-            )
-            portal_uid = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/portal.uid"
-            )
 
-            environment_name = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/environment.name"
-            )
-            environment_uid = xgetattr(metadata, "labels", {}).get(
-                "training.educates.dev/environment.uid"
-            )
+# Watch streams for remote clusters when running in multiplexed watch mode. All
+# clusters are watched from a single event loop in a shared thread.
 
-            workshop_name = xgetattr(spec, "workshop.name")
+cluster_watchers = WatchMultiplexer()
 
-            session_name = xgetattr(metadata, "name")
 
-            with synchronized(self.cluster_config):
-                portal = self.cluster_config.get_portal(portal_name)
+async def watch_cluster(cluster_config: ClusterConfig, service_state: ServiceState):
+    """Watch training portals, workshop environments and workshop sessions on
+    the cluster, passing events to the event processor for the cluster. This
+    runs until cancelled, with the client session for the cluster recreated
+    from the current kubeconfig if the credentials are rejected or the
+    watchers fail. The cluster is marked as synced once all resources have
+    first been listed."""
 
-                if xgetattr(event, "type") == "DELETED":
-                    if portal:
-                        environment = portal.get_environment(environment_name)
+    event_processor = ClusterEventProcessor(cluster_config, service_state)
 
-                        if environment:
-                            logger.info(
-                                "Discard workshop session %s for environment %s from portal %s of cluster %s",  # pylint: disable=line-too-long
-                                session_name,
-                                environment_name,
-                                portal_name,
-                                self.cluster_name,
-                            )
+    listed = set()
 
-                            environment.remove_session(session_name)
-                            portal.recalculate_capacity()
+    def resources_listed(resource: str) -> Callable[[], None]:
+        def callback() -> None:
+            listed.add(resource)
 
-                            if environment.phase == "Unknown" and not environment.get_sessions():
-                                logger.info(
-                                    "Discard unknown workshop environment %s from portal %s of cluster %s",  # pylint: disable=line-too-long
-                                    environment_name,
-                                    portal_name,
-                                    self.cluster_name,
-                                )
+            if len(listed) == 3:
+                event_processor.mark_synced()
 
-                                portal.remove_environment(environment_name)
+        return callback
 
-                                if portal.phase == "Unknown" and not portal.get_environments():
-                                    logger.info(
-                                        "Discard unknown training portal %s with uid %s of cluster %s",
-                                        portal_name,
-                                        portal_uid,
-                                        self.cluster_name,
-                                    )
+    # Resources seen so far for each type of resource. These are kept when the
+    # watchers are restarted, so that deleted events are generated for any
+    # resources deleted while the watchers were stopped.
 
-                                    self.cluster_config.remove_portal(portal_name)
+    resources: Dict[str, Dict[str, Any]] = {
+        "trainingportals": {},
+        "workshopenvironments": {},
+        "workshopsessions": {},
+    }
 
-                        else:
-                            logger.info(
-                                "Discard workshop session %s for environment %s from portal %s of cluster %s as environment not found",  # pylint: disable=line-too-long
-                                session_name,
-                                environment_name,
-                                portal_name,
-                                self.cluster_name,
-                            )
+    while True:
+        # Any other failure, such as a malformed resource or the kubeconfig
+        # for the cluster being invalid, is logged and the watchers restarted
+        # after a delay, rather than the cluster no longer being watched.
 
-                    else:
-                        logger.info(
-                            "Discard workshop session %s for environment %s from portal %s of cluster %s as portal not found",  # pylint: disable=line-too-long
-                            session_name,
-                            environment_name,
-                            portal_name,
-                            self.cluster_name,
-                        )
+        try:
+            info = create_connection_info_from_kubeconfig(cluster_config.kubeconfig)
 
-                else:
-                    if not portal:
-                        logger.info(
-                            "Registering unknown training portal %s with uid %s of cluster %s",
-                            portal_name,
-                            portal_uid,
-                            self.cluster_name,
-                        )
+            api_url = f"{info.server.rstrip('/')}/apis/training.educates.dev/v1beta1"
 
-                        portal = TrainingPortal(
-                            cluster=self.cluster_config,
-                            name=portal_name,
-                            uid=portal_uid,
-                            generation=0,
-                            labels=[],
-                            url="",
-                            phase="Unknown",
-                            credentials=PortalCredentials(
-                                client_id="",
-                                client_secret="",
-                                username="",
-                                password="",
+            logger.info("Starting watchers for cluster %s.", cluster_config.name)
+
+            async with create_client_session(info) as session:
+                tasks = [
+                    asyncio.create_task(
+                        watch_resources(
+                            session,
+                            f"{api_url}/trainingportals",
+                            event_processor.trainingportals_event,
+                            on_listed=resources_listed("trainingportals"),
+                            resources=resources["trainingportals"],
+                        )
+                    ),
+                    asyncio.create_task(
+                        watch_resources(
+                            session,
+                            f"{api_url}/workshopenvironments",
+                            event_processor.workshopenvironments_event,
+                            label_selector="training.educates.dev/portal.name",
+                            on_listed=resources_listed("workshopenvironments"),
+                            resources=resources["workshopenvironments"],
+                        )
+                    ),
+                    asyncio.create_task(
+                        watch_resources(
+                            session,
+                            f"{api_url}/workshopsessions",
+                            event_processor.workshopsessions_event,
+                            label_selector=",".join(
+                                [
+                                    "training.educates.dev/portal.name",
+                                    "training.educates.dev/environment.name",
+                                ]
                             ),
-                            capacity=0,
-                            allocated=0,
+                            on_listed=resources_listed("workshopsessions"),
+                            resources=resources["workshopsessions"],
                         )
+                    ),
+                ]
 
-                        self.cluster_config.add_portal(portal)
+                # The watchers only return if the credentials were rejected, or
+                # if they fail, in which case all watchers are stopped and
+                # restarted with a new client session.
 
-                    environment = portal.get_environment(environment_name)
+                try:
+                    done, _ = await asyncio.wait(
+                        tasks, return_when=asyncio.FIRST_EXCEPTION
+                    )
 
-                    if not environment:
-                        logger.info(
-                            "Registering unknown workshop environment %s from portal %s of cluster %s",
-                            environment_name,
-                            portal_name,
-                            self.cluster_name,
-                        )
+                finally:
+                    for task in tasks:
+                        task.cancel()
 
-                        environment = WorkshopEnvironment(
-                            portal=portal,
-                            name=environment_name,
-                            uid=environment_uid,
-                            generation=0,
-                            workshop=workshop_name,
-                            title="",
-                            description="",
-                            labels=[],
-                            capacity=0,
-                            reserved=0,
-                            allocated=0,
-                            available=0,
-                            phase="Unknown",
-                        )
+                    await asyncio.gather(*tasks, return_exceptions=True)
 
-                        portal.add_environment(environment)
+                for task in done:
+                    exc = task.exception()
 
-                    session_state = environment.get_session(session_name)
+                    if exc and not isinstance(exc, WatchUnauthorized):
+                        raise exc
 
-                    if not session_state:
-                        logger.info(
-                            "Registering workshop session %s for environment %s from portal %s of cluster %s, where user is %r",  # pylint: disable=line-too-long
-                            session_name,
-                            environment_name,
-                            portal_name,
-                            self.cluster_name,
-                            xgetattr(status, "educates.user"),
-                        )
+            logger.warning(
+                "Credentials rejected for cluster %s, restarting watchers after delay.",
+                cluster_config.name,
+            )
 
-                        environment.add_session(
-                            WorkshopSession(
-                                environment=environment,
-                                name=session_name,
-                                generation=xgetattr(metadata, "generation"),
-                                phase=xgetattr(status, "educates.phase"),
-                                user=xgetattr(status, "educates.user"),
-                            )
-                        )
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(
+                "Watchers failed for cluster %s, restarting watchers after delay.",
+                cluster_config.name,
+            )
 
-                    else:
-                        logger.info(
-                            "Updating workshop session %s for environment %s from portal %s of cluster %s, where user is %r",  # pylint: disable=line-too-long
-                            session_name,
-                            environment_name,
-                            portal_name,
-                            self.cluster_name,
-                            xgetattr(status, "educates.user"),
-                        )
+        await asyncio.sleep(WATCH_RETRY_DELAY)
+
+
+def registered_cluster_config(
+    memo: ServiceState, name: str, uid: str, retry: int
+) -> ClusterConfig:
+    """Returns the cached cluster config for the cluster config resource,
+    raising a temporary error so the daemon is retried if it hasn't yet been
+    processed and added to the cache with the same uid."""
 
-                        session_state.generation = xgetattr(metadata, "generation")
-                        session_state.phase = xgetattr(status, "educates.phase")
-                        session_state.user = xgetattr(status, "educates.user")
+    cache = memo.cluster_database
+
+    cluster_config = cache.get_cluster(name)
+
+    if not cluster_config or cluster_config.uid != uid:
+        raise kopf.TemporaryError(
+            f"Cluster {name} with uid {uid} not found.",
+            delay=5 if not retry else 15,
+        )
 
-                    portal.recalculate_capacity()
+    return cluster_config
+
+
+@kopf.daemon(
+    "clusterconfigs.lookup.educates.dev",
+    cancellation_backoff=5.0,
+    when=lambda **_: CLUSTER_WATCH_MODE == "multiplexed",
+)
+async def clusterconfigs_multiplexed_daemon(
+    stopped: kopf.DaemonStopped,
+    name: str,
+    uid: str,
+    retry: int,
+    memo: ServiceState,
+    **_,
+) -> None:
+    """Starts the watchers for each registered cluster on the event loop
+    shared by all clusters when in multiplexed watch mode, and cancels them
+    when the daemon is stopped. The daemon is asynchronous so that no thread
+    is held for each cluster while waiting to be stopped."""
+
+    cluster_config = registered_cluster_config(memo, name, uid, retry)
+
+    cluster_watchers.start(name, lambda: watch_cluster(cluster_config, memo))
+
+    try:
+        await stopped.wait()
+
+    finally:
+        cluster_watchers.stop(name)
 
 
 @kopf.daemon(
     "clusterconfigs.lookup.educates.dev",
     cancellation_backoff=5.0,
     cancellation_polling=5.0,
+    when=lambda **_: CLUSTER_WATCH_MODE != "multiplexed",
 )
 def clusterconfigs_daemon(
     stopped: kopf.DaemonStopped,
@@ -635,15 +1050,7 @@ def clusterconfigs_daemon(
     # Make sure we have separately processed the cluster config resource so
     # that an item exists for it in the cache and it has the same uid.
 
-    cache = memo.cluster_database
-
-    cluster_config = cache.get_cluster(name)
-
-    if not cluster_config or cluster_config.uid != uid:
-        raise kopf.TemporaryError(
-            f"Cluster {name} with uid {uid} not found.",
-            delay=5 if not retry else 15,
-        )
+    cluster_config = registered_cluster_config(memo, name, uid, retry)
 
     # Start the cluster operator and wait for it to complete. An infinite loop
     # is used to keep the daemon thread running until the daemon is stopped as
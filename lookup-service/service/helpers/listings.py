@@ -0,0 +1,153 @@
+"""Pagination and streaming of listings of resources returned by the HTTP API."""
+
+import base64
+import binascii
+import heapq
+import json
+from typing import Any, Callable, Iterable, Tuple, TypeVar, Union
+
+from aiohttp import web
+
+from ..config import LISTING_MAXIMUM_LIMIT
+
+T = TypeVar("T")
+
+# Size in bytes of the chunks written when streaming a listing as NDJSON. Lines
+# for records are accumulated and written in chunks rather than individually,
+# to reduce the overhead of writing to the response stream.
+
+LISTING_CHUNK_SIZE = 16 * 1024
+
+
+def encode_cursor(key: Tuple[str, ...]) -> str:
+    """Encode the sort key of the last record returned in a page of a listing
+    as an opaque cursor for requesting the next page. Padding is stripped so
+    the cursor can be used in a query string without escaping."""
+
+    encoded = base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8"))
+
+    return encoded.decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, ...]:
+    """Decode a cursor back into the sort key of the last record returned in
+    the previous page of a listing. Raises ValueError if the cursor is not
+    valid."""
+
+    try:
+        padding = "=" * (-len(cursor) % 4)
+
+        key = json.loads(base64.urlsafe_b64decode((cursor + padding).encode("ascii")))
+
+    except (UnicodeError, binascii.Error) as exc:
+        raise ValueError("Malformed cursor") from exc
+
+    if not isinstance(key, list) or not all(isinstance(item, str) for item in key):
+        raise ValueError("Malformed cursor")
+
+    return tuple(key)
+
+
+def ndjson_requested(request: web.Request) -> bool:
+    """Check whether the client requested the listing be streamed as NDJSON,
+    either using the Accept header or the format query string parameter."""
+
+    if request.query.get("format") == "ndjson":
+        return True
+
+    return "application/x-ndjson" in request.headers.get("Accept", "")
+
+
+async def listing_response(
+    request: web.Request,
+    name: str,
+    items: Iterable[T],
+    record: Callable[[T], Any],
+    key: Callable[[T], Tuple[str, ...]],
+) -> Union[web.Response, web.StreamResponse]:
+    """Return the response for a listing of resources. If the limit or cursor
+    query string parameters are supplied, only a page of the records is
+    returned, with records ordered by the sort key returned by the key
+    function, and a cursor for requesting the next page included in the
+    response if there are more records. Otherwise all records are returned in
+    the order they are supplied. If the client requested NDJSON, records are
+    streamed as they are generated, one per line, with any cursor for the next
+    page returned in the X-Next-Cursor response header. Otherwise a JSON
+    document is returned with the records in a list under the name, and any
+    cursor for the next page in the nextCursor property."""
+
+    paginated = "limit" in request.query or "cursor" in request.query
+
+    next_cursor = None
+
+    if paginated:
+        try:
+            limit = int(request.query.get("limit", LISTING_MAXIMUM_LIMIT))
+
+        except ValueError:
+            return web.Response(text="Invalid limit", status=400)
+
+        if limit <= 0:
+            return web.Response(text="Invalid limit", status=400)
+
+        limit = min(limit, LISTING_MAXIMUM_LIMIT)
+
+        after = None
+
+        if request.query.get("cursor"):
+            try:
+                after = decode_cursor(request.query["cursor"])
+
+            except ValueError:
+                return web.Response(text="Invalid cursor", status=400)
+
+        # Only the records for the page, plus one to determine whether there
+        # is a further page, are held in memory at any one time.
+
+        items = heapq.nsmallest(
+            limit + 1,
+            (item for item in items if after is None or key(item) > after),
+            key=key,
+        )
+
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = encode_cursor(key(items[-1]))
+
+    if not ndjson_requested(request):
+        data = {name: [record(item) for item in items]}
+
+        if paginated:
+            data["nextCursor"] = next_cursor
+
+        return web.json_response(data)
+
+    response = web.StreamResponse()
+    response.content_type = "application/x-ndjson"
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    await response.prepare(request)
+
+    chunk = []
+    chunk_size = 0
+
+    for item in items:
+        line = json.dumps(record(item)).encode("utf-8") + b"\n"
+
+        chunk.append(line)
+        chunk_size += len(line)
+
+        if chunk_size >= LISTING_CHUNK_SIZE:
+            await response.write(b"".join(chunk))
+
+            chunk = []
+            chunk_size = 0
+
+    if chunk:
+        await response.write(b"".join(chunk))
+
+    await response.write_eof()
+
+    return response
@@ -0,0 +1,67 @@
+"""Prometheus metrics for monitoring the performance of the lookup service."""
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Latency of HTTP API requests handled by the lookup service. The route is the
+# canonical path of the matched resource rather than the request path, so as
+# not to create a separate time series for every cluster, portal or session.
+
+HTTP_REQUEST_DURATION = Histogram(
+    "lookup_http_request_duration_seconds",
+    "Time taken to handle HTTP API requests.",
+    ["method", "route", "status"],
+)
+
+# Attempts to allocate workshop sessions from workshop environments, and the
+# outcome of each attempt. The outcome is one of "allocated" or "failed". Where
+# a hedged request allocated a workshop session which was not used, it is also
+# counted as "released" when the workshop session is terminated.
+
+ALLOCATION_ATTEMPTS = Counter(
+    "lookup_allocation_attempts_total",
+    "Attempts to allocate workshop sessions from workshop environments.",
+    ["cluster", "portal", "environment", "outcome"],
+)
+
+# Latency of HTTP requests made to training portals. The status is the HTTP
+# response status, or "error" where a connection could not be made.
+
+PORTAL_REQUEST_DURATION = Histogram(
+    "lookup_portal_request_duration_seconds",
+    "Time taken for HTTP requests made to training portals.",
+    ["cluster", "portal", "operation", "status"],
+)
+
+# Number of times the circuit for a training portal has been opened because of
+# consecutive failed requests to the portal.
+
+PORTAL_CIRCUIT_OPENED = Counter(
+    "lookup_portal_circuit_opened_total",
+    "Times the circuit for a training portal was opened after failed requests.",
+    ["cluster", "portal"],
+)
+
+# Time taken to process events for resources from remote clusters, including
+# time spent waiting on the lock for the cluster, and the delay between an
+# event being processed and the state being published to the HTTP API.
+
+CLUSTER_EVENT_DURATION = Histogram(
+    "lookup_cluster_event_duration_seconds",
+    "Time taken to process events for resources from remote clusters.",
+    ["cluster", "resource"],
+)
+
+CLUSTER_SNAPSHOT_LAG = Histogram(
+    "lookup_cluster_snapshot_lag_seconds",
+    "Delay between processing events for a cluster and publishing its state.",
+    ["cluster"],
+)
+
+# Number of items held in each database. These are updated when the metrics
+# are collected.
+
+DATABASE_ITEMS = Gauge(
+    "lookup_database_items",
+    "Number of items held in the service databases.",
+    ["database"],
+)
@@ -1,6 +1,7 @@
 """Helper functions for accessing objects."""
 
-from typing import Any
+import sys
+from typing import Any, Dict, List
 
 
 def xgetattr(obj: Any, key: str, default: Any = None) -> Any:
@@ -19,3 +20,24 @@ def xgetattr(obj: Any, key: str, default: Any = None) -> Any:
         obj = value
 
     return value
+
+
+def intern_string(value: Any) -> Any:
+    """Returns the interned copy of a string, so that strings repeated across
+    many cached objects, such as phases, workshop names and labels, are only
+    held in memory once. Values which are not strings are returned as is."""
+
+    if isinstance(value, str):
+        return sys.intern(value)
+
+    return value
+
+
+def intern_labels(labels: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Returns a copy of a list of labels, each being a dictionary with name
+    and value, with the keys and values of each label interned."""
+
+    return [
+        {intern_string(key): intern_string(value) for key, value in item.items()}
+        for item in labels
+    ]
@@ -1,34 +1,52 @@
 """Selectors for matching Kubernetes resource objects."""
 
 import fnmatch
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Pattern, Tuple, Union
 
 from ..helpers.objects import xgetattr
 
 
+def compile_glob_patterns(patterns: List[str]) -> Union[Pattern, None]:
+    """Compiles a list of glob patterns into a single regular expression which
+    will match a string if any of the glob patterns match. If the list of glob
+    patterns is empty, None is returned."""
+
+    if not patterns:
+        return None
+
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+
+
 @dataclass
 class NameSelector:
-    """Selector for matching Kubernetes resource objects by name."""
+    """Selector for matching Kubernetes resource objects by name. The list of
+    glob patterns for names is compiled into a single regular expression when
+    the selector is created."""
 
     match_names: List[str]
+    name_pattern: Union[Pattern, None] = field(init=False, repr=False)
 
-    def match_resource(self, resource: Dict[str, Any]) -> bool:
-        """Check if a resource matches the selector. Note that if the list of
-        names is empty, then the selector will match all resources. When
-        matching names we actually use a glob expression."""
+    def __post_init__(self) -> None:
+        self.name_pattern = compile_glob_patterns(self.match_names)
 
-        if not self.match_names:
+    def match_name(self, name: str) -> bool:
+        """Check if a name matches the selector. Note that if the list of names
+        is empty, then the selector will match all names."""
+
+        if self.name_pattern is None:
             return True
 
-        name = xgetattr(resource, "metadata.name")
+        return self.name_pattern.match(name) is not None
 
-        for pattern in self.match_names:
-            if fnmatch.fnmatch(name, pattern):
-                return True
+    def match_resource(self, resource: Dict[str, Any]) -> bool:
+        """Check if a resource matches the selector. Note that if the list of
+        names is empty, then the selector will match all resources. When
+        matching names we actually use a glob expression."""
 
-        return False
+        return self.match_name(xgetattr(resource, "metadata.name"))
 
 
 class Operator(Enum):
@@ -50,50 +68,72 @@ class LabelSelectorRequirement:
     operator: Operator
     values: List[str]
 
-    def match_resource(self, resource: Dict[str, Any]) -> bool:
-        """Check if a resource matches the selector."""
-
-        labels = xgetattr(resource, "metadata.labels", {})
+    def predicate(self) -> Callable[[Dict[str, str]], bool]:
+        """Returns a function which checks if a set of labels matches the
+        requirement."""
 
-        value = labels.get(self.key)
+        key = self.key
+        values = frozenset(self.values or [])
 
         if self.operator == Operator.IN:
-            return value in self.values
-        elif self.operator == Operator.NOT_IN:
-            return value not in self.values
-        elif self.operator == Operator.EXISTS:
-            return value is not None
-        elif self.operator == Operator.DOES_NOT_EXIST:
-            return value is None
+            return lambda labels: labels.get(key) in values
+        if self.operator == Operator.NOT_IN:
+            return lambda labels: labels.get(key) not in values
+        if self.operator == Operator.EXISTS:
+            return lambda labels: labels.get(key) is not None
+        if self.operator == Operator.DOES_NOT_EXIST:
+            return lambda labels: labels.get(key) is None
 
-        return False
+        return lambda labels: False
+
+    def match_resource(self, resource: Dict[str, Any]) -> bool:
+        """Check if a resource matches the selector."""
+
+        return self.predicate()(xgetattr(resource, "metadata.labels", {}))
 
 
 @dataclass
 class LabelSelector:
-    """selector for matching Kubernetes resource objects by label."""
+    """selector for matching Kubernetes resource objects by label. The label
+    key/value pairs and label expressions are compiled into a flat list of
+    predicates when the selector is created."""
 
     match_labels: Dict[str, str]
     match_expressions: List[LabelSelectorRequirement]
+    predicates: Tuple[Callable[[Dict[str, str]], bool], ...] = field(
+        init=False, repr=False
+    )
 
-    def match_resource(self, resource: Dict[str, Any]) -> bool:
-        """Check if a resource matches the selector."""
+    def __post_init__(self) -> None:
+        # First add checks that labels match by key/value pairs, then checks
+        # for the label expressions. If both are empty, then the selector will
+        # match all resources.
 
-        # First check if labels match by key/value pairs. If the set of labels
-        # is empty, then the selector will match all resources, but will still
-        # need to go on and check the label expressions.
+        predicates = []
 
-        labels = xgetattr(resource, "metadata.labels", {})
+        for key, value in self.match_labels.items():
+            predicates.append(
+                lambda labels, key=key, value=value: labels.get(key) == value
+            )
 
-        if not all(
-            labels.get(key) == value for key, value in self.match_labels.items()
-        ):
-            return False
+        for expr in self.match_expressions:
+            predicates.append(expr.predicate())
 
-        # Now check list of label expressions. If this list is empty, then it
-        # will match all resources.
+        self.predicates = tuple(predicates)
 
-        return all(expr.match_resource(resource) for expr in self.match_expressions)
+    def match_labels_dict(self, labels: Dict[str, str]) -> bool:
+        """Check if a set of labels matches the selector."""
+
+        for predicate in self.predicates:
+            if not predicate(labels):
+                return False
+
+        return True
+
+    def match_resource(self, resource: Dict[str, Any]) -> bool:
+        """Check if a resource matches the selector."""
+
+        return self.match_labels_dict(xgetattr(resource, "metadata.labels", {}))
 
 
 def convert_to_name_selector(name_selector_dict: dict) -> NameSelector:
@@ -138,9 +178,19 @@ class ResourceSelector:
             selector.get("labelSelector", {})
         )
 
+    def match(self, name: str, labels: Dict[str, str]) -> bool:
+        """Check if a resource with the given name and labels matches the
+        selector. This avoids the need to construct a resource object when the
+        name and labels are already known."""
+
+        return self.name_selector.match_name(
+            name
+        ) and self.label_selector.match_labels_dict(labels)
+
     def match_resource(self, resource: Dict[str, Any]) -> bool:
         """Check if a resource matches the selector."""
 
-        return self.name_selector.match_resource(
-            resource
-        ) and self.label_selector.match_resource(resource)
+        return self.match(
+            xgetattr(resource, "metadata.name"),
+            xgetattr(resource, "metadata.labels", {}),
+        )
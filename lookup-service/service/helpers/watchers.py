@@ -0,0 +1,341 @@
+"""Lightweight watch streams for Kubernetes resources. These allow resources in
+many clusters to be watched from a single event loop, rather than running a
+separate kopf operator instance in its own thread for each cluster."""
+
+import asyncio
+import base64
+import contextlib
+import json
+import logging
+import os
+import ssl
+import tempfile
+import threading
+from typing import Any, Awaitable, Callable, Dict, Union
+
+import aiohttp
+import kopf
+
+from .objects import xgetattr
+
+logger = logging.getLogger("educates")
+
+
+# Timeout in seconds requested of the Kubernetes API server for each watch
+# request. When the timeout expires the watch is restarted from the last
+# resource version seen.
+
+WATCH_TIMEOUT = 5 * 60
+
+# Delay in seconds before retrying after a failure to list or watch resources.
+
+WATCH_RETRY_DELAY = 5.0
+
+
+class WatchUnauthorized(Exception):
+    """Raised when requests to the Kubernetes API server are rejected due to
+    the credentials used, in which case new credentials should be obtained."""
+
+
+def create_ssl_context(info: kopf.ConnectionInfo) -> ssl.SSLContext:
+    """Create the SSL context for connecting to the Kubernetes API server. The
+    certificate data is base64 encoded as found in a kubeconfig file."""
+
+    context = ssl.create_default_context()
+
+    if info.insecure:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    elif info.ca_data:
+        context.load_verify_locations(
+            cadata=base64.b64decode(info.ca_data).decode("ascii")
+        )
+
+    # The client certificate and key can only be loaded from files, so they are
+    # written to a temporary directory which is removed once they are loaded.
+
+    if info.certificate_data and info.private_key_data:
+        with tempfile.TemporaryDirectory() as directory:
+            certificate_path = os.path.join(directory, "tls.crt")
+            private_key_path = os.path.join(directory, "tls.key")
+
+            with open(certificate_path, "wb") as f:
+                f.write(base64.b64decode(info.certificate_data))
+
+            with open(private_key_path, "wb") as f:
+                f.write(base64.b64decode(info.private_key_data))
+
+            context.load_cert_chain(certificate_path, private_key_path)
+
+    return context
+
+
+def create_client_session(info: kopf.ConnectionInfo) -> aiohttp.ClientSession:
+    """Create an HTTP client session for making requests against the
+    Kubernetes API server. Must be called from within the event loop the
+    client session is to be used from."""
+
+    headers = {}
+    auth = None
+
+    if info.token:
+        headers["Authorization"] = f"Bearer {info.token}"
+
+    elif info.username and info.password:
+        auth = aiohttp.BasicAuth(info.username, info.password)
+
+    return aiohttp.ClientSession(
+        headers=headers,
+        auth=auth,
+        connector=aiohttp.TCPConnector(ssl=create_ssl_context(info)),
+        timeout=aiohttp.ClientTimeout(connect=60, sock_read=WATCH_TIMEOUT + 30),
+    )
+
+
+async def dispatch_event(
+    handler: Callable[[Dict[str, Any]], Awaitable[None]], event: Dict[str, Any]
+) -> None:
+    """Call the handler with the event, logging any error raised by the handler
+    so that it doesn't stop the watch, as done by kopf."""
+
+    try:
+        await handler(event)
+
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Handler failed for %s event on %s.",
+            event.get("type"),
+            xgetattr(event, "object.metadata.name"),
+        )
+
+
+async def watch_resources(
+    session: aiohttp.ClientSession,
+    url: str,
+    handler: Callable[[Dict[str, Any]], Awaitable[None]],
+    *,
+    label_selector: str = "",
+    on_listed: Union[Callable[[], None], None] = None,
+    resources: Union[Dict[str, Dict[str, Any]], None] = None,
+) -> None:
+    """Watch resources at the API URL, calling the handler with each event.
+    The resources are first listed, with the handler called for each with an
+    event type of None, as done by kopf. The resources are then watched from
+    the resource version of the list. If the resource version has expired,
+    the resources are listed again, with a deleted event generated for any
+    resource seen previously which no longer exists. If supplied, on_listed is
+    called after the handler has been called for each listed resource. If
+    supplied, resources is used to hold the resources seen so far, so it can
+    be kept when the watch is restarted. Raises WatchUnauthorized if the
+    credentials are rejected, otherwise runs until cancelled."""
+
+    # Resources seen so far, indexed by name, so that deleted events can be
+    # generated for resources deleted while resources weren't being watched.
+
+    if resources is None:
+        resources = {}
+
+    params = {"labelSelector": label_selector} if label_selector else {}
+
+    while True:
+        try:
+            # List the resources to get the current set of resources and the
+            # resource version to start watching from.
+
+            async with session.get(url, params=params) as response:
+                if response.status in (401, 403):
+                    raise WatchUnauthorized(f"Unable to list {url}.")
+
+                response.raise_for_status()
+
+                data = await response.json()
+
+            resource_version = data["metadata"]["resourceVersion"]
+
+            listed = {}
+
+            for item in data.get("items", []):
+                listed[item["metadata"]["name"]] = item
+
+            for name in list(resources):
+                if name not in listed:
+                    await dispatch_event(
+                        handler, {"type": "DELETED", "object": resources.pop(name)}
+                    )
+
+            for name, item in listed.items():
+                resources[name] = item
+
+                await dispatch_event(handler, {"type": None, "object": item})
+
+            if on_listed:
+                on_listed()
+
+            # Watch for changes until the resource version expires.
+
+            while resource_version:
+                resource_version = await watch_resources_from(
+                    session, url, params, resource_version, resources, handler
+                )
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+            logger.warning(
+                "Failed to watch %s, retrying after delay: %s", url, exc or type(exc)
+            )
+
+            await asyncio.sleep(WATCH_RETRY_DELAY)
+
+
+async def watch_resources_from(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: Dict[str, str],
+    resource_version: str,
+    resources: Dict[str, Dict[str, Any]],
+    handler: Callable[[Dict[str, Any]], Awaitable[None]],
+) -> Union[str, None]:
+    """Watch resources from the resource version for a single watch request,
+    returning the last resource version seen, or None if the resource version
+    has expired and resources need to be listed again."""
+
+    params = {
+        **params,
+        "watch": "true",
+        "resourceVersion": resource_version,
+        "allowWatchBookmarks": "true",
+        "timeoutSeconds": str(WATCH_TIMEOUT),
+    }
+
+    async with session.get(url, params=params) as response:
+        if response.status in (401, 403):
+            raise WatchUnauthorized(f"Unable to watch {url}.")
+
+        if response.status == 410:
+            return None
+
+        response.raise_for_status()
+
+        # Events are separated by newlines. Events can be larger than the line
+        # length limit of the aiohttp stream reader, so are split here.
+
+        buffer = b""
+
+        async for chunk in response.content.iter_any():
+            buffer += chunk
+
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+
+                if not line.strip():
+                    continue
+
+                event = json.loads(line)
+
+                event_type = event.get("type")
+                event_object = event.get("object") or {}
+
+                if event_type == "ERROR":
+                    if event_object.get("code") == 410:
+                        return None
+
+                    raise aiohttp.ClientError(event_object.get("message"))
+
+                resource_version = (
+                    xgetattr(event_object, "metadata.resourceVersion")
+                    or resource_version
+                )
+
+                if event_type == "BOOKMARK":
+                    continue
+
+                name = event_object["metadata"]["name"]
+
+                if event_type == "DELETED":
+                    resources.pop(name, None)
+
+                else:
+                    resources[name] = event_object
+
+                await dispatch_event(handler, event)
+
+    return resource_version
+
+
+class WatchMultiplexer:
+    """Runs watch tasks for many clusters on a single event loop in a shared
+    background thread. Tasks are started and cancelled by name, and can be
+    managed from any thread."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._event_loop = None
+        self._thread = None
+        self._tasks = {}
+
+    def event_loop(self) -> asyncio.AbstractEventLoop:
+        """Return the shared event loop, starting the background thread which
+        runs it if this is the first use."""
+
+        with self._lock:
+            if self._event_loop is None:
+                self._event_loop = asyncio.new_event_loop()
+
+                self._thread = threading.Thread(
+                    target=self._event_loop.run_forever,
+                    name="cluster-watchers",
+                    daemon=True,
+                )
+
+                self._thread.start()
+
+            return self._event_loop
+
+    def start(self, name: str, factory: Callable[[], Awaitable[None]]) -> None:
+        """Start the task returned by the factory under the name, cancelling
+        any task already running under the same name."""
+
+        event_loop = self.event_loop()
+
+        def start_task() -> None:
+            previous = self._tasks.pop(name, None)
+
+            if previous:
+                previous.cancel()
+
+            task = event_loop.create_task(self.run(name, factory))
+
+            self._tasks[name] = task
+
+            task.add_done_callback(lambda _: self.discard(name, task))
+
+        event_loop.call_soon_threadsafe(start_task)
+
+    def stop(self, name: str) -> None:
+        """Cancel the task running under the name."""
+
+        event_loop = self.event_loop()
+
+        def cancel_task() -> None:
+            task = self._tasks.pop(name, None)
+
+            if task:
+                task.cancel()
+
+        event_loop.call_soon_threadsafe(cancel_task)
+
+    def discard(self, name: str, task: asyncio.Task) -> None:
+        """Discard the task if it is still the one running under the name."""
+
+        if self._tasks.get(name) is task:
+            del self._tasks[name]
+
+    async def run(self, name: str, factory: Callable[[], Awaitable[None]]) -> None:
+        """Run the task, logging if it fails."""
+
+        with contextlib.suppress(asyncio.CancelledError):
+            try:
+                await factory()
+
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Watch task %s failed.", name)
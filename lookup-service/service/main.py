@@ -12,7 +12,9 @@ import aiohttp
 import kopf
 import pykube
 
+from .caches.checkpoints import load_checkpoint, save_checkpoint
 from .caches.databases import client_database, cluster_database, tenant_database
+from .config import CHECKPOINT_INTERVAL, CHECKPOINT_PATH, CHECKPOINT_STALE_TIMEOUT
 from .handlers import clients as _  # pylint: disable=unused-import
 from .handlers import clusters as _  # pylint: disable=unused-import
 from .handlers import tenants as _  # pylint: disable=unused-import
@@ -89,6 +91,8 @@ _kopf_main_event_loop = None  # pylint: disable=invalid-name
 _aiohttp_main_process_thread = None  # pylint: disable=invalid-name
 _aiohttp_main_event_loop = None  # pylint: disable=invalid-name
 
+_checkpoint_process_thread = None  # pylint: disable=invalid-name
+
 _shutdown_server_process_flag = threading.Event()
 
 
@@ -166,15 +170,23 @@ def run_kopf() -> threading.Thread:
     return thread
 
 
-def run_aiohttp() -> threading.Thread:
-    """Run aiohttp in a separate thread."""
+def create_aiohttp_app(state: ServiceState) -> aiohttp.web.Application:
+    """Create the aiohttp application for handling REST API requests."""
 
     aiohttp_app = aiohttp.web.Application()
 
-    aiohttp_app["service_state"] = service_state
+    aiohttp_app["service_state"] = state
 
     register_routes(aiohttp_app)
 
+    return aiohttp_app
+
+
+def run_aiohttp() -> threading.Thread:
+    """Run aiohttp in a separate thread."""
+
+    aiohttp_app = create_aiohttp_app(service_state)
+
     runner = aiohttp.web.AppRunner(aiohttp_app)
 
     async def wait_for_process_shutdown() -> None:
@@ -219,6 +231,37 @@ def run_aiohttp() -> threading.Thread:
     return thread
 
 
+def run_checkpoints() -> threading.Thread:
+    """Run saving of checkpoints of the state of clusters in a separate thread.
+    A checkpoint is saved periodically and a final checkpoint saved when the
+    server process is shutdown. Any state restored for clusters which has not
+    been replaced by live state within the stale timeout is also discarded."""
+
+    def save() -> None:
+        try:
+            save_checkpoint(cluster_database, CHECKPOINT_PATH)
+
+        except OSError:
+            logger.exception("Unable to save checkpoint %s.", CHECKPOINT_PATH)
+
+    def worker_thread() -> None:
+        """Worker thread for saving checkpoints."""
+
+        while not _shutdown_server_process_flag.wait(CHECKPOINT_INTERVAL):
+            cluster_database.expire_provisional_clusters(CHECKPOINT_STALE_TIMEOUT)
+
+            save()
+
+        save()
+
+    # Start saving checkpoints in a separate thread.
+
+    thread = threading.Thread(target=worker_thread)
+    thread.start()
+
+    return thread
+
+
 # Main entry point for the educates operator. This will start the kopf operator
 # framework and the HTTP server.
 
@@ -238,14 +281,30 @@ if __name__ == "__main__":
 
     register_signal_handlers()
 
+    # Restore the state of clusters saved prior to the service being restarted
+    # so it can be used until the live state of each cluster is received.
+
+    if CHECKPOINT_PATH:
+        logger.info(
+            "Restored %s clusters from checkpoint %s.",
+            load_checkpoint(cluster_database, CHECKPOINT_PATH),
+            CHECKPOINT_PATH,
+        )
+
     # Start the kopf framework and HTTP server threads.
 
     _kopf_main_process_thread = run_kopf()
     _aiohttp_main_process_thread = run_aiohttp()
 
+    if CHECKPOINT_PATH:
+        _checkpoint_process_thread = run_checkpoints()
+
     # Wait for the kopf framework and HTTP server threads to complete. This
     # will block until the threads are finished which will only occur when the
     # shutdown process signal is received.
 
     _kopf_main_process_thread.join()
     _aiohttp_main_process_thread.join()
+
+    if _checkpoint_process_thread:
+        _checkpoint_process_thread.join()
@@ -2,12 +2,18 @@
 
 from aiohttp import web
 
-from . import authnz, clients, clusters, portals, tenants, workshops
+from . import authnz, catalogs, clients, clusters, metrics, portals, tenants, workshops
 
 
 def register_routes(app: web.Application) -> None:
     """Register the HTTP API routes with the application."""
 
+    # Register metrics middleware/routes. This is registered first so that
+    # the time taken by the other middleware is included.
+
+    app.middlewares.extend(metrics.middlewares)
+    app.add_routes(metrics.routes)
+
     # Register authentication and authorization middleware/routes.
 
     app.middlewares.extend(authnz.middlewares)
@@ -20,3 +26,11 @@ def register_routes(app: web.Application) -> None:
     app.add_routes(portals.routes)
     app.add_routes(tenants.routes)
     app.add_routes(workshops.routes)
+
+    # Register the hooks and routes for watching for changes to workshop
+    # catalogs.
+
+    app.on_startup.extend(catalogs.on_startup)
+    app.on_shutdown.extend(catalogs.on_shutdown)
+
+    app.add_routes(catalogs.routes)
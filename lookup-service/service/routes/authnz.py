@@ -70,15 +70,41 @@ async def jwt_token_middleware(
         if parts[0].lower() != "bearer":
             return web.Response(text="Invalid Authorization header", status=400)
 
-        # Decode the JWT token passed in the Authorization header.
+        token = parts[1]
 
-        try:
-            token = parts[1]
-            decoded_token = decode_client_token(token)
-        except jwt.ExpiredSignatureError:
-            return web.Response(text="JWT token has expired", status=401)
-        except jwt.InvalidTokenError:
-            return web.Response(text="JWT token is invalid", status=401)
+        # Check whether the JWT token has already been verified as having been
+        # issued to a client, and the tokens for the client haven't since been
+        # revoked. If it has, the cached claims and client are used.
+
+        service_state = request.app["service_state"]
+        client_database = service_state.client_database
+
+        verified_token = client_database.get_verified_token(token)
+
+        if verified_token:
+            decoded_token = verified_token.claims
+
+            request["verified_client"] = verified_token.client
+
+        else:
+            # Decode the JWT token passed in the Authorization header.
+
+            try:
+                decoded_token = decode_client_token(token)
+            except jwt.ExpiredSignatureError:
+                return web.Response(text="JWT token has expired", status=401)
+            except jwt.InvalidTokenError:
+                return web.Response(text="JWT token is invalid", status=401)
+
+            # Cache the decoded token if it was issued to a current client so
+            # it doesn't need to be decoded again for subsequent requests.
+
+            client = client_database.get_client(decoded_token["sub"])
+
+            if client and client.validate_identity(decoded_token["jti"]):
+                client_database.add_verified_token(token, decoded_token, client)
+
+                request["verified_client"] = client
 
         # Store the decoded token in the request object for later use.
 
@@ -101,6 +127,16 @@ def login_required(handler: Callable[..., web.Response]) -> web.Response:
 
         decoded_token = request["jwt_token"]
 
+        # If the token was already verified against the client when it was
+        # decoded, use that client.
+
+        client = request.get("verified_client")
+
+        if client:
+            request["remote_client"] = client
+
+            return await handler(request)
+
         # Check the client database for the client by the name of the client
         # taken from the JWT token subject. Then check if the identity of the
         # client is still the same as the one recorded in the JWT token.
@@ -0,0 +1,358 @@
+"""REST API handlers for watching for changes to the workshop catalog."""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Set, Tuple, Union
+
+from aiohttp import web
+
+from ..helpers.listings import ndjson_requested
+from .authnz import login_required, roles_accepted
+
+logger = logging.getLogger("educates")
+
+
+# Interval in seconds at which the workshop catalogs being watched are checked
+# for changes when no new snapshot has been published, so that changes to the
+# configuration of tenants are picked up, and at which keepalive messages are
+# sent to clients so idle connections aren't closed by proxies.
+
+CATALOG_WATCH_INTERVAL = 30.0
+
+# Maximum number of events queued for a client which are yet to be written to
+# the connection. If a client doesn't keep up, it is disconnected and needs to
+# watch again, at which point it will be sent the current workshop catalog.
+
+CATALOG_WATCH_QUEUE_SIZE = 1000
+
+
+class CatalogFeed:
+    """Tracks the workshop catalog for a tenant, or for all portals where no
+    tenant is specified, generating events for workshops added, modified or
+    deleted, and passing them to each of the clients watching the catalog."""
+
+    def __init__(self, tenant_name: Union[str, None]) -> None:
+        self.tenant_name = tenant_name
+        self.workshops: Dict[str, Dict[str, Any]] = {}
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def current_workshops(self, service_state) -> Dict[str, Dict[str, Any]]:
+        """Return the workshops provided by the running workshop environments
+        of the portals accessible by the tenant, along with the total capacity
+        and number of allocated workshop sessions across those environments."""
+
+        snapshot = service_state.cluster_database.snapshot
+
+        if self.tenant_name:
+            tenant = service_state.tenant_database.get_tenant(self.tenant_name)
+
+            if not tenant:
+                return {}
+
+            portals = tenant.portals_which_are_accessible()
+
+        else:
+            portals = snapshot.get_all_portals()
+
+        # As with the workshop catalog, the title and description are taken
+        # from the last workshop environment found for a workshop, so these
+        # are expected to be consistent across portals.
+
+        workshops = {}
+
+        for portal in portals:
+            for environment in snapshot.get_running_environments(portal):
+                workshop = workshops.setdefault(
+                    environment.workshop,
+                    {"name": environment.workshop, "capacity": 0, "allocated": 0},
+                )
+
+                workshop["title"] = environment.title
+                workshop["description"] = environment.description
+                workshop["labels"] = list(environment.labels)
+                workshop["capacity"] += environment.capacity
+                workshop["allocated"] += environment.allocated
+
+        return workshops
+
+    def refresh(self, service_state) -> None:
+        """Check for changes to the workshop catalog, passing events for any
+        workshops added, modified or deleted to each of the clients."""
+
+        workshops = self.current_workshops(service_state)
+
+        events: List[Tuple[str, Dict[str, Any]]] = []
+
+        for name, workshop in workshops.items():
+            previous = self.workshops.get(name)
+
+            if previous is None:
+                events.append(("ADDED", workshop))
+
+            elif previous != workshop:
+                events.append(("MODIFIED", workshop))
+
+        for name, workshop in self.workshops.items():
+            if name not in workshops:
+                events.append(("DELETED", workshop))
+
+        self.workshops = workshops
+
+        for event in events:
+            self.publish(event)
+
+    def publish(self, event: Union[Tuple[str, Dict[str, Any]], None]) -> None:
+        """Pass the event to each of the clients, disconnecting any client
+        which isn't keeping up. An event of None indicates that clients should
+        be disconnected."""
+
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+
+            except asyncio.QueueFull:
+                logger.warning(
+                    "Disconnecting client watching workshops for tenant %r as not keeping up.",  # pylint: disable=line-too-long
+                    self.tenant_name,
+                )
+
+                self.subscribers.discard(queue)
+
+                # Make room for the event telling the client to disconnect.
+
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Add a client, returning the queue the client will receive events
+        through. This is primed with an event for each workshop currently in
+        the workshop catalog."""
+
+        queue = asyncio.Queue(maxsize=CATALOG_WATCH_QUEUE_SIZE)
+
+        for workshop in list(self.workshops.values())[:CATALOG_WATCH_QUEUE_SIZE]:
+            queue.put_nowait(("ADDED", workshop))
+
+        self.subscribers.add(queue)
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """Remove a client."""
+
+        self.subscribers.discard(queue)
+
+
+class CatalogWatcher:
+    """Maintains the feeds of changes to the workshop catalogs being watched by
+    clients. New snapshots of clusters are published from the operator threads,
+    so notifications of these are passed to the event loop of the HTTP server,
+    where a single task checks the feeds for changes. Notifications received
+    while the feeds are being checked are coalesced, so the feeds are checked
+    at most once for each batch of snapshots published."""
+
+    def __init__(self, service_state) -> None:
+        self.service_state = service_state
+        self.feeds: Dict[Union[str, None], CatalogFeed] = {}
+        self.event_loop = None
+        self.changed = None
+        self.task = None
+
+    def start(self) -> None:
+        """Start the task which checks the feeds for changes. Must be called
+        from the event loop of the HTTP server."""
+
+        self.event_loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+        self.task = self.event_loop.create_task(self.run())
+
+        self.service_state.cluster_database.add_snapshot_listener(self.notify)
+
+    async def stop(self) -> None:
+        """Stop the task which checks the feeds for changes, disconnecting all
+        clients."""
+
+        self.service_state.cluster_database.remove_snapshot_listener(self.notify)
+
+        if self.task:
+            self.task.cancel()
+
+        for feed in self.feeds.values():
+            feed.publish(None)
+
+        self.feeds.clear()
+
+    def notify(self) -> None:
+        """Called when a new snapshot is published, from whichever thread
+        published it. The event loop may already have been closed if the HTTP
+        server is shutting down, in which case the notification is ignored."""
+
+        try:
+            self.event_loop.call_soon_threadsafe(self.changed.set)
+
+        except RuntimeError:
+            pass
+
+    async def run(self) -> None:
+        """Check the feeds for changes each time a new snapshot is published,
+        or after an interval if no new snapshot has been published."""
+
+        while True:
+            try:
+                await asyncio.wait_for(self.changed.wait(), CATALOG_WATCH_INTERVAL)
+
+            except asyncio.TimeoutError:
+                pass
+
+            self.changed.clear()
+
+            for feed in list(self.feeds.values()):
+                try:
+                    feed.refresh(self.service_state)
+
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception(
+                        "Failed to check workshop catalog for tenant %r.",
+                        feed.tenant_name,
+                    )
+
+    def subscribe(self, tenant_name: Union[str, None]) -> asyncio.Queue:
+        """Add a client watching the workshop catalog for the tenant."""
+
+        feed = self.feeds.get(tenant_name)
+
+        if feed is None:
+            feed = CatalogFeed(tenant_name)
+            feed.refresh(self.service_state)
+
+            self.feeds[tenant_name] = feed
+
+        return feed.subscribe()
+
+    def unsubscribe(self, tenant_name: Union[str, None], queue: asyncio.Queue) -> None:
+        """Remove a client watching the workshop catalog for the tenant,
+        discarding the feed if there are no other clients."""
+
+        feed = self.feeds.get(tenant_name)
+
+        if feed:
+            feed.unsubscribe(queue)
+
+            if not feed.subscribers:
+                del self.feeds[tenant_name]
+
+
+def format_event(event: Tuple[str, Dict[str, Any]], ndjson: bool) -> bytes:
+    """Format an event for a change to the workshop catalog, either as a line
+    of NDJSON, or as a server-sent event."""
+
+    event_type, workshop = event
+
+    if ndjson:
+        data = json.dumps({"type": event_type, "workshop": workshop})
+
+        return f"{data}\n".encode("utf-8")
+
+    data = json.dumps(workshop)
+
+    return f"event: {event_type}\ndata: {data}\n\n".encode("utf-8")
+
+
+@login_required
+@roles_accepted("admin", "tenant")
+async def api_get_v1_workshops_watch(request: web.Request) -> web.StreamResponse:
+    """Watch for changes to the workshops available. An event is first sent for
+    each workshop currently available, followed by events as workshops are
+    added, modified or deleted. Events are sent as server-sent events, unless
+    the client requested NDJSON."""
+
+    service_state = request.app["service_state"]
+    tenant_database = service_state.tenant_database
+
+    # Get the tenant name from the query parameters. This is required when
+    # the client role is "tenant".
+
+    tenant_name = request.query.get("tenant")
+
+    client = request["remote_client"]
+    client_roles = request["client_roles"]
+
+    if "tenant" in client_roles:
+        if not tenant_name:
+            logger.warning(
+                "Missing tenant name in request from client %r.", client.name
+            )
+
+            return web.Response(text="Missing tenant name", status=400)
+
+        if not client.allowed_access_to_tenant(tenant_name):
+            return web.Response(text="Client not allowed access to tenant", status=403)
+
+    if tenant_name and not tenant_database.get_tenant(tenant_name):
+        return web.Response(text="Tenant not available", status=503)
+
+    ndjson = ndjson_requested(request)
+
+    response = web.StreamResponse()
+
+    if ndjson:
+        response.content_type = "application/x-ndjson"
+    else:
+        response.content_type = "text/event-stream"
+        response.headers["Cache-Control"] = "no-cache"
+
+    await response.prepare(request)
+
+    catalog_watcher = request.app["catalog_watcher"]
+
+    queue = catalog_watcher.subscribe(tenant_name)
+
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), CATALOG_WATCH_INTERVAL)
+
+            except asyncio.TimeoutError:
+                await response.write(b"\n" if ndjson else b": keepalive\n\n")
+
+                continue
+
+            if event is None:
+                break
+
+            await response.write(format_event(event, ndjson))
+
+    finally:
+        catalog_watcher.unsubscribe(tenant_name, queue)
+
+    await response.write_eof()
+
+    return response
+
+
+async def start_catalog_watcher(app: web.Application) -> None:
+    """Start watching for changes to workshop catalogs when the HTTP server
+    starts."""
+
+    app["catalog_watcher"] = CatalogWatcher(app["service_state"])
+    app["catalog_watcher"].start()
+
+
+async def stop_catalog_watcher(app: web.Application) -> None:
+    """Stop watching for changes to workshop catalogs when the HTTP server is
+    shutting down, disconnecting any clients."""
+
+    await app["catalog_watcher"].stop()
+
+
+# Set up the startup and shutdown hooks and routes for watching workshop
+# catalogs.
+
+on_startup = [start_catalog_watcher]
+
+on_shutdown = [stop_catalog_watcher]
+
+routes = [
+    web.get("/api/v1/workshops/watch", api_get_v1_workshops_watch),
+]
@@ -1,9 +1,52 @@
 """REST API handlers for cluster management."""
 
+from typing import Any, Dict
+
 import yaml
 from aiohttp import web
 
+from ..caches.environments import WorkshopEnvironment
+from ..caches.sessions import WorkshopSession
+from ..helpers.listings import listing_response
 from .authnz import login_required, roles_accepted
+from .portals import portal_record
+
+
+def environment_record(environment: WorkshopEnvironment) -> Dict[str, Any]:
+    """Return the details of a workshop environment as returned by the HTTP
+    API."""
+
+    return {
+        "name": environment.name,
+        "uid": environment.uid,
+        "generation": environment.generation,
+        "workshop": environment.workshop,
+        "title": environment.title,
+        "description": environment.description,
+        "labels": environment.labels,
+        "cluster": environment.portal.cluster.name,
+        "portal": environment.portal.name,
+        "capacity": environment.capacity,
+        "reserved": environment.reserved,
+        "allocated": environment.allocated,
+        "available": environment.available,
+        "phase": environment.phase,
+    }
+
+
+def session_record(session: WorkshopSession) -> Dict[str, Any]:
+    """Return the details of a workshop session as returned by the HTTP API."""
+
+    return {
+        "name": session.name,
+        "generation": session.generation,
+        "cluster": session.environment.portal.cluster.name,
+        "portal": session.environment.portal.name,
+        "environment": session.environment.name,
+        "workshop": session.environment.workshop,
+        "phase": session.phase,
+        "user": session.user,
+    }
 
 
 @login_required
@@ -12,16 +55,15 @@ async def api_get_v1_clusters(request: web.Request) -> web.Response:
     """Returns a list of clusters available to the user."""
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
-
-    data = {
-        "clusters": [
-            {"name": cluster.name, "labels": cluster.labels}
-            for cluster in cluster_database.get_clusters()
-        ]
-    }
+    snapshot = service_state.cluster_database.snapshot
 
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "clusters",
+        snapshot.get_clusters(),
+        lambda cluster: {"name": cluster.name, "labels": cluster.labels},
+        key=lambda cluster: (cluster.name,),
+    )
 
 
 @login_required
@@ -32,9 +74,9 @@ async def api_get_v1_clusters_details(request: web.Request) -> web.Response:
     cluster_name = request.match_info["cluster"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
@@ -55,9 +97,9 @@ async def api_get_v1_clusters_kubeconfig(request: web.Request) -> web.Response:
     cluster_name = request.match_info["cluster"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
@@ -75,31 +117,20 @@ async def api_get_v1_clusters_portals(request: web.Request) -> web.Response:
     cluster_name = request.match_info["cluster"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    data = {
-        "portals": [
-            {
-                "name": portal.name,
-                "uid": portal.uid,
-                "generation": portal.generation,
-                "labels": portal.labels,
-                "cluster": portal.cluster.name,
-                "url": portal.url,
-                "capacity": portal.capacity,
-                "allocated": portal.allocated,
-                "phase": portal.phase,
-            }
-            for portal in cluster.get_portals()
-        ]
-    }
-
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "portals",
+        snapshot.get_portals(cluster),
+        portal_record,
+        key=lambda portal: (portal.name,),
+    )
 
 
 @login_required
@@ -111,31 +142,19 @@ async def api_get_v1_clusters_portals_details(request: web.Request) -> web.Respo
     portal_name = request.match_info["portal"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    details = {
-        "name": portal.name,
-        "uid": portal.uid,
-        "generation": portal.generation,
-        "labels": portal.labels,
-        "cluster": portal.cluster.name,
-        "url": portal.url,
-        "capacity": portal.capacity,
-        "allocated": portal.allocated,
-        "phase": portal.phase,
-    }
-
-    return web.json_response(details)
+    return web.json_response(portal_record(portal))
 
 
 @login_required
@@ -149,43 +168,27 @@ async def api_get_v1_clusters_portals_environments(
     portal_name = request.match_info["portal"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    environments = portal.get_environments()
-
-    data = {
-        "environments": [
-            {
-                "name": environment.name,
-                "uid": environment.uid,
-                "generation": environment.generation,
-                "workshop": environment.workshop,
-                "title": environment.title,
-                "description": environment.description,
-                "labels": environment.labels,
-                "cluster": portal.cluster.name,
-                "portal": portal.name,
-                "capacity": environment.capacity,
-                "reserved": environment.reserved,
-                "allocated": environment.allocated,
-                "available": environment.available,
-                "phase": environment.phase,
-            }
-            for environment in environments
-        ]
-    }
+    environments = snapshot.get_environments(portal)
 
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "environments",
+        environments,
+        environment_record,
+        key=lambda environment: (environment.name,),
+    )
 
 
 @login_required
@@ -200,41 +203,24 @@ async def api_get_v1_clusters_portals_environments_details(
     environment_name = request.match_info["environment"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    environment = portal.get_environment(environment_name)
+    environment = snapshot.get_environment(portal, environment_name)
 
     if not environment:
         return web.Response(text="Environment not available", status=404)
 
-    details = {
-        "name": environment.name,
-        "uid": environment.uid,
-        "generation": environment.generation,
-        "workshop": environment.workshop,
-        "title": environment.title,
-        "description": environment.description,
-        "labels": environment.labels,
-        "cluster": portal.cluster.name,
-        "portal": portal.name,
-        "capacity": environment.capacity,
-        "reserved": environment.reserved,
-        "allocated": environment.allocated,
-        "available": environment.available,
-        "phase": environment.phase,
-    }
-
-    return web.json_response(details)
+    return web.json_response(environment_record(environment))
 
 
 @login_required
@@ -249,42 +235,32 @@ async def api_get_v1_clusters_portals_environments_sessions(
     environment_name = request.match_info["environment"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    environment = portal.get_environment(environment_name)
+    environment = snapshot.get_environment(portal, environment_name)
 
     if not environment:
         return web.Response(text="Environment not available", status=404)
 
-    sessions = environment.get_sessions()
-
-    data = {
-        "sessions": [
-            {
-                "name": session.name,
-                "generation": session.generation,
-                "cluster": session.environment.portal.cluster.name,
-                "portal": session.environment.portal.name,
-                "environment": session.environment.name,
-                "workshop": session.environment.workshop,
-                "phase": session.phase,
-                "user": session.user,
-            }
-            for session in sessions
-        ]
-    }
+    sessions = snapshot.get_sessions(environment)
 
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "sessions",
+        sessions,
+        session_record,
+        key=lambda session: (session.name,),
+    )
 
 
 @login_required
@@ -299,34 +275,33 @@ async def api_get_v1_clusters_portals_environments_users(
     environment_name = request.match_info["environment"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    environment = portal.get_environment(environment_name)
+    environment = snapshot.get_environment(portal, environment_name)
 
     if not environment:
         return web.Response(text="Environment not available", status=404)
 
-    sessions = environment.get_sessions()
-
-    users = set()
+    sessions = snapshot.get_sessions(environment)
 
-    for session in sessions:
-        if session.user not in users:
-            users.add(session.user)
+    # Sessions which haven't been allocated to a user are skipped, so they
+    # don't end up being listed, or compared with users when sorting.
 
-    data = {"users": list(users)}
+    users = {session.user for session in sessions if session.user}
 
-    return web.json_response(data)
+    return await listing_response(
+        request, "users", users, lambda user: user, key=lambda user: (user,)
+    )
 
 
 @login_required
@@ -342,43 +317,32 @@ async def api_get_v1_clusters_portals_environments_users_sessions(
     user_name = request.match_info["user"]
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
+    snapshot = service_state.cluster_database.snapshot
 
-    cluster = cluster_database.get_cluster(cluster_name)
+    cluster = snapshot.get_cluster(cluster_name)
 
     if not cluster:
         return web.Response(text="Cluster not available", status=404)
 
-    portal = cluster.get_portal(portal_name)
+    portal = snapshot.get_portal(cluster, portal_name)
 
     if not portal:
         return web.Response(text="Portal not available", status=404)
 
-    environment = portal.get_environment(environment_name)
+    environment = snapshot.get_environment(portal, environment_name)
 
     if not environment:
         return web.Response(text="Environment not available", status=404)
 
-    sessions = environment.get_sessions()
-
-    data = {
-        "sessions": [
-            {
-                "name": session.name,
-                "generation": session.generation,
-                "cluster": session.environment.portal.cluster.name,
-                "portal": session.environment.portal.name,
-                "environment": session.environment.name,
-                "workshop": session.environment.workshop,
-                "phase": session.phase,
-                "user": session.user,
-            }
-            for session in sessions
-            if session.user == user_name
-        ]
-    }
+    sessions = snapshot.get_sessions(environment)
 
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "sessions",
+        (session for session in sessions if session.user == user_name),
+        session_record,
+        key=lambda session: (session.name,),
+    )
 
 
 # Set up the routes for the cluster management API.
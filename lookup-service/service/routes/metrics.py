@@ -0,0 +1,88 @@
+"""HTTP API handlers and middleware for Prometheus metrics."""
+
+import time
+from typing import Callable
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from ..helpers.metrics import DATABASE_ITEMS, HTTP_REQUEST_DURATION
+
+
+@web.middleware
+async def metrics_middleware(
+    request: web.Request, handler: Callable[..., web.Response]
+) -> web.Response:
+    """Record the time taken to handle each HTTP API request."""
+
+    resource = request.match_info.route.resource
+
+    route = resource.canonical if resource else "unmatched"
+
+    start_time = time.monotonic()
+
+    status = 500
+
+    try:
+        response = await handler(request)
+        status = response.status
+
+        return response
+
+    except web.HTTPException as exc:
+        status = exc.status
+
+        raise
+
+    finally:
+        HTTP_REQUEST_DURATION.labels(request.method, route, str(status)).observe(
+            time.monotonic() - start_time
+        )
+
+
+def update_database_metrics(service_state) -> None:
+    """Update the metrics for the number of items held in the databases."""
+
+    snapshot = service_state.cluster_database.snapshot
+
+    portals = snapshot.get_all_portals()
+    environments = [
+        environment
+        for portal in portals
+        for environment in snapshot.get_environments(portal)
+    ]
+    sessions = sum(
+        len(snapshot.get_sessions(environment)) for environment in environments
+    )
+
+    DATABASE_ITEMS.labels("clients").set(
+        len(service_state.client_database.get_clients())
+    )
+    DATABASE_ITEMS.labels("tenants").set(
+        len(service_state.tenant_database.get_tenants())
+    )
+    DATABASE_ITEMS.labels("clusters").set(len(snapshot.get_clusters()))
+    DATABASE_ITEMS.labels("portals").set(len(portals))
+    DATABASE_ITEMS.labels("environments").set(len(environments))
+    DATABASE_ITEMS.labels("sessions").set(sessions)
+
+
+async def api_get_metrics(request: web.Request) -> web.Response:
+    """Returns metrics for the service in Prometheus text format."""
+
+    update_database_metrics(request.app["service_state"])
+
+    response = web.Response(body=generate_latest())
+    response.content_type = CONTENT_TYPE_LATEST.split(";")[0]
+    response.charset = "utf-8"
+
+    return response
+
+
+# Set up the middleware and routes for the metrics.
+
+middlewares = [metrics_middleware]
+
+routes = [
+    web.get("/metrics", api_get_metrics),
+]
@@ -1,42 +1,47 @@
 """REST API handlers for portal management."""
 
+from typing import Any, Dict
+
 from aiohttp import web
 
+from ..caches.portals import TrainingPortal
+from ..helpers.listings import listing_response
 from .authnz import login_required, roles_accepted
 
 
+def portal_record(portal: TrainingPortal) -> Dict[str, Any]:
+    """Return the details of a portal as returned by the HTTP API."""
+
+    return {
+        "name": portal.name,
+        "uid": portal.uid,
+        "generation": portal.generation,
+        "labels": portal.labels,
+        "cluster": portal.cluster.name,
+        "url": portal.url,
+        "capacity": portal.capacity,
+        "allocated": portal.allocated,
+        "phase": portal.phase,
+    }
+
+
 @login_required
 @roles_accepted("admin")
 async def api_get_v1_portals(request: web.Request) -> web.Response:
     """Returns a list of portals available to the user."""
 
     service_state = request.app["service_state"]
-    cluster_database = service_state.cluster_database
-
-    portals = []
-
-    for cluster in cluster_database.get_clusters():
-        for portal in cluster.get_portals():
-            portals.append(portal)
-
-    data = {
-        "portals": [
-            {
-                "name": portal.name,
-                "uid": portal.uid,
-                "generation": portal.generation,
-                "labels": portal.labels,
-                "cluster": portal.cluster.name,
-                "url": portal.url,
-                "capacity": portal.capacity,
-                "allocated": portal.allocated,
-                "phase": portal.phase,
-            }
-            for portal in portals
-        ]
-    }
+    snapshot = service_state.cluster_database.snapshot
+
+    portals = snapshot.get_all_portals()
 
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "portals",
+        portals,
+        portal_record,
+        key=lambda portal: (portal.cluster.name, portal.name),
+    )
 
 
 # Set up the routes for the portal management API.
@@ -2,7 +2,9 @@
 
 from aiohttp import web
 
+from ..helpers.listings import listing_response
 from .authnz import login_required, roles_accepted
+from .portals import portal_record
 
 
 def get_clients_mapped_to_tenant(client_database, tenant_name: str) -> int:
@@ -24,17 +26,16 @@ async def api_get_v1_tenants(request: web.Request) -> web.Response:
     tenant_database = service_state.tenant_database
     client_database = service_state.client_database
 
-    data = {
-        "tenants": [
-            {
-                "name": tenant.name,
-                "clients": get_clients_mapped_to_tenant(client_database, tenant.name),
-            }
-            for tenant in tenant_database.get_tenants()
-        ]
-    }
-
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "tenants",
+        tenant_database.get_tenants(),
+        lambda tenant: {
+            "name": tenant.name,
+            "clients": get_clients_mapped_to_tenant(client_database, tenant.name),
+        },
+        key=lambda tenant: (tenant.name,),
+    )
 
 
 @login_required
@@ -100,24 +101,13 @@ async def api_get_v1_tenants_portals(request: web.Request) -> web.Response:
 
     # Generate the list of portals available to the user for this tenant.
 
-    data = {
-        "portals": [
-            {
-                "name": portal.name,
-                "uid": portal.uid,
-                "generation": portal.generation,
-                "labels": portal.labels,
-                "cluster": portal.cluster.name,
-                "url": portal.url,
-                "capacity": portal.capacity,
-                "allocated": portal.allocated,
-                "phase": portal.phase,
-            }
-            for portal in accessible_portals
-        ]
-    }
-
-    return web.json_response(data)
+    return await listing_response(
+        request,
+        "portals",
+        accessible_portals,
+        portal_record,
+        key=lambda portal: (portal.cluster.name, portal.name),
+    )
 
 
 @login_required
@@ -151,6 +141,8 @@ async def api_get_v1_tenants_workshops(request: web.Request) -> web.Response:
     if not tenant:
         return web.Response(text="Tenant not available", status=404)
 
+    snapshot = service_state.cluster_database.snapshot
+
     accessible_portals = tenant.portals_which_are_accessible()
 
     # Generate the list of workshops available to the user for this tenant which
@@ -161,7 +153,7 @@ async def api_get_v1_tenants_workshops(request: web.Request) -> web.Response:
     workshops = {}
 
     for portal in accessible_portals:
-        for environment in portal.get_running_environments():
+        for environment in snapshot.get_running_environments(portal):
             workshops[environment.workshop] = {
                 "name": environment.workshop,
                 "title": environment.title,
@@ -169,7 +161,13 @@ async def api_get_v1_tenants_workshops(request: web.Request) -> web.Response:
                 "labels": environment.labels,
             }
 
-    return web.json_response({"workshops": list(workshops.values())})
+    return await listing_response(
+        request,
+        "workshops",
+        workshops.values(),
+        lambda workshop: workshop,
+        key=lambda workshop: (workshop["name"],),
+    )
 
 
 # Set up the routes for the tenant management API.
@@ -1,16 +1,80 @@
 """REST API handlers for workshop requests."""
 
+import asyncio
+import hashlib
+import json
 import logging
-from typing import List
+from dataclasses import dataclass
+from typing import Any, Dict, List, Set, Tuple, Union
 
 from aiohttp import web
 
+from ..caches.databases import ClusterDatabase
 from ..caches.environments import WorkshopEnvironment
+from ..config import ALLOCATION_BATCH_CONCURRENCY, ALLOCATION_HEDGE_DELAY
+from ..helpers.metrics import ALLOCATION_ATTEMPTS
 from .authnz import login_required, roles_accepted
 
 logger = logging.getLogger("educates")
 
 
+@dataclass
+class WorkshopCatalog:
+    """Serialized workshop catalog for a tenant, together with the key used
+    to determine whether it is still current and the entity tag returned to
+    clients so they can make conditional requests."""
+
+    key: Tuple[Any, ...]
+    etag: str
+    body: bytes
+
+
+# Cache of serialized workshop catalogs, indexed by tenant name, or None where
+# no tenant was specified. Only accessed from the event loop of the HTTP
+# server so doesn't need to be locked.
+
+_workshop_catalogs: Dict[Union[str, None], WorkshopCatalog] = {}
+
+
+def workshop_catalog_key(snapshot, portals) -> Tuple[Any, ...]:
+    """Return the key identifying the content of the workshop catalog built
+    from the set of portals. This only changes when the set of portals, or
+    the workshops provided by any of the portals, changes."""
+
+    return tuple(
+        (portal.cluster.name, portal.name, snapshot.get_catalog_version(portal))
+        for portal in portals
+    )
+
+
+def build_workshop_catalog(snapshot, portals) -> WorkshopCatalog:
+    """Generate the workshop catalog for the set of portals."""
+
+    # Generate the list of workshops available to the user for this tenant which
+    # are in a running state. We need to eliminate any duplicates as a workshop
+    # may be available through multiple training portals. We use the title and
+    # description from the last found so we expect these to be consistent.
+
+    workshops = {}
+
+    for portal in portals:
+        for entry in snapshot.get_catalog(portal):
+            workshops[entry.name] = {
+                "name": entry.name,
+                "title": entry.title,
+                "description": entry.description,
+                "labels": list(entry.labels),
+            }
+
+    body = json.dumps({"workshops": list(workshops.values())}).encode("utf-8")
+
+    return WorkshopCatalog(
+        key=workshop_catalog_key(snapshot, portals),
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        body=body,
+    )
+
+
 @login_required
 @roles_accepted("admin", "tenant")
 async def api_get_v1_workshops(request: web.Request) -> web.Response:
@@ -42,6 +106,8 @@ async def api_get_v1_workshops(request: web.Request) -> web.Response:
 
     # Work out the set of portals accessible by the specified tenant.
 
+    snapshot = service_state.cluster_database.snapshot
+
     if tenant_name:
         tenant = tenant_database.get_tenant(tenant_name)
 
@@ -53,30 +119,32 @@ async def api_get_v1_workshops(request: web.Request) -> web.Response:
     else:
         # Collect list of portals from all the clusters.
 
-        accessible_portals = []
+        accessible_portals = snapshot.get_all_portals()
 
-        cluster_database = service_state.cluster_database
+    # Use the cached workshop catalog for the tenant if none of the workshop
+    # environments of the accessible portals have changed, otherwise generate
+    # it again.
 
-        for cluster in cluster_database.get_clusters():
-            accessible_portals.extend(cluster.get_portals())
+    catalog = _workshop_catalogs.get(tenant_name)
 
-    # Generate the list of workshops available to the user for this tenant which
-    # are in a running state. We need to eliminate any duplicates as a workshop
-    # may be available through multiple training portals. We use the title and
-    # description from the last found so we expect these to be consistent.
+    if not catalog or catalog.key != workshop_catalog_key(snapshot, accessible_portals):
+        catalog = build_workshop_catalog(snapshot, accessible_portals)
+        _workshop_catalogs[tenant_name] = catalog
 
-    workshops = {}
+    # If the client already has the current version of the workshop catalog
+    # tell it that it hasn't changed rather than sending it again.
 
-    for portal in accessible_portals:
-        for environment in portal.get_running_environments():
-            workshops[environment.workshop] = {
-                "name": environment.workshop,
-                "title": environment.title,
-                "description": environment.description,
-                "labels": environment.labels,
-            }
+    if request.if_none_match and any(
+        etag.value in (catalog.etag, "*") for etag in request.if_none_match
+    ):
+        response = web.Response(status=304)
+
+    else:
+        response = web.Response(body=catalog.body, content_type="application/json")
+
+    response.etag = catalog.etag
 
-    return web.json_response({"workshops": list(workshops.values())})
+    return response
 
 
 @login_required
@@ -130,31 +198,27 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
 
         return web.Response(text="Client not allowed access to tenant", status=403)
 
-    # If a user ID is supplied, check all of the portals to see if this user
-    # already has a workshop session for this workshop. This is done before
-    # checking whether a portal is accessible to the tenant so depends on the
-    # user ID being unique across all tenants. We do it before checking access
-    # to the tenant so that we can return a session if the user already has one
-    # even if the tenant no longer has access because of label changes.
+    # If a user ID is supplied, check the index of workshop sessions allocated
+    # to users to see if this user already has a workshop session for this
+    # workshop. This is done before checking whether a portal is accessible to
+    # the tenant so depends on the user ID being unique across all tenants. We
+    # do it before checking access to the tenant so that we can return a
+    # session if the user already has one even if the tenant no longer has
+    # access because of label changes.
 
     cluster_database = service_state.cluster_database
 
     if user_id:
-        for cluster in cluster_database.get_clusters():
-            for portal in cluster.get_portals():
-                session = portal.find_existing_workshop_session_for_user(
-                    user_id, workshop_name
-                )
-
-                if session:
-                    data = await session.reacquire_workshop_session(index_url)
+        for session in cluster_database.get_sessions_for_user(user_id, workshop_name):
+            data = await session.reacquire_workshop_session(index_url)
 
-                    if data:
-                        data["tenantName"] = tenant_name
-                        return web.json_response(data)
+            if data:
+                data["tenantName"] = tenant_name
+                return web.json_response(data)
 
-    # Get the list of portals hosting the workshop and calculate the subset that
-    # are accessible to the tenant.
+    # Get the list of workshop environments for the workshop from the index
+    # held by the cluster database and calculate the subset that are hosted by
+    # portals accessible to the tenant.
 
     tenant_database = service_state.tenant_database
 
@@ -165,18 +229,16 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
 
         return web.Response(text="Tenant not available", status=503)
 
-    accessible_portals = tenant.portals_which_are_accessible()
-
-    selected_portals = []
-
-    for portal in accessible_portals:
-        if portal.hosts_workshop(workshop_name):
-            selected_portals.append(portal)
+    selected_environments = [
+        environment
+        for environment in cluster_database.get_environments_for_workshop(workshop_name)
+        if tenant.portal_is_accessible(environment.portal)
+    ]
 
-    # If there are no resulting portals, then the workshop is not available to
-    # the tenant.
+    # If there are no resulting workshop environments, then the workshop is not
+    # available to the tenant.
 
-    if not selected_portals:
+    if not selected_environments:
         logger.warning(
             "Workshop %s requested by client %r not available to tenant %r",
             workshop_name,
@@ -190,12 +252,11 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
     # in a running state. If there are no such environments, then the workshop
     # is not available.
 
-    environments = []
-
-    for portal in selected_portals:
-        for environment in portal.get_running_environments():
-            if environment.workshop == workshop_name:
-                environments.append(environment)
+    environments = [
+        environment
+        for environment in selected_environments
+        if environment.phase == "Running"
+    ]
 
     if not environments:
         logger.warning(
@@ -211,16 +272,14 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
 
     environments = sort_workshop_environments(environments)
 
-    # Loop over the workshop environments and try to allocate a session.
+    # Try to allocate a session from the workshop environments, starting with
+    # the best candidate.
 
-    for environment in environments:
-        data = await environment.request_workshop_session(
-            user_id, parameters, index_url
-        )
+    data = await allocate_workshop_session(environments, user_id, parameters, index_url)
 
-        if data:
-            data["tenantName"] = tenant_name
-            return web.json_response(data)
+    if data:
+        data["tenantName"] = tenant_name
+        return web.json_response(data)
 
     # If we get here, then we don't believe there is any available capacity for
     # creating a workshop session.
@@ -232,12 +291,596 @@ async def api_post_v1_workshops(request: web.Request) -> web.Response:
     return web.Response(text="Workshop not available", status=503)
 
 
+@dataclass
+class BatchEntry:
+    """Request for a workshop session for a single user as part of a batch,
+    together with the workshop environments to try in order of preference."""
+
+    index: int
+    user_id: str
+    action_id: str
+    workshop_name: str
+    parameters: List[Dict[str, str]]
+    index_url: str
+    environments: List[WorkshopEnvironment]
+
+    def result(self, status: int, **details) -> Dict[str, Any]:
+        """Return the result to be streamed back to the client."""
+
+        return {
+            "index": self.index,
+            "status": status,
+            "clientUserId": self.user_id,
+            "clientActionId": self.action_id,
+            "workshopName": self.workshop_name,
+            **details,
+        }
+
+
+def plan_workshop_allocations(
+    entries: List[BatchEntry],
+) -> Dict[Tuple[str, str], List[BatchEntry]]:
+    """Plan which workshop environment each entry in a batch should first try
+    to allocate a workshop session from, taking into account the sessions
+    planned for earlier entries so the batch is spread across workshop
+    environments and portals according to their remaining capacity. The
+    workshop environments of each entry must already be sorted in order of
+    preference. The entries are returned grouped by the portal hosting the
+    workshop environment to be tried first."""
+
+    # Remaining capacity of workshop environments and portals, where None means
+    # there is no maximum capacity.
+
+    environment_capacity: Dict[Tuple[str, str, str], int | None] = {}
+    portal_capacity: Dict[Tuple[str, str], int | None] = {}
+
+    for entry in entries:
+        for environment in entry.environments:
+            portal = environment.portal
+
+            portal_key = (portal.cluster.name, portal.name)
+            environment_key = (*portal_key, environment.name)
+
+            if environment_key not in environment_capacity:
+                environment_capacity[environment_key] = (
+                    environment.capacity
+                    - environment.allocated
+                    - environment.pending_allocations
+                    if environment.capacity
+                    else None
+                )
+
+            if portal_key not in portal_capacity:
+                portal_capacity[portal_key] = (
+                    portal.capacity - portal.allocated - portal.pending_allocations
+                    if portal.capacity
+                    else None
+                )
+
+    groups: Dict[Tuple[str, str], List[BatchEntry]] = {}
+
+    for entry in entries:
+        if not entry.environments:
+            continue
+
+        # Move the best workshop environment which is still believed to have
+        # capacity after earlier entries to the front. If none do, leave the
+        # order as is and let the portals decide.
+
+        for environment in entry.environments:
+            portal = environment.portal
+
+            portal_key = (portal.cluster.name, portal.name)
+            environment_key = (*portal_key, environment.name)
+
+            remaining = environment_capacity[environment_key]
+
+            if remaining is not None and remaining <= 0:
+                continue
+
+            remaining = portal_capacity[portal_key]
+
+            if remaining is not None and remaining <= 0:
+                continue
+
+            if environment_capacity[environment_key] is not None:
+                environment_capacity[environment_key] -= 1
+
+            if portal_capacity[portal_key] is not None:
+                portal_capacity[portal_key] -= 1
+
+            entry.environments.remove(environment)
+            entry.environments.insert(0, environment)
+
+            break
+
+        portal = entry.environments[0].portal
+
+        groups.setdefault((portal.cluster.name, portal.name), []).append(entry)
+
+    return groups
+
+
+async def allocate_batch_entry(
+    entry: BatchEntry,
+    cluster_database: ClusterDatabase,
+    semaphore: asyncio.Semaphore,
+) -> Dict[str, Any]:
+    """Allocate a workshop session for an entry in a batch, returning the
+    result to be streamed back to the client."""
+
+    async with semaphore:
+        # If the user already has a workshop session for this workshop, return
+        # it rather than allocating another.
+
+        if entry.user_id:
+            for session in cluster_database.get_sessions_for_user(
+                entry.user_id, entry.workshop_name
+            ):
+                data = await session.reacquire_workshop_session(entry.index_url)
+
+                if data:
+                    return entry.result(200, **data)
+
+        if not entry.environments:
+            return entry.result(503, error="Workshop not available")
+
+        data = await allocate_workshop_session(
+            entry.environments, entry.user_id, entry.parameters, entry.index_url
+        )
+
+    if data:
+        return entry.result(200, **data)
+
+    return entry.result(503, error="Workshop not available")
+
+
+@login_required
+@roles_accepted("admin", "tenant")
+async def api_post_v1_workshops_batch(request: web.Request) -> web.StreamResponse:
+    """Allocates workshop sessions for a batch of users of the specified tenant.
+    The result for each user is streamed back as newline delimited JSON as soon
+    as it is known, so results will not be in the same order as the request."""
+
+    data = await request.json()
+
+    service_state = request.app["service_state"]
+
+    client = request["remote_client"]
+
+    tenant_name = data.get("tenantName")
+    index_url = data.get("clientIndexUrl") or ""
+
+    sessions = data.get("sessions")
+
+    logger.info(
+        "Batch workshop request from client %r for tenant %r, sessions %d",
+        client.name,
+        tenant_name,
+        len(sessions) if isinstance(sessions, list) else 0,
+    )
+
+    if not tenant_name:
+        logger.warning("Missing tenant name in request from client %r.", client.name)
+
+        return web.Response(text="Missing tenantName", status=400)
+
+    if not isinstance(sessions, list):
+        logger.warning("Missing sessions in request from client %r.", client.name)
+
+        return web.Response(text="Missing sessions", status=400)
+
+    # Check that client is allowed access to this tenant.
+
+    if not client.allowed_access_to_tenant(tenant_name):
+        logger.warning(
+            "Client %r not allowed access to tenant %r", client.name, tenant_name
+        )
+
+        return web.Response(text="Client not allowed access to tenant", status=403)
+
+    tenant_database = service_state.tenant_database
+
+    tenant = tenant_database.get_tenant(tenant_name)
+
+    if not tenant:
+        logger.error("Configuration for tenant %r could not be found", tenant_name)
+
+        return web.Response(text="Tenant not available", status=503)
+
+    # Work out the workshop environments for each workshop requested which are
+    # running and hosted by portals accessible to the tenant. This is only done
+    # once for each workshop, with the workshop environments sorted so that the
+    # best candidates are at the front of the list.
+
+    cluster_database = service_state.cluster_database
+
+    workshop_environments: Dict[str, List[WorkshopEnvironment]] = {}
+
+    entries: List[BatchEntry] = []
+    failures: List[Dict[str, Any]] = []
+
+    for index, item in enumerate(sessions):
+        item = item if isinstance(item, dict) else {}
+
+        workshop_name = item.get("workshopName") or ""
+
+        entry = BatchEntry(
+            index=index,
+            user_id=client.user or item.get("clientUserId") or "",
+            action_id=item.get("clientActionId") or "",
+            workshop_name=workshop_name,
+            parameters=item.get("workshopParams", []),
+            index_url=item.get("clientIndexUrl") or index_url,
+            environments=[],
+        )
+
+        if not workshop_name:
+            failures.append(entry.result(400, error="Missing workshopName"))
+
+            continue
+
+        if workshop_name not in workshop_environments:
+            workshop_environments[workshop_name] = sort_workshop_environments(
+                [
+                    environment
+                    for environment in cluster_database.get_environments_for_workshop(
+                        workshop_name
+                    )
+                    if environment.phase == "Running"
+                    and tenant.portal_is_accessible(environment.portal)
+                ]
+            )
+
+        entry.environments = list(workshop_environments[workshop_name])
+
+        entries.append(entry)
+
+    # Plan where each workshop session should be allocated and group requests
+    # by portal. Each portal is sent a bounded number of concurrent requests,
+    # with requests sharing the pooled connections and access token for the
+    # portal, which is obtained up front so it is only requested once.
+
+    groups = plan_workshop_allocations(entries)
+
+    portals = {key: group[0].environments[0].portal for key, group in groups.items()}
+
+    await asyncio.gather(
+        *(portal.client_session().login() for portal in portals.values()),
+        return_exceptions=True,
+    )
+
+    semaphores = {
+        key: asyncio.Semaphore(ALLOCATION_BATCH_CONCURRENCY) for key in groups
+    }
+
+    unplaced = asyncio.Semaphore(ALLOCATION_BATCH_CONCURRENCY)
+
+    tasks = []
+
+    for entry in entries:
+        if entry.environments:
+            portal = entry.environments[0].portal
+            semaphore = semaphores[(portal.cluster.name, portal.name)]
+
+        else:
+            semaphore = unplaced
+
+        tasks.append(
+            asyncio.create_task(
+                allocate_batch_entry(entry, cluster_database, semaphore)
+            )
+        )
+
+    # Stream back the results as they become available.
+
+    response = web.StreamResponse()
+    response.content_type = "application/x-ndjson"
+
+    await response.prepare(request)
+
+    try:
+        for result in failures:
+            await response.write(json.dumps(result).encode("utf-8") + b"\n")
+
+        for task in asyncio.as_completed(tasks):
+            result = await task
+
+            if result["status"] == 200:
+                result["tenantName"] = tenant_name
+
+            await response.write(json.dumps(result).encode("utf-8") + b"\n")
+
+    finally:
+        # If the client went away, cancel any requests still outstanding. Any
+        # sessions already allocated by these will be released.
+
+        for task in tasks:
+            task.cancel()
+
+    await response.write_eof()
+
+    return response
+
+
+# Set of background tasks for releasing workshop sessions allocated by hedged
+# requests which lost out to another request, or by requests which were still
+# in flight when the handler was cancelled. A reference is held to these so
+# they are not garbage collected before they complete.
+
+_release_tasks: Set[asyncio.Task] = set()
+
+
+def record_allocation_attempt(environment: WorkshopEnvironment, outcome: str) -> None:
+    """Record the outcome of an attempt to allocate a workshop session from a
+    workshop environment."""
+
+    ALLOCATION_ATTEMPTS.labels(
+        environment.portal.cluster.name,
+        environment.portal.name,
+        environment.name,
+        outcome,
+    ).inc()
+
+
+async def request_session_from_environment(
+    environment: WorkshopEnvironment,
+    reservation: str,
+    user_id: str,
+    parameters: List[Dict[str, str]],
+    index_url: str,
+) -> Dict[str, str] | None:
+    """Request a workshop session from a workshop environment, logging and
+    treating any unexpected error as a failure to allocate a session. Capacity
+    must have been reserved in the workshop environment before the request is
+    started. The reservation is released if the request fails, otherwise it is
+    held until the operator sees the allocated session."""
+
+    data = None
+
+    try:
+        data = await environment.request_workshop_session(
+            user_id, parameters, index_url
+        )
+
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            "Unexpected error requesting session from environment %s of portal %s of cluster %s.",  # pylint: disable=line-too-long
+            environment.name,
+            environment.portal.name,
+            environment.portal.cluster.name,
+        )
+
+    finally:
+        if data:
+            environment.confirm_reservation(reservation, data["sessionName"])
+
+        else:
+            environment.release_reservation(reservation)
+
+    record_allocation_attempt(environment, "allocated" if data else "failed")
+
+    return data
+
+
+async def release_workshop_sessions(
+    tasks: Dict[asyncio.Task, WorkshopEnvironment],
+) -> None:
+    """Wait for requests for workshop sessions which lost out to another
+    request, or whose handler was cancelled, to complete and terminate any
+    workshop sessions they allocated."""
+
+    for task, environment in tasks.items():
+        data = await task
+
+        if data:
+            logger.info(
+                "Releasing unused session %s from environment %s of portal %s of cluster %s.",  # pylint: disable=line-too-long
+                data["sessionName"],
+                environment.name,
+                environment.portal.name,
+                environment.portal.cluster.name,
+            )
+
+            record_allocation_attempt(environment, "released")
+
+            await environment.terminate_workshop_session(data["sessionName"])
+
+
+def release_workshop_sessions_in_background(
+    tasks: Dict[asyncio.Task, WorkshopEnvironment],
+) -> None:
+    """Leave requests for workshop sessions to complete in the background,
+    terminating any workshop sessions they allocate."""
+
+    release_task = asyncio.create_task(release_workshop_sessions(tasks))
+
+    _release_tasks.add(release_task)
+    release_task.add_done_callback(_release_tasks.discard)
+
+
+async def allocate_workshop_session(
+    environments: List[WorkshopEnvironment],
+    user_id: str,
+    parameters: List[Dict[str, str]],
+    index_url: str,
+) -> Dict[str, str] | None:
+    """Allocate a workshop session from the first workshop environment in the
+    list able to provide one. The workshop environments are tried in order,
+    moving on to the next when a request fails. If a request has not completed
+    within the hedge delay, a hedged request is also sent to the next workshop
+    environment, with the first to succeed being used. Sessions allocated by
+    any other request which succeeds are then terminated."""
+
+    # If hedged requests are disabled, try each workshop environment in turn.
+    # Each request is shielded so that if the handler is cancelled, such as
+    # when the client of a batch request goes away, the request is left to
+    # complete in the background and any session allocated is released.
+
+    if ALLOCATION_HEDGE_DELAY <= 0:
+        for environment in environments:
+            task = asyncio.create_task(
+                request_session_from_environment(
+                    environment,
+                    environment.reserve_capacity(),
+                    user_id,
+                    parameters,
+                    index_url,
+                )
+            )
+
+            try:
+                data = await asyncio.shield(task)
+
+            except asyncio.CancelledError:
+                release_workshop_sessions_in_background({task: environment})
+
+                raise
+
+            if data:
+                return data
+
+        return None
+
+    candidates = iter(environments)
+
+    pending: Dict[asyncio.Task, WorkshopEnvironment] = {}
+
+    def request_next_candidate() -> None:
+        environment = next(candidates, None)
+
+        # Capacity is reserved before the task is created, rather than when the
+        # task starts, so that it is taken into account by any other request
+        # which is handled before the task starts.
+
+        if environment:
+            task = asyncio.create_task(
+                request_session_from_environment(
+                    environment,
+                    environment.reserve_capacity(),
+                    user_id,
+                    parameters,
+                    index_url,
+                )
+            )
+
+            pending[task] = environment
+
+    request_next_candidate()
+
+    result = None
+
+    try:
+        while pending and not result:
+            done, _ = await asyncio.wait(
+                list(pending),
+                timeout=ALLOCATION_HEDGE_DELAY,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            # If no request completed within the hedge delay, send a hedged
+            # request to the next best workshop environment.
+
+            if not done:
+                request_next_candidate()
+
+                continue
+
+            # Otherwise take the result from the first request to succeed. If
+            # another completed at the same time and also succeeded, that
+            # session will need to be released. If all the completed requests
+            # failed, move on to the next workshop environment.
+
+            losers = {}
+
+            for task in done:
+                environment = pending.pop(task)
+
+                data = task.result()
+
+                if data and not result:
+                    result = data
+
+                elif data:
+                    losers[task] = environment
+
+            if losers:
+                pending.update(losers)
+
+            if not result:
+                request_next_candidate()
+
+    finally:
+        # Any requests which are still in flight, or which also succeeded,
+        # are left to complete in the background, with any sessions allocated
+        # being terminated. If the handler was cancelled before any request
+        # succeeded, the sessions from all requests are released.
+
+        if pending:
+            release_workshop_sessions_in_background(pending)
+
+    return result
+
+
 def sort_workshop_environments(
     environments: List[WorkshopEnvironment],
 ) -> List[WorkshopEnvironment]:
     """Sort the list of workshop environments such that those deemed to be the
     best candidates for running a workshop session are at the front of the
-    list."""
+    list. Workshop sessions which have been requested or allocated but not yet
+    seen by the operator are counted as allocated, so that concurrent requests
+    don't all target the same workshop environment. The health of the portal
+    hosting each workshop environment is also taken into account, so that
+    portals which are failing or slow are only used when there is no other
+    choice."""
+
+    # Work out the number of pending allocations for each workshop environment
+    # and portal up front as these are used by several of the scores.
+
+    pending_environment_allocations = {
+        id(environment): environment.pending_allocations for environment in environments
+    }
+
+    pending_portal_allocations = {
+        id(environment.portal): environment.portal.pending_allocations
+        for environment in environments
+    }
+
+    def portal_allocated(environment: WorkshopEnvironment) -> int:
+        """Return the number of sessions allocated from the portal."""
+
+        portal = environment.portal
+
+        return portal.allocated + pending_portal_allocations[id(portal)]
+
+    def environment_allocated(environment: WorkshopEnvironment) -> int:
+        """Return the number of sessions allocated from the environment."""
+
+        return environment.allocated + pending_environment_allocations[id(environment)]
+
+    def environment_available(environment: WorkshopEnvironment) -> int:
+        """Return the number of reserved sessions in the environment which are
+        available for allocation."""
+
+        return max(
+            0, environment.available - pending_environment_allocations[id(environment)]
+        )
+
+    def score_based_on_portal_circuit(environment: WorkshopEnvironment) -> int:
+        """Return a score based on whether requests can currently be made to
+        the portal hosting the workshop environment. We return 0 if the
+        circuit for the portal is open because of prior failed requests, so
+        that workshop environments of the portal are only tried last."""
+
+        return 1 if environment.portal.health.available else 0
+
+    def score_based_on_portal_health(environment: WorkshopEnvironment) -> int:
+        """Return a score based on the recent error rate and latency of requests
+        made to the portal hosting the workshop environment. The health score
+        is bucketed into quarters so that small differences in latency between
+        healthy portals don't override the scores based on capacity."""
+
+        return round(environment.portal.health.score * 4)
 
     def score_based_on_portal_availability(environment: WorkshopEnvironment) -> int:
         """Return a score based on the remaining capacity of the portal hosting
@@ -254,7 +897,7 @@ def sort_workshop_environments(
         # If the portal has a maximum capacity specified and there is no more
         # capacity left, return 0.
 
-        if environment.portal.capacity - environment.portal.allocated <= 0:
+        if environment.portal.capacity - portal_allocated(environment) <= 0:
             return 0
 
         # Otherwise return 1 indicating there is capacity.
@@ -277,7 +920,7 @@ def sort_workshop_environments(
         # If the environment has a maximum capacity specified and there is no
         # more capacity left, return 0.
 
-        if environment.capacity - environment.allocated <= 0:
+        if environment.capacity - environment_allocated(environment) <= 0:
             return 0
 
         # Otherwise return 1 indicating there is capacity.
@@ -297,12 +940,12 @@ def sort_workshop_environments(
         capacity = 1
 
         if environment.portal.capacity:
-            capacity = environment.portal.capacity - environment.portal.allocated
+            capacity = environment.portal.capacity - portal_allocated(environment)
 
         # Return the capacity of the portal in conjunction with the number of
         # reserved sessions which are currently available.
 
-        return (capacity, environment.available)
+        return (capacity, environment_available(environment))
 
     def score_based_on_available_capacity(environment: WorkshopEnvironment) -> int:
         """Return a score based on the available capacity of the workshop
@@ -317,7 +960,7 @@ def sort_workshop_environments(
         capacity = 1
 
         if environment.portal.capacity:
-            capacity = environment.portal.capacity - environment.portal.allocated
+            capacity = environment.portal.capacity - portal_allocated(environment)
 
         # If the environment doesn't have a maximum capacity specified we treat
         # it as if there is only 1 spot left so that we give priority to
@@ -329,15 +972,18 @@ def sort_workshop_environments(
         # Return the capacity of the portal in conjunction with the available
         # capacity of the workshop environment.
 
-        return (capacity, environment.capacity - environment.allocated)
+        return (capacity, environment.capacity - environment_allocated(environment))
 
     return sorted(
         environments,
         key=lambda environment: (
+            score_based_on_portal_circuit(environment),
             score_based_on_portal_availability(environment),
             score_based_on_environment_availability(environment),
+            score_based_on_portal_health(environment),
             score_based_on_reserved_sessions(environment),
             score_based_on_available_capacity(environment),
+            environment.portal.health.score,
         ),
         reverse=True,
     )
@@ -348,4 +994,5 @@ def sort_workshop_environments(
 routes = [
     web.get("/api/v1/workshops", api_get_v1_workshops),
     web.post("/api/v1/workshops", api_post_v1_workshops),
+    web.post("/api/v1/workshops/batch", api_post_v1_workshops_batch),
 ]
@@ -0,0 +1,111 @@
+"""Benchmark of the CPU time spent generating the SSH key pair and registry
+credentials for each workshop session.
+
+Before, the SSH key pair and the bcrypt hash of the registry password were
+generated inline by the handler creating the workshop session. After, they
+are taken from pools which are refilled in the background. For each, the CPU
+time spent on the critical path of creating a workshop session is reported,
+as well as the total CPU time per workshop session including that spent in
+the background refilling the pools.
+
+As the operator configuration needs to be able to resolve the address of the
+Kubernetes API server, run from the /opt/app-root/src directory within the
+session manager container using:
+
+    python -m benchmarks.credentials --sessions 20 --rounds 12 --key-type rsa
+"""
+
+import argparse
+import asyncio
+import functools
+import logging
+import time
+
+from handlers.credentials import generate_registry_credentials
+from handlers.pools import PregeneratedPool
+from handlers.sshkeys import generate_ssh_key_pair
+
+
+def inline(args):
+    """Generate credentials inline for each workshop session, returning the
+    CPU time used per workshop session."""
+
+    start = time.process_time()
+
+    for _ in range(args.sessions):
+        generate_ssh_key_pair(args.key_type)
+        generate_registry_credentials(args.rounds)
+
+    return (time.process_time() - start) / args.sessions
+
+
+async def pooled(args):
+    """Take credentials from pools for each workshop session, returning the
+    CPU time used on the critical path and in total per workshop session."""
+
+    ssh_key_pool = PregeneratedPool(
+        "SSH key pairs",
+        functools.partial(generate_ssh_key_pair, args.key_type),
+        args.sessions,
+    )
+
+    registry_credentials_pool = PregeneratedPool(
+        "registry credentials",
+        functools.partial(generate_registry_credentials, args.rounds),
+        args.sessions,
+    )
+
+    start = time.process_time()
+
+    # Fill the pools as would be done in the background when the operator
+    # starts up and after workshop sessions are created.
+
+    ssh_key_pool.start()
+    registry_credentials_pool.start()
+
+    await ssh_key_pool.refill_task
+    await registry_credentials_pool.refill_task
+
+    # Disable refilling of the pools so that only the time taken to obtain
+    # the credentials when creating the workshop sessions is measured.
+
+    ssh_key_pool.size = 0
+    registry_credentials_pool.size = 0
+
+    critical = time.thread_time()
+
+    for _ in range(args.sessions):
+        await ssh_key_pool.get()
+        await registry_credentials_pool.get()
+
+    critical = time.thread_time() - critical
+
+    total = time.process_time() - start
+
+    return critical / args.sessions, total / args.sessions
+
+
+def main():
+    """Parse the command line arguments and run the benchmark."""
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost")
+    parser.add_argument("--key-type", choices=["rsa", "ed25519"], default="rsa")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    before = inline(args)
+
+    critical, total = asyncio.run(pooled(args))
+
+    print(f"Before:  {before * 1000:>9.3f} ms CPU per session on critical path")
+    print(f"After:   {critical * 1000:>9.3f} ms CPU per session on critical path")
+    print(f"         {total * 1000:>9.3f} ms CPU per session including background")
+
+
+if __name__ == "__main__":
+    main()
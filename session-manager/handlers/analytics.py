@@ -2,6 +2,7 @@ import logging
 
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 from .operator_config import ANALYTICS_WEBHOOK_URL
@@ -9,6 +10,12 @@ from .operator_config import ANALYTICS_WEBHOOK_URL
 
 logger = logging.getLogger("educates")
 
+# Events are sent from a single background thread, so that handlers running
+# in the event loop aren't blocked waiting on the webhook, and so events are
+# still delivered in the order they were reported.
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analytics")
+
 
 def current_time():
     dt = datetime.now(timezone.utc)
@@ -37,4 +44,4 @@ def report_analytics_event(event, data={}):
     if not ANALYTICS_WEBHOOK_URL:
         return
 
-    send_event_to_webhook(ANALYTICS_WEBHOOK_URL, message)
+    _executor.submit(send_event_to_webhook, ANALYTICS_WEBHOOK_URL, message)
@@ -0,0 +1,40 @@
+import random
+import string
+import functools
+
+import bcrypt
+
+from .pools import PregeneratedPool
+from .operator_config import (
+    REGISTRY_CREDENTIALS_BCRYPT_ROUNDS,
+    REGISTRY_CREDENTIALS_POOL_SIZE,
+)
+
+
+def generate_registry_credentials(rounds=12):
+    """Generates a random password for the image registry of a workshop
+    session, returning it along with the bcrypt hash of the password for use
+    in a htpasswd file. The cost of hashing the password grows exponentially
+    with the number of rounds."""
+
+    characters = string.ascii_letters + string.digits
+
+    password = "".join(random.sample(characters, 32))
+
+    password_hash = bcrypt.hashpw(
+        bytes(password, "ascii"), bcrypt.gensalt(rounds=rounds, prefix=b"2a")
+    )
+
+    return password, password_hash.decode("ascii")
+
+
+# Pool of passwords and password hashes for the image registry of workshop
+# sessions.
+
+registry_credentials_pool = PregeneratedPool(
+    "registry credentials",
+    functools.partial(
+        generate_registry_credentials, REGISTRY_CREDENTIALS_BCRYPT_ROUNDS
+    ),
+    REGISTRY_CREDENTIALS_POOL_SIZE,
+)
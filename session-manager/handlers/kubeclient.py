@@ -0,0 +1,356 @@
+import ssl
+import json
+import asyncio
+import logging
+import contextlib
+
+import aiohttp
+import kopf
+import pykube
+
+from .operator_config import KUBERNETES_CLIENT_CONCURRENCY
+
+logger = logging.getLogger("educates")
+
+# Timeout in seconds for connecting to the Kubernetes API server and for
+# reading responses, matching the default timeout used by pykube.
+
+REQUEST_TIMEOUT = 10
+
+
+def _as_selector(selector):
+    if isinstance(selector, dict):
+        return ",".join(f"{key}={value}" for key, value in selector.items())
+
+    return selector
+
+
+class KubernetesClient:
+    """Asynchronous client for the Kubernetes REST API, for use by handlers
+    which are run by kopf in its event loop rather than in a separate thread.
+    Requests are made over a single pooled HTTP client session, created when
+    first required, and the number of requests in progress at any one time is
+    bounded by a semaphore. If the credentials are rejected, a new client
+    session is created, with the old client session only being closed once
+    requests still using it have completed. Errors are raised using the same
+    exception types as pykube so handlers can check for them the same way.
+
+    """
+
+    def __init__(self, concurrency=KUBERNETES_CLIENT_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.server = None
+        self.session = None
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.resources = {}
+        self.users = {}
+
+    def _login(self):
+        info = kopf.login_via_pykube(logger=logger)
+
+        context = ssl.create_default_context()
+
+        if info.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+        elif info.ca_path:
+            context.load_verify_locations(cafile=info.ca_path)
+
+        if info.certificate_path and info.private_key_path:
+            context.load_cert_chain(info.certificate_path, info.private_key_path)
+
+        headers = {}
+        auth = None
+
+        if info.token:
+            headers["Authorization"] = f"Bearer {info.token}"
+
+        elif info.username and info.password:
+            auth = aiohttp.BasicAuth(info.username, info.password)
+
+        self.server = info.server.rstrip("/")
+
+        # Watches are not counted against the semaphore as they are long lived
+        # and mostly idle, so the connection pool isn't limited to the same
+        # size as the semaphore, but the default limit on connections applies.
+
+        self.session = aiohttp.ClientSession(
+            headers=headers,
+            auth=auth,
+            connector=aiohttp.TCPConnector(ssl=context),
+            timeout=aiohttp.ClientTimeout(
+                connect=REQUEST_TIMEOUT, sock_read=REQUEST_TIMEOUT
+            ),
+        )
+
+    async def close(self):
+        sessions = set(self.users)
+
+        if self.session is not None:
+            sessions.add(self.session)
+
+        self.session = None
+        self.users.clear()
+
+        for session in sessions:
+            await session.close()
+
+    @contextlib.asynccontextmanager
+    async def _session(self):
+        # Tracks the number of requests using each client session, so that a
+        # client session replaced because the credentials were rejected can be
+        # closed once the last request using it has completed, rather than
+        # aborting requests still in progress.
+
+        if self.session is None:
+            self._login()
+
+        session = self.session
+
+        self.users[session] = self.users.get(session, 0) + 1
+
+        try:
+            yield session
+
+        finally:
+            self.users[session] -= 1
+
+            if not self.users[session]:
+                del self.users[session]
+
+                if session is not self.session:
+                    await session.close()
+
+    def _renew(self, session):
+        # Credentials such as a service account token can expire, in which
+        # case they are read again and a new client session created. Other
+        # requests may have already done this after the same client session
+        # had its credentials rejected.
+
+        if self.session is session:
+            self._login()
+
+    async def _request(self, method, path, **kwargs):
+        async with self.semaphore:
+            for attempt in range(2):
+                async with self._session() as session:
+                    async with session.request(
+                        method, f"{self.server}{path}", **kwargs
+                    ) as response:
+                        status = response.status
+                        text = await response.text()
+
+                if status == 401 and attempt == 0:
+                    self._renew(session)
+
+                    continue
+
+                try:
+                    data = json.loads(text)
+
+                except ValueError:
+                    data = {"message": text}
+
+                return status, data
+
+    def _raise_for_status(self, status, data):
+        if status >= 400:
+            message = data.get("message") if isinstance(data, dict) else None
+            raise pykube.exceptions.HTTPError(status, message or f"HTTP {status}")
+
+    async def _resource(self, api_version, kind):
+        # The name of the resource used in the REST API paths for a kind, and
+        # whether it is namespaced, are looked up from the API server the
+        # first time a resource type is used and then cached.
+
+        resources = self.resources.get(api_version)
+
+        if resources is None:
+            base = "/api" if api_version == "v1" else "/apis"
+
+            status, data = await self._request("GET", f"{base}/{api_version}")
+
+            self._raise_for_status(status, data)
+
+            resources = {
+                resource["kind"]: (resource["name"], resource["namespaced"])
+                for resource in data.get("resources", [])
+                if "/" not in resource["name"]
+            }
+
+            self.resources[api_version] = resources
+
+        try:
+            return resources[kind]
+
+        except KeyError:
+            raise pykube.exceptions.ObjectDoesNotExist(
+                f"Resource type {kind} of {api_version} does not exist."
+            ) from None
+
+    async def _path(self, api_version, kind, namespace=None, name=None):
+        resource, namespaced = await self._resource(api_version, kind)
+
+        path = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+
+        if namespaced and namespace:
+            path = f"{path}/namespaces/{namespace}"
+
+        path = f"{path}/{resource}"
+
+        if name:
+            path = f"{path}/{name}"
+
+        return path
+
+    async def create(self, body):
+        """Creates the resource described by the body, returning the created
+        resource object."""
+
+        path = await self._path(
+            body["apiVersion"], body["kind"], body["metadata"].get("namespace")
+        )
+
+        status, data = await self._request("POST", path, json=body)
+
+        self._raise_for_status(status, data)
+
+        return data
+
+    async def get(self, api_version, kind, name, namespace=None):
+        """Returns the named resource object, raising ObjectDoesNotExist if it
+        doesn't exist."""
+
+        path = await self._path(api_version, kind, namespace, name)
+
+        status, data = await self._request("GET", path)
+
+        if status == 404:
+            raise pykube.exceptions.ObjectDoesNotExist(f"{name} does not exist.")
+
+        self._raise_for_status(status, data)
+
+        return data
+
+    async def list(
+        self, api_version, kind, namespace=None, selector=None, field_selector=None
+    ):
+        """Returns the list of resource objects matching the selectors. The
+        response is returned as is, so the resource version of the list can be
+        used to start a watch."""
+
+        path = await self._path(api_version, kind, namespace)
+
+        params = {}
+
+        if selector:
+            params["labelSelector"] = _as_selector(selector)
+
+        if field_selector:
+            params["fieldSelector"] = _as_selector(field_selector)
+
+        status, data = await self._request("GET", path, params=params)
+
+        self._raise_for_status(status, data)
+
+        return data
+
+    async def patch(self, api_version, kind, name, patch, namespace=None):
+        """Applies a merge patch to the named resource, returning the updated
+        resource object."""
+
+        path = await self._path(api_version, kind, namespace, name)
+
+        status, data = await self._request(
+            "PATCH",
+            path,
+            data=json.dumps(patch),
+            headers={"Content-Type": "application/merge-patch+json"},
+        )
+
+        self._raise_for_status(status, data)
+
+        return data
+
+    async def delete(self, api_version, kind, name, namespace=None):
+        """Deletes the named resource. A resource which doesn't exist is
+        ignored."""
+
+        path = await self._path(api_version, kind, namespace, name)
+
+        status, data = await self._request("DELETE", path)
+
+        if status != 404:
+            self._raise_for_status(status, data)
+
+    async def watch(
+        self,
+        api_version,
+        kind,
+        namespace=None,
+        field_selector=None,
+        resource_version=None,
+        timeout=None,
+    ):
+        """Yields the type and resource object for each change to resources,
+        starting after the resource version. Where a timeout in seconds is
+        given, the API server ends the watch once it has passed."""
+
+        path = await self._path(api_version, kind, namespace)
+
+        params = {"watch": "true"}
+
+        if field_selector:
+            params["fieldSelector"] = _as_selector(field_selector)
+
+        if resource_version:
+            params["resourceVersion"] = resource_version
+
+        if timeout is not None:
+            params["timeoutSeconds"] = str(timeout)
+
+        for attempt in range(2):
+            async with self._session() as session:
+                async with session.get(
+                    f"{self.server}{path}",
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(
+                        connect=REQUEST_TIMEOUT,
+                        sock_read=REQUEST_TIMEOUT + (timeout or 0),
+                    ),
+                ) as response:
+                    if response.status == 401 and attempt == 0:
+                        self._renew(session)
+
+                        continue
+
+                    if response.status >= 400:
+                        text = await response.text()
+
+                        try:
+                            data = json.loads(text)
+
+                        except ValueError:
+                            data = {"message": text}
+
+                        self._raise_for_status(response.status, data)
+
+                    async for line in response.content:
+                        if not line.strip():
+                            continue
+
+                        event = json.loads(line)
+
+                        if event["object"].get("kind") == "Status":
+                            raise pykube.exceptions.HTTPError(
+                                event["object"].get("code"),
+                                event["object"].get("message"),
+                            )
+
+                        yield event["type"], event["object"]
+
+                    return
+
+
+client = KubernetesClient()
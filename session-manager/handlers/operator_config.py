@@ -103,6 +103,24 @@ AMPLITUDE_TRACKING_ID = xget(config_values, "workshopAnalytics.amplitude.trackin
 
 ANALYTICS_WEBHOOK_URL = xget(config_values, "workshopAnalytics.webhook.url", "")
 
+SESSION_PROVISIONING_CONCURRENCY = xget(
+    config_values, "sessionManager.provisioning.concurrency", 8
+)
+
+KUBERNETES_CLIENT_CONCURRENCY = xget(
+    config_values, "sessionManager.kubernetes.concurrency", 32
+)
+
+SSH_KEYS_TYPE = xget(config_values, "sessionManager.sshKeys.type", "rsa")
+SSH_KEYS_POOL_SIZE = xget(config_values, "sessionManager.sshKeys.poolSize", 10)
+
+REGISTRY_CREDENTIALS_BCRYPT_ROUNDS = xget(
+    config_values, "sessionManager.registryCredentials.bcryptRounds", 12
+)
+REGISTRY_CREDENTIALS_POOL_SIZE = xget(
+    config_values, "sessionManager.registryCredentials.poolSize", 10
+)
+
 
 def generate_password(length):
     characters = string.ascii_letters + string.digits
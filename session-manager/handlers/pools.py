@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("educates")
+
+# Items for all pools are generated in a single background thread, so that
+# refilling pools doesn't compete with handlers for more than one CPU.
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pools")
+
+
+class PregeneratedPool:
+    """Pool of items which are expensive to generate, such as key pairs and
+    password hashes for workshop sessions, so that the cost of generating an
+    item isn't incurred when creating a workshop session. When an item is taken
+    from the pool, the pool is refilled in the background. If the pool is
+    empty, such as when a burst of workshop sessions are being created, an item
+    is generated on demand. The generate function must be safe to call from a
+    separate thread and should release the GIL where possible."""
+
+    def __init__(self, name, generate, size):
+        self.name = name
+        self.generate = generate
+        self.size = max(0, size)
+        self.items = []
+        self.refill_task = None
+
+    def start(self, loop=None):
+        """Starts refilling the pool in the background if it isn't full and
+        isn't already being refilled. If the event loop isn't supplied this
+        must be called from within the event loop."""
+
+        if len(self.items) >= self.size:
+            return
+
+        if self.refill_task is None or self.refill_task.done():
+            loop = loop or asyncio.get_running_loop()
+            self.refill_task = loop.create_task(self.refill())
+
+    async def refill(self):
+        loop = asyncio.get_running_loop()
+
+        while len(self.items) < self.size:
+            try:
+                item = await loop.run_in_executor(_executor, self.generate)
+
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Unable to generate %s for pool.", self.name)
+
+                return
+
+            self.items.append(item)
+
+        logger.debug("Pool of %s filled with %d items.", self.name, len(self.items))
+
+    async def get(self):
+        """Returns an item from the pool, or a newly generated item if the
+        pool is empty, and starts refilling the pool."""
+
+        try:
+            item = self.items.pop()
+
+        except IndexError:
+            loop = asyncio.get_running_loop()
+
+            item = await loop.run_in_executor(None, self.generate)
+
+        self.start()
+
+        return item
@@ -0,0 +1,143 @@
+"""Creates the resources for a workshop session in parallel, respecting the
+dependencies between them."""
+
+import asyncio
+import logging
+
+from .kubeclient import client
+from .operator_config import SESSION_PROVISIONING_CONCURRENCY
+
+logger = logging.getLogger("educates")
+
+
+class ProvisioningStep:
+    """A step in a provisioning plan. The action is called with no arguments
+    and must return a coroutine to await. The step is only started once all
+    steps it depends on have completed successfully. The error handler, if
+    any, is called with the exception if this step caused the plan to fail."""
+
+    def __init__(self, key, action, depends, on_error):
+        self.key = key
+        self.action = action
+        self.depends = depends
+        self.on_error = on_error
+
+
+class ProvisioningPlan:
+    """Collects the Kubernetes objects to be created for a workshop session,
+    along with any other actions which need to be performed, and which steps
+    each depends on. When executed, steps whose dependencies have completed are
+    run concurrently as tasks in the event loop, bounded by the configured
+    concurrency, so that objects which don't depend on each other are created
+    in parallel rather than one at a time.
+
+    If any step fails, no further steps are started, and once steps still in
+    progress have completed, the error for the failed step which was added to
+    the plan first is raised. The error handler supplied for that step, if
+    any, is called and is expected to raise the exception to be reported to
+    kopf. This ensures failures are reported the same as if the steps had
+    been run one after the other.
+
+    """
+
+    def __init__(self, concurrency=SESSION_PROVISIONING_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.steps = {}
+
+    def __contains__(self, key):
+        return key in self.steps
+
+    def keys(self):
+        return list(self.steps.keys())
+
+    def add(self, key, action, depends=(), on_error=None):
+        """Adds a step to the plan which awaits the coroutine returned by
+        calling the action. The dependencies must be keys of steps already
+        added to the plan, which ensures the dependencies can't contain a
+        cycle. Returns the key of the step so it can be used in the
+        dependencies of a subsequent step."""
+
+        if key in self.steps:
+            raise ValueError(f"Duplicate provisioning step {key}.")
+
+        for dependency in depends:
+            if dependency not in self.steps:
+                raise ValueError(
+                    f"Unknown dependency {dependency} of provisioning step {key}."
+                )
+
+        self.steps[key] = ProvisioningStep(key, action, tuple(depends), on_error)
+
+        return key
+
+    def add_object(self, key, body, depends=(), on_error=None):
+        """Adds a step to the plan which creates the Kubernetes object."""
+
+        return self.add(key, lambda: client.create(body), depends, on_error)
+
+    async def execute(self):
+        """Runs the steps of the plan, starting each step as soon as the steps
+        it depends on have completed, with no more than the concurrency limit
+        in progress at once. Once a step fails no further steps are started,
+        and the error for the failed step added to the plan first is raised
+        after the steps still in progress have completed. If the handler is
+        cancelled, steps still in progress are cancelled. The plan is emptied
+        if all steps succeed, so it can be reused."""
+
+        pending = dict(self.steps)
+        completed = set()
+        failures = {}
+        running = {}
+
+        def start_ready_steps():
+            for key, step in list(pending.items()):
+                if len(running) >= self.concurrency:
+                    break
+
+                if all(dependency in completed for dependency in step.depends):
+                    del pending[key]
+                    running[asyncio.ensure_future(step.action())] = step
+
+        start_ready_steps()
+
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    list(running), return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    step = running.pop(task)
+
+                    exc = task.exception()
+
+                    if exc is not None:
+                        failures[step.key] = exc
+
+                    else:
+                        completed.add(step.key)
+
+                if not failures:
+                    start_ready_steps()
+
+        finally:
+            # If the handler is cancelled, steps still in progress are
+            # cancelled as well rather than being left running.
+
+            for task in running:
+                task.cancel()
+
+        if failures:
+            key = next(key for key in self.steps if key in failures)
+
+            step = self.steps[key]
+            exc = failures[key]
+
+            logger.debug("Provisioning step %s failed: %s", key, exc)
+
+            if step.on_error is not None:
+                step.on_error(exc)
+
+            raise exc
+
+        self.steps.clear()
@@ -0,0 +1,46 @@
+import functools
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from .pools import PregeneratedPool
+from .operator_config import SSH_KEYS_POOL_SIZE, SSH_KEYS_TYPE
+
+
+def generate_ssh_key_pair(key_type="rsa"):
+    """Generates a SSH key pair, returning the private key in PEM format and
+    the public key in OpenSSH format. Ed25519 keys are much cheaper to generate
+    than RSA keys, but the private key has to be saved in OpenSSH format as
+    the traditional format is only supported for RSA keys."""
+
+    if key_type == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+
+        private_format = serialization.PrivateFormat.OpenSSH
+
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        private_format = serialization.PrivateFormat.TraditionalOpenSSL
+
+    private_bytes = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=private_format,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+
+    public_bytes = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.OpenSSH,
+        format=serialization.PublicFormat.OpenSSH,
+    )
+
+    return private_bytes.decode("utf-8"), public_bytes.decode("utf-8")
+
+
+# Pool of SSH key pairs for workshop sessions.
+
+ssh_key_pool = PregeneratedPool(
+    "SSH key pairs",
+    functools.partial(generate_ssh_key_pair, SSH_KEYS_TYPE),
+    SSH_KEYS_POOL_SIZE,
+)
@@ -0,0 +1,113 @@
+import math
+import time
+import logging
+
+import pykube
+
+from .kubeclient import client
+
+logger = logging.getLogger("educates")
+
+# Default time in seconds to wait on a condition for Kubernetes resources
+# before giving up.
+
+WAIT_TIMEOUT = 5.0
+
+
+async def wait_for_resources(
+    api_version, kind, namespace, condition, field_selector=None, timeout=WAIT_TIMEOUT
+):
+    """Waits until the condition holds for the resources of the kind in the
+    namespace, optionally restricted by a field selector. The condition is
+    passed a dictionary of the resource objects keyed by name and should
+    return whether the condition holds. Rather than polling, the resources are
+    listed once and the list then kept up to date by watching for changes,
+    starting from the resource version of the list, so the wait ends as soon as
+    the condition holds. Returns whether the condition held before the deadline
+    was reached.
+
+    """
+
+    deadline = time.monotonic() + timeout
+
+    while True:
+        response = await client.list(
+            api_version, kind, namespace, field_selector=field_selector
+        )
+
+        resources = {
+            item["metadata"]["name"]: item for item in response.get("items") or []
+        }
+
+        if condition(resources):
+            return True
+
+        remaining = deadline - time.monotonic()
+
+        if remaining <= 0:
+            return False
+
+        # The API server closes the watch when the timeout passes, so the
+        # deadline is enforced even if no further events are received.
+
+        try:
+            async for event_type, resource in client.watch(
+                api_version,
+                kind,
+                namespace,
+                field_selector=field_selector,
+                resource_version=response["metadata"]["resourceVersion"],
+                timeout=math.ceil(remaining),
+            ):
+                name = resource["metadata"]["name"]
+
+                if event_type == "DELETED":
+                    resources.pop(name, None)
+
+                elif event_type in ("ADDED", "MODIFIED"):
+                    resources[name] = resource
+
+                if condition(resources):
+                    return True
+
+                if time.monotonic() >= deadline:
+                    return False
+
+        except pykube.exceptions.HTTPError as exc:
+            # The resource version used to start the watch may have expired,
+            # in which case the resources are listed again before resuming.
+
+            logger.debug("Watch of %s failed: %s", kind, exc)
+
+        if time.monotonic() >= deadline:
+            return False
+
+
+async def wait_for_resource(
+    api_version, kind, namespace, name, condition=None, **kwargs
+):
+    """Waits until the named resource exists and, if a condition is supplied,
+    the condition holds for the resource object. A field selector is used so
+    that only changes to the named resource are watched."""
+
+    def check(resources):
+        resource = resources.get(name)
+        return resource is not None and (condition is None or condition(resource))
+
+    return await wait_for_resources(
+        api_version,
+        kind,
+        namespace,
+        check,
+        field_selector={"metadata.name": name},
+        **kwargs,
+    )
+
+
+def resource_quota_ready(resource_quota):
+    """Checks whether the hard limits and usage of a resource quota have been
+    calculated and added to its status."""
+
+    status = resource_quota.get("status") or {}
+
+    return bool(status.get("hard")) and bool(status.get("used"))
@@ -4,9 +4,8 @@ import logging
 import base64
 
 import kopf
-import pykube
 
-from .objects import create_from_dict
+from .kubeclient import client
 from .helpers import xget, substitute_variables
 from .analytics import report_analytics_event
 
@@ -18,8 +17,6 @@ from .operator_config import (
 
 logger = logging.getLogger("educates.workshopallocation")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.index(
     "",
@@ -33,7 +30,7 @@ api = pykube.HTTPClient(pykube.KubeConfig.from_env())
         f"training.{OPERATOR_API_GROUP}/session.name": kopf.PRESENT,
     },
 )
-def session_variables_secret_index(
+async def session_variables_secret_index(
     namespace,
     name,
     body,
@@ -72,7 +69,7 @@ def session_variables_secret_index(
         f"training.{OPERATOR_API_GROUP}/session.name": kopf.PRESENT,
     },
 )
-def request_variables_secret_index(
+async def request_variables_secret_index(
     namespace,
     name,
     body,
@@ -107,7 +104,7 @@ def request_variables_secret_index(
     "v1beta1",
     "workshopallocations",
 )
-def workshop_allocation_resume(name, **_):
+async def workshop_allocation_resume(name, **_):
     """Used to acknowledge that an existing workshop allocation request has been
     processed. This is because when the operator is restarted, the workshop
     allocation request for an active workshop session will still exist in the
@@ -124,7 +121,7 @@ def workshop_allocation_resume(name, **_):
     "v1beta1",
     "workshopallocations",
 )
-def workshop_allocation_create(
+async def workshop_allocation_create(
     name,
     body,
     uid,
@@ -483,7 +480,7 @@ def workshop_allocation_create(
                 session_name,
             )
 
-            create_from_dict(object_body)
+            await client.create(object_body)
 
         except Exception as exc:
             logger.exception(
@@ -530,7 +527,7 @@ def workshop_allocation_create(
 @kopf.on.delete(
     f"training.{OPERATOR_API_GROUP}", "v1beta1", "workshopallocations", optional=True
 )
-def workshop_allocation_delete(name, **_):
+async def workshop_allocation_delete(name, **_):
     """Nothing to do here at this point because the owner references will
     ensure that everything is cleaned up appropriately."""
 
@@ -541,7 +538,9 @@ def workshop_allocation_delete(name, **_):
 
 
 @kopf.on.event(f"training.{OPERATOR_API_GROUP}", "v1beta1", "workshopallocations")
-def workshop_allocation_event(type, event, **_):  # pylint: disable=redefined-builtin
+async def workshop_allocation_event(
+    type, event, **_
+):  # pylint: disable=redefined-builtin
     """Log when a workshop allocation request is deleted."""
 
     if type == "DELETED":
@@ -5,6 +5,7 @@ import kopf
 import pykube
 
 from .objects import WorkshopEnvironment, WorkshopSession
+from .kubeclient import client
 from .helpers import substitute_variables
 
 from .operator_config import (
@@ -17,8 +18,6 @@ from .operator_config import (
 
 __all__ = ["workshop_request_create", "workshop_request_delete"]
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.on.create(
     f"training.{OPERATOR_API_GROUP}",
@@ -26,7 +25,7 @@ api = pykube.HTTPClient(pykube.KubeConfig.from_env())
     "workshoprequests",
     id=OPERATOR_STATUS_KEY,
 )
-def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
+async def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     # The name of the custom resource for requesting a workshop doesn't
     # matter, we are going to generate a uniquely named session custom
     # resource anyway. First lookup up the desired workshop environment
@@ -42,8 +41,8 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     environment_name = spec["environment"]["name"]
 
     try:
-        environment_instance = WorkshopEnvironment.objects(api).get(
-            name=environment_name
+        environment_instance = await client.get(
+            WorkshopEnvironment.version, WorkshopEnvironment.kind, environment_name
         )
 
     except pykube.exceptions.ObjectDoesNotExist:
@@ -55,8 +54,8 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     # Check if the request comes from a namespace which is permitted to
     # access the workshop and/or provides the required access token.
 
-    if environment_instance.obj["spec"].get("request"):
-        enabled = environment_instance.obj["spec"]["request"].get("enabled", False)
+    if environment_instance["spec"].get("request"):
+        enabled = environment_instance["spec"]["request"].get("enabled", False)
 
         if not enabled:
             patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Pending"}}
@@ -64,8 +63,8 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
                 f"Workshop request not permitted for workshop environment."
             )
 
-        namespaces = environment_instance.obj["spec"]["request"].get("namespaces", [])
-        token = environment_instance.obj["spec"]["request"].get("token")
+        namespaces = environment_instance["spec"]["request"].get("namespaces", [])
+        token = environment_instance["spec"]["request"].get("token")
 
         environment_variables = dict(workshop_namespace=environment_name)
 
@@ -89,9 +88,9 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     username = "educates"
     password = None
 
-    if environment_instance.obj["spec"].get("session"):
-        username = environment_instance.obj["spec"]["session"].get("username", username)
-        password = environment_instance.obj["spec"]["session"].get("password")
+    if environment_instance["spec"].get("session"):
+        username = environment_instance["spec"]["session"].get("username", username)
+        password = environment_instance["spec"]["session"].get("password")
 
     if password is None:
         characters = string.ascii_letters + string.digits
@@ -101,7 +100,7 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
     # yet. To do this we need to actually attempt to create the session
     # custom resource and keep trying again if it exists.
 
-    env = environment_instance.obj.get("spec", {}).get("session", {}).get("env", [])
+    env = environment_instance.get("spec", {}).get("session", {}).get("env", [])
 
     def _generate_random_session_id(n=5):
         return "".join(
@@ -154,10 +153,10 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
             },
         }
 
-        kopf.append_owner_reference(session_body, owner=environment_instance.obj)
+        kopf.append_owner_reference(session_body, owner=environment_instance)
 
         try:
-            WorkshopSession(api, session_body).create()
+            await client.create(session_body)
 
         except pykube.exceptions.PyKubeError as exc:
             if exc.code == 409:
@@ -167,7 +166,9 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
                 continue
 
         try:
-            session_instance = WorkshopSession.objects(api).get(name=session_name)
+            session_instance = await client.get(
+                WorkshopSession.version, WorkshopSession.kind, session_name
+            )
 
         except Exception:
             patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Failed"}}
@@ -184,13 +185,13 @@ def workshop_request_create(name, uid, namespace, spec, patch, logger, **_):
             "kind": "WorkshopSession",
             "apiVersion": f"training.{OPERATOR_API_GROUP}/v1beta1",
             "name": session_name,
-            "uid": session_instance.obj["metadata"]["uid"],
+            "uid": session_instance["metadata"]["uid"],
         },
     }
 
 
 @kopf.on.delete(f"training.{OPERATOR_API_GROUP}", "v1beta1", "workshoprequests")
-def workshop_request_delete(name, uid, namespace, spec, status, logger, **_):
+async def workshop_request_delete(name, uid, namespace, spec, status, logger, **_):
     # We need to pull the session details from the status of the request,
     # look it up to see if it still exists, verify we created it, and then
     # delete it.
@@ -203,12 +204,14 @@ def workshop_request_delete(name, uid, namespace, spec, status, logger, **_):
     session_name = session_details["name"]
 
     try:
-        session_instance = WorkshopSession.objects(api).get(name=session_name)
+        session_instance = await client.get(
+            WorkshopSession.version, WorkshopSession.kind, session_name
+        )
 
     except pykube.exceptions.ObjectDoesNotExist:
         return
 
-    request_details = session_instance.obj["spec"].get("request")
+    request_details = session_instance["spec"].get("request")
 
     if (
         not request_details
@@ -218,8 +221,4 @@ def workshop_request_delete(name, uid, namespace, spec, status, logger, **_):
     ):
         return
 
-    try:
-        session_instance.delete()
-
-    except pykube.exceptions.ObjectDoesNotExist:
-        pass
+    await client.delete(WorkshopSession.version, WorkshopSession.kind, session_name)
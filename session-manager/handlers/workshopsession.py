@@ -1,22 +1,22 @@
-import time
 import random
+import functools
 import string
 import base64
 import json
 import copy
 import logging
 
-import bcrypt
-
 import kopf
 import pykube
 import yaml
 
-import cryptography.hazmat.primitives
-import cryptography.hazmat.primitives.asymmetric
-
 from .namespace_budgets import namespace_budgets
-from .objects import create_from_dict, WorkshopEnvironment
+from .objects import WorkshopEnvironment
+from .kubeclient import client
+from .sshkeys import ssh_key_pool
+from .credentials import registry_credentials_pool
+from .provisioning import ProvisioningPlan
+from .waiters import wait_for_resource, wait_for_resources, resource_quota_ready
 from .helpers import (
     xget,
     substitute_variables,
@@ -61,11 +61,9 @@ __all__ = ["workshop_session_create", "workshop_session_delete"]
 
 logger = logging.getLogger("educates.workshopsession")
 
-api = pykube.HTTPClient(pykube.KubeConfig.from_env())
-
 
 @kopf.index(f"training.{OPERATOR_API_GROUP}", "v1beta1", "workshopsessions")
-def workshop_session_index(name, meta, body, **_):
+async def workshop_session_index(name, meta, body, **_):
     """Keeps an index of the workshop session. This is used to allow
     workshop sessions to be found when processing a workshop allocation
     request."""
@@ -84,7 +82,7 @@ def workshop_session_index(name, meta, body, **_):
     "v1beta1",
     "workshopsessions",
 )
-def workshop_session_resume(name, **_):
+async def workshop_session_resume(name, **_):
     """Used to acknowledge that there was an existing workshop session
     resource found when the operator started up."""
 
@@ -94,7 +92,7 @@ def workshop_session_resume(name, **_):
     )
 
 
-def _setup_session_namespace(
+async def _setup_session_namespace(
     primary_namespace_body,
     workshop_name,
     portal_name,
@@ -119,17 +117,15 @@ def _setup_session_namespace(
     # must always exist. Others are more problematic since they may or may not
     # exist.
 
-    for _ in range(25):
-        try:
-            service_account_instance = pykube.ServiceAccount.objects(
-                api, namespace=target_namespace
-            ).get(name="default")
+    if not await wait_for_resource("v1", "ServiceAccount", target_namespace, "default"):
+        logger.warning(
+            "Default service account not created in namespace %s.", target_namespace
+        )
 
-        except pykube.exceptions.ObjectDoesNotExist:
-            time.sleep(0.1)
+    # The remaining resources for the namespace don't depend on each other, so
+    # are added to a provisioning plan so they can be created in parallel.
 
-        else:
-            break
+    plan = ProvisioningPlan()
 
     # Determine which limit ranges and resources quotas to be used.
 
@@ -167,25 +163,26 @@ def _setup_session_namespace(
     # the workshop will define any limit ranges and resource quotas itself.
 
     if budget != "default":
-        for limit_range in pykube.LimitRange.objects(
-            api, namespace=target_namespace
-        ).all():
-            try:
-                limit_range.delete()
-            except pykube.exceptions.ObjectDoesNotExist:
-                pass
+        limit_ranges = await client.list("v1", "LimitRange", target_namespace)
+
+        for limit_range in limit_ranges["items"]:
+            await client.delete(
+                "v1", "LimitRange", limit_range["metadata"]["name"], target_namespace
+            )
 
     # Delete any resource quotas applied to the namespace that may conflict with
     # the resource quotas being applied.
 
     if budget != "default":
-        for resource_quota in pykube.ResourceQuota.objects(
-            api, namespace=target_namespace
-        ).all():
-            try:
-                resource_quota.delete()
-            except pykube.exceptions.ObjectDoesNotExist:
-                pass
+        resource_quotas = await client.list("v1", "ResourceQuota", target_namespace)
+
+        for resource_quota in resource_quotas["items"]:
+            await client.delete(
+                "v1",
+                "ResourceQuota",
+                resource_quota["metadata"]["name"],
+                target_namespace,
+            )
 
     # If there is a CIDR list of networks to block create a network policy in
     # the target session environment to restrict access from all pods. The
@@ -241,11 +238,7 @@ def _setup_session_namespace(
 
         kopf.adopt(network_policy_body, primary_namespace_body)
 
-        NetworkPolicy = pykube.object_factory(
-            api, "networking.k8s.io/v1", "NetworkPolicy"
-        )
-
-        NetworkPolicy(api, network_policy_body).create()
+        plan.add_object("network-policy", network_policy_body)
 
     # Create role binding in the namespace so the service account under which
     # the workshop environment runs can create resources in it. We only allow a
@@ -301,7 +294,7 @@ def _setup_session_namespace(
             ],
         }
 
-        pykube.RoleBinding(api, role_binding_body).create()
+        plan.add_object("session-role", role_binding_body)
 
     # Create rolebinding so that all service accounts in the namespace are bound
     # by the specified security policy.
@@ -337,7 +330,7 @@ def _setup_session_namespace(
             ],
         }
 
-        pykube.RoleBinding(api, psp_role_binding_body).create()
+        plan.add_object("security-policy", psp_role_binding_body)
 
     if CLUSTER_SECURITY_POLICY_ENGINE == "security-context-constraints":
         scc_role_binding_body = {
@@ -370,7 +363,7 @@ def _setup_session_namespace(
             ],
         }
 
-        pykube.RoleBinding(api, scc_role_binding_body).create()
+        plan.add_object("security-policy", scc_role_binding_body)
 
     # Create secret which holds image registry '.docker/config.json' and apply
     # it to the default service account in the target namespace so that any
@@ -406,7 +399,7 @@ def _setup_session_namespace(
             "stringData": {".dockerconfigjson": json.dumps(registry_config, indent=4)},
         }
 
-        pykube.Secret(api, secret_body).create()
+        plan.add_object("registry-credentials", secret_body)
 
     # Create limit ranges for the namespace so any deployments will have default
     # memory/cpu min and max values.
@@ -428,7 +421,7 @@ def _setup_session_namespace(
 
         resource_limits_body["metadata"]["namespace"] = target_namespace
 
-        pykube.LimitRange(api, resource_limits_body).create()
+        plan.add_object("resource-limits", resource_limits_body)
 
     # Create resource quotas for the namespace so there is a maximum for what
     # resources can be used.
@@ -450,7 +443,7 @@ def _setup_session_namespace(
 
         resource_quota_body["metadata"]["namespace"] = target_namespace
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
+        plan.add_object("compute-resources", resource_quota_body)
 
         resource_quota_body = copy.deepcopy(compute_resources_timebound_definition)
 
@@ -468,7 +461,7 @@ def _setup_session_namespace(
 
         resource_quota_body["metadata"]["namespace"] = target_namespace
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
+        plan.add_object("compute-resources-timebound", resource_quota_body)
 
         resource_quota_body = copy.deepcopy(object_counts_definition)
 
@@ -486,29 +479,51 @@ def _setup_session_namespace(
 
         resource_quota_body["metadata"]["namespace"] = target_namespace
 
-        pykube.ResourceQuota(api, resource_quota_body).create()
+        plan.add_object("object-counts", resource_quota_body)
+
+    await plan.execute()
 
+    if budget not in ("default", "custom"):
         # Verify that the status of the resource quotas have been updated. If we
         # don't do this, then the calculated hard limits may not be calculated
         # before we start creating resources in the namespace resulting in a
         # failure. If we can't manage to verify quotas after a period, give up.
         # This may result in a subsequent failure.
 
-        for _ in range(25):
-            resource_quotas = pykube.ResourceQuota.objects(
-                api, namespace=target_namespace
-            ).all()
+        if not await wait_for_resources(
+            "v1",
+            "ResourceQuota",
+            target_namespace,
+            lambda resource_quotas: all(
+                map(resource_quota_ready, resource_quotas.values())
+            ),
+        ):
+            logger.warning(
+                "Resource quotas not verified in namespace %s.", target_namespace
+            )
+
+
+async def _create_resource_quota(object_body):
+    await client.create(object_body)
 
-            for resource_quota in resource_quotas:
-                if (
-                    not resource_quota.obj.get("status")
-                    or not resource_quota.obj["status"].get("used")
-                    or not resource_quota.obj["status"].get("hard")
-                ):
-                    time.sleep(0.1)
-                    continue
+    # Verify that the status of the resource quota has been updated. If we
+    # don't do this, then the calculated hard limits may not be calculated
+    # before we start creating resources in the namespace resulting in a
+    # failure. If we can't manage to verify quotas after a period, give up.
+    # This may result in a subsequent failure.
 
-            break
+    if not await wait_for_resource(
+        "v1",
+        "ResourceQuota",
+        object_body["metadata"]["namespace"],
+        object_body["metadata"]["name"],
+        resource_quota_ready,
+    ):
+        logger.warning(
+            "Resource quota %s not verified in namespace %s.",
+            object_body["metadata"]["name"],
+            object_body["metadata"]["namespace"],
+        )
 
 
 @kopf.on.create(
@@ -516,7 +531,9 @@ def _setup_session_namespace(
     "v1beta1",
     "workshopsessions",
 )
-def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, **_):
+async def workshop_session_create(
+    name, body, meta, uid, spec, status, patch, retry, **_
+):
     # Report analytics event indicating processing workshop session.
 
     report_analytics_event(
@@ -555,8 +572,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     session_name = name
 
     try:
-        environment_instance = WorkshopEnvironment.objects(api).get(
-            name=workshop_namespace
+        environment_instance = await client.get(
+            WorkshopEnvironment.version, WorkshopEnvironment.kind, workshop_namespace
         )
 
     except pykube.exceptions.ObjectDoesNotExist as exc:
@@ -568,7 +585,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     session_id = spec["session"]["id"]
     session_namespace = f"{workshop_namespace}-{session_id}"
 
-    environment_uid = environment_instance.obj["metadata"]["uid"]
+    environment_uid = environment_instance["metadata"]["uid"]
 
     # Can optionally be passed name of the training portal via a label
     # when the workshop environment is created as a child to a training
@@ -586,16 +603,16 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     # custom resource for the workshop. We use a copy so we aren't affected by
     # changes in the original workshop made after the environment was created.
 
-    if not environment_instance.obj.get("status") or not environment_instance.obj[
-        "status"
-    ].get(OPERATOR_STATUS_KEY):
+    if not environment_instance.get("status") or not environment_instance["status"].get(
+        OPERATOR_STATUS_KEY
+    ):
         patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Pending"}}
         raise kopf.TemporaryError(f"Environment {workshop_namespace} is not ready.")
 
-    workshop_name = environment_instance.obj["status"][OPERATOR_STATUS_KEY]["workshop"][
+    workshop_name = environment_instance["status"][OPERATOR_STATUS_KEY]["workshop"][
         "name"
     ]
-    workshop_spec = environment_instance.obj["status"][OPERATOR_STATUS_KEY]["workshop"][
+    workshop_spec = environment_instance["status"][OPERATOR_STATUS_KEY]["workshop"][
         "spec"
     ]
 
@@ -614,7 +631,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     # Calculate session cookie domain to use.
 
-    cookie_domain = environment_instance.obj["spec"].get("cookies", {}).get("domain")
+    cookie_domain = environment_instance["spec"].get("cookies", {}).get("domain")
 
     if not cookie_domain:
         cookie_domain = SESSION_COOKIE_DOMAIN
@@ -652,14 +669,20 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             .get("policy", namespace_security_policy)
         )
 
-    # Generate a random password for the image registry if required.
+    # Obtain a random password for the image registry if required. Passwords
+    # are generated ahead of time in the background along with the hash of the
+    # password needed for the registry htpasswd file, as calculating the hash
+    # is CPU intensive.
 
     characters = string.ascii_letters + string.digits
 
     if applications.is_enabled("registry"):
         registry_host = f"registry-{session_namespace}.{INGRESS_DOMAIN}"
         registry_username = session_namespace
-        registry_password = "".join(random.sample(characters, 32))
+
+        registry_password, registry_htpasswd_hash = (
+            await registry_credentials_pool.get()
+        )
 
         registry_auth_token = (
             base64.b64encode(f"{registry_username}:{registry_password}".encode("utf-8"))
@@ -700,8 +723,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     for secret_item in workshop_spec.get("environment", {}).get("secrets", []):
         try:
-            secret = pykube.Secret.objects(api, namespace=workshop_namespace).get(
-                name=secret_item["name"]
+            secret = await client.get(
+                "v1", "Secret", secret_item["name"], workshop_namespace
             )
 
         except pykube.exceptions.ObjectDoesNotExist as exc:
@@ -725,7 +748,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         # filesystem via a projected volume. Drop the manage fields property
         # so not so much noise.
 
-        secret_obj = copy.deepcopy(secret.obj)
+        secret_obj = copy.deepcopy(secret)
         secret_obj["metadata"].pop("managedFields", None)
         environment_secrets[f"{secret_item['name']}.yaml"] = base64.b64encode(
             yaml.dump(secret_obj, Dumper=yaml.Dumper).encode("utf-8")
@@ -766,7 +789,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     kopf.adopt(namespace_body)
 
     try:
-        pykube.Namespace(api, namespace_body).create()
+        await client.create(namespace_body)
 
     except pykube.exceptions.PyKubeError as exc:
         if exc.code == 409:
@@ -777,7 +800,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         raise
 
     try:
-        namespace_instance = pykube.Namespace.objects(api).get(name=session_namespace)
+        namespace_instance = await client.get("v1", "Namespace", session_namespace)
 
     # To get resource uuid for the namespace so can make it the parent of all
     # other resources created, we need to query it back. If this fails something
@@ -790,37 +813,26 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             f"Failed to fetch namespace {session_namespace}."
         ) from exc
 
-    # Generate a SSH key pair for injection into workshop container and any
-    # potential services that need it.
-
-    private_key = cryptography.hazmat.primitives.asymmetric.rsa.generate_private_key(
-        public_exponent=65537, key_size=2048
-    )
-
-    unencrypted_pem_private_key = private_key.private_bytes(
-        encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
-        format=cryptography.hazmat.primitives.serialization.PrivateFormat.TraditionalOpenSSL,
-        encryption_algorithm=cryptography.hazmat.primitives.serialization.NoEncryption(),
-    )
-
-    rsa_public_key = private_key.public_key().public_bytes(
-        encoding=cryptography.hazmat.primitives.serialization.Encoding.OpenSSH,
-        format=cryptography.hazmat.primitives.serialization.PublicFormat.OpenSSH,
-    )
-
-    # pem_public_key = private_key.public_key().public_bytes(
-    #     encoding=cryptography.hazmat.primitives.serialization.Encoding.PEM,
-    #     format=cryptography.hazmat.primitives.serialization.PublicFormat.SubjectPublicKeyInfo,
-    # )
+    # Obtain a SSH key pair for injection into workshop container and any
+    # potential services that need it. Key pairs are generated ahead of time
+    # in the background as generating them is CPU intensive.
 
-    ssh_private_key = unencrypted_pem_private_key.decode("utf-8")
-    ssh_public_key = rsa_public_key.decode("utf-8")
+    ssh_private_key, ssh_public_key = await ssh_key_pool.get()
 
     # For unexpected errors beyond this point we will set the status to say
     # things Failed since we can't really recover.
 
     patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Failed"}}
 
+    # Kubernetes resources for the workshop session are not created as we go
+    # but are added to a provisioning plan, along with the resources each
+    # depends on. The plan is executed at the end, with resources which don't
+    # depend on each other being created in parallel. Where creation of a
+    # resource fails, the error handler for it sets the status and raises the
+    # appropriate error as if the resource had been created at that point.
+
+    plan = ProvisioningPlan()
+
     # Create the service account under which the workshop session
     # instance will run. This is created in the workshop namespace. As
     # with the separate namespace, make the session custom resource the
@@ -849,14 +861,16 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         },
     }
 
-    kopf.adopt(service_account_body, namespace_instance.obj)
+    kopf.adopt(service_account_body, namespace_instance)
 
-    try:
-        pykube.ServiceAccount(api, service_account_body).create()
+    def service_account_error(exc):
+        if not isinstance(exc, pykube.exceptions.PyKubeError):
+            return
 
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
-            "Unexpected error creating service account %s.", service_account
+        logger.error(
+            "Unexpected error creating service account %s.",
+            service_account,
+            exc_info=exc,
         )
         patch["status"] = {
             OPERATOR_STATUS_KEY: {
@@ -868,6 +882,10 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             f"Failed to create service account {service_account}: {exc}"
         ) from exc
 
+    plan.add_object(
+        "service-account", service_account_body, on_error=service_account_error
+    )
+
     service_account_token_body = {
         "apiVersion": "v1",
         "kind": "Secret",
@@ -884,14 +902,16 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         "type": "kubernetes.io/service-account-token",
     }
 
-    kopf.adopt(service_account_token_body, namespace_instance.obj)
+    kopf.adopt(service_account_token_body, namespace_instance)
 
-    try:
-        pykube.Secret(api, service_account_token_body).create()
+    def service_account_token_error(exc):
+        if not isinstance(exc, pykube.exceptions.PyKubeError):
+            return
 
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
-            "Unexpected error creating access token %s-token.", service_account
+        logger.error(
+            "Unexpected error creating access token %s-token.",
+            service_account,
+            exc_info=exc,
         )
         patch["status"] = {
             OPERATOR_STATUS_KEY: {
@@ -903,6 +923,16 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             f"Failed to create access token {service_account}-token: {exc}"
         )
 
+    # The access token can only be created once the service account exists,
+    # otherwise it will be deleted by Kubernetes.
+
+    plan.add_object(
+        "service-account-token",
+        service_account_token_body,
+        depends=["service-account"],
+        on_error=service_account_token_error,
+    )
+
     # Create the rolebinding for this service account to add access to
     # the additional roles that the Kubernetes web console requires.
 
@@ -935,16 +965,17 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         ],
     }
 
-    kopf.adopt(cluster_role_binding_body, namespace_instance.obj)
+    kopf.adopt(cluster_role_binding_body, namespace_instance)
 
-    try:
-        pykube.ClusterRoleBinding(api, cluster_role_binding_body).create()
+    def cluster_role_binding_error(exc):
+        if not isinstance(exc, pykube.exceptions.PyKubeError):
+            return
 
-    except pykube.exceptions.PyKubeError as exc:
-        logger.exception(
+        logger.error(
             "Unexpected error creating cluster role binding %s-web-console-%s.",
             OPERATOR_NAME_PREFIX,
             session_namespace,
+            exc_info=exc,
         )
         patch["status"] = {
             OPERATOR_STATUS_KEY: {
@@ -956,10 +987,21 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             f"Failed to create cluster role binding {OPERATOR_NAME_PREFIX}-web-console-{session_namespace}: {exc}"
         )
 
-    # Setup configuration on the primary session namespace.
+    plan.add_object(
+        "cluster-role-binding",
+        cluster_role_binding_body,
+        on_error=cluster_role_binding_error,
+    )
+
+    # Setup configuration on the primary session namespace. Session objects
+    # are only created once all session namespaces have been setup, so keep
+    # track of the steps which do this.
 
-    _setup_session_namespace(
-        namespace_instance.obj,
+    namespace_steps = []
+
+    setup_session_namespace = functools.partial(
+        _setup_session_namespace,
+        namespace_instance,
         workshop_name,
         portal_name,
         portal_uid,
@@ -977,6 +1019,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
         namespace_security_policy,
     )
 
+    namespace_steps.append(plan.add("primary:setup", setup_session_namespace))
+
     # List of variables that can be replaced in session objects etc. For those
     # set by applications they are passed through from when the workshop
     # environment was processed. We need to substitute and session variables
@@ -994,8 +1038,8 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     if xget(workshop_spec, "environment.images.ingress.enabled", False):
         oci_image_cache = f"images-{workshop_namespace}.{INGRESS_DOMAIN}"
 
-    image_registry_host = xget(environment_instance.obj, "spec.registry.host")
-    image_registry_namespace = xget(environment_instance.obj, "spec.registry.namespace")
+    image_registry_host = xget(environment_instance, "spec.registry.host")
+    image_registry_namespace = xget(environment_instance, "spec.registry.namespace")
 
     if image_registry_host:
         if image_registry_namespace:
@@ -1131,9 +1175,9 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                 "storageClassName"
             ] = CLUSTER_STORAGE_CLASS
 
-        kopf.adopt(persistent_volume_claim_body, namespace_instance.obj)
+        kopf.adopt(persistent_volume_claim_body, namespace_instance)
 
-        pykube.PersistentVolumeClaim(api, persistent_volume_claim_body).create()
+        plan.add_object("storage", persistent_volume_claim_body)
 
     # Create secret containing session variables for later use when allocating
     # a user to a workshop session.
@@ -1165,18 +1209,18 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     variables_secret_body["data"] = variables_data
 
-    kopf.adopt(variables_secret_body, namespace_instance.obj)
+    kopf.adopt(variables_secret_body, namespace_instance)
 
-    try:
-        pykube.Secret(api, variables_secret_body).create()
-
-    except pykube.exceptions.PyKubeError as exc:
-        if exc.code == 409:
+    def variables_secret_error(exc):
+        if isinstance(exc, pykube.exceptions.PyKubeError) and exc.code == 409:
             patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Failed"}}
             raise kopf.TemporaryError(
                 f"Session variables secret {session_namespace}-session already exists."
             )
-        raise
+
+    plan.add_object(
+        "variables-secret", variables_secret_body, on_error=variables_secret_error
+    )
 
     # Create any secondary namespaces required for the session.
 
@@ -1184,7 +1228,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
     if workshop_spec.get("session"):
         namespaces = workshop_spec["session"].get("namespaces", {}).get("secondary", [])
-        for namespaces_item in namespaces:
+        for namespace_index, namespaces_item in enumerate(namespaces):
             target_namespace = substitute_variables(
                 namespaces_item["name"], session_variables
             )
@@ -1226,21 +1270,24 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                     "pod-security.kubernetes.io/enforce"
                 ] = target_security_policy
 
-            kopf.adopt(namespace_body, namespace_instance.obj)
-
-            try:
-                pykube.Namespace(api, namespace_body).create()
+            kopf.adopt(namespace_body, namespace_instance)
 
-            except pykube.exceptions.PyKubeError as exc:
-                if exc.code == 409:
+            def secondary_namespace_error(exc, target_namespace=target_namespace):
+                if isinstance(exc, pykube.exceptions.PyKubeError) and exc.code == 409:
                     patch["status"] = {OPERATOR_STATUS_KEY: {"phase": "Failed"}}
                     raise kopf.TemporaryError(
                         f"Secondary namespace {target_namespace} already exists."
                     )
-                raise
 
-            _setup_session_namespace(
-                namespace_instance.obj,
+            namespace_step = plan.add_object(
+                f"secondary:{namespace_index}",
+                namespace_body,
+                on_error=secondary_namespace_error,
+            )
+
+            setup_session_namespace = functools.partial(
+                _setup_session_namespace,
+                namespace_instance,
                 workshop_name,
                 portal_name,
                 portal_uid,
@@ -1258,6 +1305,14 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                 target_security_policy,
             )
 
+            namespace_steps.append(
+                plan.add(
+                    f"secondary:{namespace_index}:setup",
+                    setup_session_namespace,
+                    depends=[namespace_step],
+                )
+            )
+
     # Create any additional resource objects required for the session.
     #
     # XXX For now make the session resource definition the parent of
@@ -1279,7 +1334,50 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     if workshop_spec.get("session"):
         objects.extend(workshop_spec["session"].get("objects", []))
 
-    for object_body in objects:
+    # Session objects are created one after the other in the order given, as
+    # later objects may depend on earlier ones, such as objects created in a
+    # namespace also defined as a session object. They are created in parallel
+    # with other resources for the session, but only after all the session
+    # namespaces have been setup.
+
+    def session_object_error(object_name, object_type, object_namespace):
+        def handler(exc):
+            logger.error(
+                "Unable to create workshop session objects, failed creating object %s of type %s in namespace %s for workshop session %s.",
+                object_name,
+                object_type,
+                object_namespace,
+                session_name,
+                exc_info=exc,
+            )
+
+            report_analytics_event(
+                "Resource/PermanentError",
+                {
+                    "kind": "WorkshopSession",
+                    "name": name,
+                    "uid": uid,
+                    "retry": retry,
+                    "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
+                },
+            )
+
+            patch["status"] = {
+                OPERATOR_STATUS_KEY: {
+                    "phase": "Failed",
+                    "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
+                }
+            }
+
+            raise kopf.PermanentError(
+                f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}."
+            ) from exc
+
+        return handler
+
+    object_step = None
+
+    for object_index, object_body in enumerate(objects):
         object_body = substitute_variables(object_body, session_variables)
 
         if not object_body["metadata"].get("namespace"):
@@ -1303,7 +1401,39 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             }
         )
 
-        kopf.adopt(object_body, namespace_instance.obj)
+        kopf.adopt(object_body, namespace_instance)
+
+        object_depends = list(namespace_steps)
+
+        if object_step:
+            object_depends.append(object_step)
+
+        async def create_session_object(
+            object_body=object_body,
+            object_name=object_name,
+            object_type=object_type,
+            object_namespace=object_namespace,
+            object_api_version=object_api_version,
+        ):
+            logger.info(
+                "Creating workshop session object %s of type %s in namespace %s for workshop session %s.",
+                object_name,
+                object_type,
+                object_namespace,
+                session_name,
+            )
+
+            if object_api_version == "v1" and object_type.lower() == "resourcequota":
+                await _create_resource_quota(object_body)
+            else:
+                await client.create(object_body)
+
+        object_step = plan.add(
+            f"object:{object_index}:{object_type}:{object_namespace}:{object_name}",
+            create_session_object,
+            depends=object_depends,
+            on_error=session_object_error(object_name, object_type, object_namespace),
+        )
 
         if object_api_version == "v1" and object_type.lower() == "namespace":
             annotations = object_body["metadata"].get("annotations", {})
@@ -1385,132 +1515,31 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                     f"training.{OPERATOR_API_GROUP}/session.limits.default.memory"
                 ]
 
-            logger.info(
-                "Creating workshop session object %s of type %s in namespace %s for workshop session %s.",
-                object_name,
-                object_type,
-                object_namespace,
-                session_name,
-            )
-
-            try:
-                create_from_dict(object_body)
-
-            except Exception as exc:
-                logger.exception(
-                    "Unable to create workshop session objects, failed creating object %s of type %s in namespace %s for workshop session %s.",
-                    object_name,
-                    object_type,
-                    object_namespace,
-                    session_name,
-                )
-
-                report_analytics_event(
-                    "Resource/PermanentError",
-                    {
-                        "kind": "WorkshopSession",
-                        "name": name,
-                        "uid": uid,
-                        "retry": retry,
-                        "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
-                    },
-                )
-
-                patch["status"] = {
-                    OPERATOR_STATUS_KEY: {
-                        "phase": "Failed",
-                        "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
-                    }
-                }
-
-                raise kopf.PermanentError(
-                    f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}."
-                ) from exc
-
             target_namespace = object_body["metadata"]["name"]
 
-            _setup_session_namespace(
-                namespace_instance.obj,
-                workshop_name,
-                portal_name,
-                portal_uid,
-                environment_name,
-                environment_uid,
-                session_name,
-                workshop_namespace,
-                session_namespace,
-                target_namespace,
-                service_account,
-                applications,
-                target_role,
-                target_budget,
-                target_limits,
-                target_security_policy,
-            )
-
-        else:
-            logger.info(
-                "Creating workshop session object %s of type %s in namespace %s for workshop session %s.",
-                object_name,
-                object_type,
-                object_namespace,
-                session_name,
-            )
-
-            try:
-                create_from_dict(object_body)
-
-            except Exception as exc:
-                logger.exception(
-                    "Unable to create workshop session objects, failed creating object %s of type %s in namespace %s for workshop session %s.",
-                    object_name,
-                    object_type,
-                    object_namespace,
+            object_step = plan.add(
+                f"object:{object_index}:setup",
+                functools.partial(
+                    _setup_session_namespace,
+                    namespace_instance,
+                    workshop_name,
+                    portal_name,
+                    portal_uid,
+                    environment_name,
+                    environment_uid,
                     session_name,
-                )
-
-                report_analytics_event(
-                    "Resource/PermanentError",
-                    {
-                        "kind": "WorkshopSession",
-                        "name": name,
-                        "uid": uid,
-                        "retry": retry,
-                        "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
-                    },
-                )
-
-                patch["status"] = {
-                    OPERATOR_STATUS_KEY: {
-                        "phase": "Failed",
-                        "message": f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}.",
-                    }
-                }
-
-                raise kopf.PermanentError(
-                    f"Unable to create workshop session objects, failed creating object {object_name} of type {object_type} in namespace {object_namespace} for workshop session {session_name}."
-                ) from exc
-
-        if object_api_version == "v1" and object_type.lower() == "resourcequota":
-            # Verify that the status of the resource quota has been
-            # updated. If we don't do this, then the calculated hard
-            # limits may not be calculated before we start creating
-            # resources in the namespace resulting in a failure. If we
-            # can't manage to verify quotas after a period, give up.
-            # This may result in a subsequent failure.
-
-            for _ in range(25):
-                resource_quota = pykube.ResourceQuota.objects(
-                    api, namespace=object_body["metadata"]["namespace"]
-                ).get(name=object_body["metadata"]["name"])
-
-                if (
-                    not resource_quota.obj.get("status")
-                    or not resource_quota.obj["status"].get("used")
-                    or not resource_quota.obj["status"].get("hard")
-                ):
-                    time.sleep(0.1)
-                    continue
+                    workshop_namespace,
+                    session_namespace,
+                    target_namespace,
+                    service_account,
+                    applications,
+                    target_role,
+                    target_budget,
+                    target_limits,
+                    target_security_policy,
+                ),
+                depends=[object_step],
+            )
 
     # Work out the name of the workshop config secret to use for a session. This
     # will usually be the common workshop-config secret created with the
@@ -2071,9 +2100,9 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             "data": environment_secrets,
         }
 
-        kopf.adopt(secret_body, namespace_instance.obj)
+        kopf.adopt(secret_body, namespace_instance)
 
-        pykube.Secret(api, secret_body).create()
+        plan.add_object("vendir-secrets", secret_body)
 
         deployment_pod_template_spec["volumes"].append(
             {
@@ -2210,7 +2239,12 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
                 },
             }
 
-            pykube.Secret(api, secret_body).create()
+            # The secret is created in the session namespace so must wait for
+            # the namespace to be setup, including the resource quotas.
+
+            plan.add_object(
+                "console-csrf-secret", secret_body, depends=list(namespace_steps)
+            )
 
     # Add in extra configuration for special cases, as well as bind policy.
 
@@ -2487,18 +2521,14 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
 
             deployment_pod_template_spec["containers"].append(docker_compose_container)
 
-    for object_body in resource_objects:
+    for object_index, object_body in enumerate(resource_objects):
         object_body = substitute_variables(object_body, session_variables)
-        kopf.adopt(object_body, namespace_instance.obj)
-        create_from_dict(object_body)
+        kopf.adopt(object_body, namespace_instance)
+        plan.add_object(f"resource:{object_index}", object_body)
 
     # Add in extra configuration for registry and create session objects.
 
     if applications.is_enabled("registry"):
-        registry_htpasswd_hash = bcrypt.hashpw(
-            bytes(registry_password, "ascii"), bcrypt.gensalt(prefix=b"2a")
-        ).decode("ascii")
-
         registry_htpasswd = f"{registry_username}:{registry_htpasswd_hash}\n"
 
         additional_env.append(
@@ -2864,19 +2894,35 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
             ]
 
         registry_objects = [
-            registry_config_map_body,
-            registry_deployment_body,
-            registry_service_body,
-            registry_ingress_body,
+            ("registry-config", registry_config_map_body),
+            ("registry-deployment", registry_deployment_body),
+            ("registry-service", registry_service_body),
+            ("registry-ingress", registry_ingress_body),
         ]
 
         if registry_storage:
-            registry_objects.insert(0, registry_persistent_volume_claim_body)
+            registry_objects.insert(
+                0, ("registry-storage", registry_persistent_volume_claim_body)
+            )
+
+        # The registry deployment mounts the config map and any persistent
+        # volume claim so is created after them. The service and ingress don't
+        # depend on anything.
 
-        for object_body in registry_objects:
+        for key, object_body in registry_objects:
             object_body = substitute_variables(object_body, session_variables)
-            kopf.adopt(object_body, namespace_instance.obj)
-            create_from_dict(object_body)
+            kopf.adopt(object_body, namespace_instance)
+
+            depends = []
+
+            if key == "registry-deployment":
+                depends = [
+                    dependency
+                    for dependency in ("registry-config", "registry-storage")
+                    if dependency in plan
+                ]
+
+            plan.add_object(key, object_body, depends=depends)
 
     # Apply any additional environment variables to the deployment.
 
@@ -3200,23 +3246,28 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     deployment_pod_template_spec["hostAliases"].extend(host_aliases)
 
     # Finally create the deployment, service and ingress for the workshop
-    # session.
+    # session. The deployment is only created once everything else has been,
+    # as it mounts the secrets and volumes created for the session and needs
+    # the session namespaces to have been setup. The service and ingress do
+    # not depend on anything.
+
+    kopf.adopt(ssh_keys_secret_body, namespace_instance)
 
-    kopf.adopt(ssh_keys_secret_body, namespace_instance.obj)
+    plan.add_object("ssh-keys-secret", ssh_keys_secret_body)
 
-    pykube.Secret(api, ssh_keys_secret_body).create()
+    kopf.adopt(deployment_body, namespace_instance)
 
-    kopf.adopt(deployment_body, namespace_instance.obj)
+    plan.add_object("deployment", deployment_body, depends=plan.keys())
 
-    pykube.Deployment(api, deployment_body).create()
+    kopf.adopt(service_body, namespace_instance)
 
-    kopf.adopt(service_body, namespace_instance.obj)
+    plan.add_object("service", service_body)
 
-    pykube.Service(api, service_body).create()
+    kopf.adopt(ingress_body, namespace_instance)
 
-    kopf.adopt(ingress_body, namespace_instance.obj)
+    plan.add_object("ingress", ingress_body)
 
-    pykube.Ingress(api, ingress_body).create()
+    await plan.execute()
 
     # Report analytics event workshop session should be ready.
 
@@ -3262,7 +3313,7 @@ def workshop_session_create(name, body, meta, uid, spec, status, patch, retry, *
     "workshopsessions",
     optional=True,
 )
-def workshop_session_delete(**_):
+async def workshop_session_delete(**_):
     """Nothing to do here at this point because the owner references will
     ensure that everything is cleaned up appropriately."""
 
@@ -3273,7 +3324,7 @@ def workshop_session_delete(**_):
 
 
 @kopf.on.event(f"training.{OPERATOR_API_GROUP}", "v1beta1", "workshopsessions")
-def workshop_session_event(type, event, **_):  # pylint: disable=redefined-builtin
+async def workshop_session_event(type, event, **_):  # pylint: disable=redefined-builtin
     """Log when a workshop session is deleted."""
 
     if type == "DELETED":
@@ -3295,7 +3346,9 @@ def workshop_session_event(type, event, **_):  # pylint: disable=redefined-built
         f"training.{OPERATOR_API_GROUP}/session.name": kopf.PRESENT,
     },
 )
-def workshop_session_pod_event(type, event, **_):  # pylint: disable=redefined-builtin
+async def workshop_session_pod_event(
+    type, event, **_
+):  # pylint: disable=redefined-builtin
     """Log the status of deployment of any workshop session pods."""
 
     pod_name = event["object"]["metadata"]["name"]
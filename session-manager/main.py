@@ -69,6 +69,10 @@ from handlers import trainingportal
 
 from handlers import daemons
 
+from handlers.kubeclient import client
+from handlers.sshkeys import ssh_key_pool
+from handlers.credentials import registry_credentials_pool
+
 _event_loop = None  # pylint: disable=invalid-nam
 
 _stop_flag = Event()
@@ -108,6 +112,10 @@ def check_api_access(**kwargs):
 async def cleanup_fn(logger, **kwargs):
     logger.info("Stopping kopf framework main loop.")
 
+    # Close connections to the Kubernetes API server used by handlers.
+
+    await client.close()
+
     # Workaround for possible kopf bug, set stop flag.
 
     _stop_flag.set()
@@ -131,6 +139,12 @@ def run_kopf():
 
         _event_loop.create_task(daemons.purge_namespaces())
 
+        # Start filling the pools of SSH key pairs and registry credentials
+        # for workshop sessions.
+
+        ssh_key_pool.start(_event_loop)
+        registry_credentials_pool.start(_event_loop)
+
         with contextlib.closing(_event_loop):
             # Run event loop until flagged to shutdown.
 